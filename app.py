@@ -1,155 +1,360 @@
-from flask import Flask, jsonify, request
-import sqlite3
-import requests
+from flask import Blueprint, Flask, jsonify, request, Response, stream_with_context, g
+import codecs
 import datetime
-from datetime import timedelta
-from flask_cors import CORS
 import json
-import re
-from recipe_md import recipe_to_md, generate_image_with_comfyui
-from json_repair import repair_json
-from git import Repo, GitCommandError
+import logging
 import os
-
-
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+import sqlite3
+import time
+import recipe_md
+from recipe_md import recipes_to_md, rerender_recipes, image_cache, workflows, recipe_catalog, recipe_change_hooks, DUPLICATE_POLICIES
+from image_jobs import ImageJobQueue
+from crop_rankings import rankings_ready, query_top_crops, query_top_crops_legacy
+from migrations import migrate
+from recipe_store import RecipeStore
+from db import ConnectionPool, bump_data_version, read_data_versions
+from ingest import ingest_day, roc_date
+from publisher import Publisher
+from seasonal import SEASONAL_NAMES_SQL, SEASONAL_ROWS_SQL, SeasonalCalendar, month_mask, parse_month
+from crop_matching import CROP_MAPPINGS_SQL, MAPPED_CROPS_SQL, MARKET_CROPS_SQL, load_matcher, rebuild_crop_map
+from response_cache import ResponseCache
+from llm_parser import parse_llm_response, RecipeStreamParser
+from metrics import metrics, TRACE_HEADER
+
+# 匯入本模組只定義路由與共用物件，不碰資料庫與檔案系統；GitPython、requests、json_repair、
+# NumPy / pyarrow（價格分析）都延到第一次用到時才載入。啟動工作集中在 create_app()。
+routes = Blueprint("routes", __name__)
+logger = logging.getLogger(__name__)
+
+
+# 每個路由的處理時間記到 http_request_duration_seconds；帶 X-Trace: 1 的請求另外記錄所有 span
+@routes.before_app_request
+def start_request_timer():
+    if not metrics.enabled:
+        return
+    g.request_started = time.perf_counter()
+    if request.headers.get(TRACE_HEADER) == "1":
+        g.trace = metrics.start_trace(method=request.method, path=request.full_path.rstrip("?"))
+
+
+@routes.after_app_request
+def record_request_metrics(response):
+    if not metrics.enabled or "request_started" not in g:
+        return response
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    labels = {"route": route, "method": request.method}
+    metrics.observe("http_request_duration_seconds", time.perf_counter() - g.request_started, **labels)
+    metrics.inc("http_requests_total", status=response.status_code, **labels)
+    if "trace" in g:
+        trace, token = g.pop("trace")
+        trace["status"] = response.status_code
+        metrics.finish_trace(trace, token)
+        response.headers["X-Trace-Id"] = trace["trace_id"]
+    return response
 
 # DB 連線設定
 DATABASE = 'new.db'
 # 不重複菜單天數
 UNIQUE_RECIPES_DAYS = 7
 IMAGE_MODEL="flux_api.json"
+# /generate-recipe 同時送往 ComfyUI 的生圖數量
+RECIPE_BATCH_CONCURRENCY = 2
+# /process-llm/stream 每次從請求本文讀取的位元組數
+LLM_STREAM_CHUNK = 4096
 
 comfyui_api_url = "http://localhost:8188/prompt"
+image_jobs = ImageJobQueue(comfyui_api_url)
 
-# 建立資料庫連線
-def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.text_factory = str  # 添加这行以确保正确处理中文
-    return conn
+# 共用的資料庫連線池：GET 路由走唯讀連線，寫入集中在單一 WAL 寫入連線；由 create_app() 開啟
+db = ConnectionPool(DATABASE)
 
-# 推送檔案到遠端儲存庫
-from flask import request, jsonify
-from git import Repo, GitCommandError
-import os
+def load_data_versions():
+    with db.read() as conn:
+        return read_data_versions(conn)
+
+
+# 讀取型路由的回應快取，依資料群組失效：transactions（交易資料）、seasonal（季節食材）、recipes（已發布食譜）；
+# 查詢時比對資料庫內的資料版本，另一個程序（ingest.py、封存）寫入的資料也會讓舊回應失效
+response_cache = ResponseCache(load_data_versions)
+recipe_change_hooks.append(lambda filename: response_cache.invalidate("recipes"))
+
+# 食譜發布佇列：合併短時間內的多次推送，只 add / commit 指定的檔案
+publisher = Publisher(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_seasonal_rows():
+    with db.read() as conn:
+        return conn.execute(SEASONAL_ROWS_SQL).fetchall()
+
+
+# 月份 → 當季食材的快取，寫入季節食材時失效
+seasonal_calendar = SeasonalCalendar(load_seasonal_rows)
+# 價格時間序列的 NumPy 快取（含已封存的月份），第一次查詢價格分析時建立；匯入新資料後只重新讀取受影響的交易日，
+# 其他程序寫入（交易資料版本改變）時整份重新載入
+price_history = None
+
+
+def get_price_history():
+    global price_history
+    if price_history is None:
+        from price_analytics import PriceHistory
+        from archive import Archive
+        price_history = PriceHistory(Archive.for_database(db.database))
+    with db.read() as conn:
+        price_history.ensure_loaded(conn, read_data_versions(conn).get("transactions", 0))
+    return price_history
+
+
+# 食譜成本估算（最新作物批發價快照），第一次產生食譜時建立；匯入新資料後（含其他程序的匯入）重建快照
+cost_engine = None
+
+
+def get_cost_engine():
+    global cost_engine
+    if cost_engine is None:
+        from cost_engine import CostEngine
+        cost_engine = CostEngine()
+    with db.read() as conn:
+        cost_engine.ensure_loaded(conn, read_data_versions(conn).get("transactions", 0))
+    return cost_engine
+
+
+def price_candidates(recipes, select=None):
+    """
+    以市場行情估算成本並取代 LLM 估的 price；select 指定時只保留成本最低的前 select 道。
+    回傳 (要產生的食譜, 對應的成本估算, 在候選中的索引)；估算失敗時沿用 LLM 的價格，估算為 None
+    """
+    from cost_engine import apply_costs
+
+    indexes = list(range(len(recipes) if select is None else min(select, len(recipes))))
+    try:
+        engine = get_cost_engine()
+        if select is None:
+            estimates = engine.estimate(recipes, detail=False)
+        else:
+            ranked = engine.rank(recipes, select)
+            indexes = [i for i, _ in ranked]
+            estimates = [estimate for _, estimate in ranked]
+        return apply_costs([recipes[i] for i in indexes], estimates), estimates, indexes
+    except Exception as e:
+        logger.error(f"成本估算失敗，沿用 LLM 的價格：{str(e)}")
+        return [recipes[i] for i in indexes], [None] * len(indexes), indexes
+
+
+# 季節食材名稱的比對索引，第一次查詢候選時建立，寫入季節食材時失效
+crop_matcher = None
+
+
+def get_crop_matcher():
+    global crop_matcher
+    if crop_matcher is None:
+        with db.read() as conn:
+            crop_matcher = load_matcher(conn)
+    return crop_matcher
+
+
+def create_app(database=DATABASE):
+    """
+    建立 Flask app：設定日誌、建立輸出目錄、載入 workflow、套用 migration 並開啟連線池
+    """
+    global db
+    from flask_cors import CORS
 
-@app.route('/generate_ingredients_image', methods=['POST'])
+    logging.basicConfig(level=logging.INFO, format=recipe_md.LOG_FORMAT)
+    # 啟動時預先載入並驗證所有 workflow
+    workflows.preload()
+    # 啟動時套用資料表與索引的 migration
+    migrate(database)
+    if database != db.database:
+        db = ConnectionPool(database)
+    db.init()
+    # 產生的食譜同時存進同一個資料庫
+    recipe_md.init(RecipeStore(db))
+
+    flask_app = Flask(__name__)
+    CORS(flask_app, resources={r"/*": {"origins": "*"}})
+    flask_app.register_blueprint(routes)
+    return flask_app
+
+
+_app = None
+
+
+def __getattr__(name):
+    # 沿用 `import app; app.app`、`flask --app app run` 與 gunicorn app:app：第一次存取 app 時才建立
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@routes.route('/generate_ingredients_image', methods=['POST'])
 def generate_ingredients_image():
     try:
-        # 設定 recipes 目錄
-        recipes_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "content", "recipes")
-        
         data = request.get_json(force=True)  # 添加 force=True 确保正确解析 JSON
         prompt = data.get("image_prompt")
         titles = data.get("titles")
         # 把titles list轉成string, 並把逗號移除
         recipe_name = ", ".join(titles).replace(",", "")
-        image_url = generate_image_with_comfyui(prompt, comfyui_api_url, recipe_name, workflow_path=IMAGE_MODEL)
-        return jsonify({"image_url": image_url}), 200
+        # 排入背景生圖，立即回傳 job_id，完成後由 /image_jobs/<job_id> 取得 image_url
+        job_id = image_jobs.submit(prompt, recipe_name, IMAGE_MODEL)
+        return jsonify({
+            "job_id": job_id,
+            "status_url": f"/image_jobs/{job_id}"
+        }), 202
     except Exception as e:
         return jsonify({"error": f"伺服器錯誤：{str(e)}"}), 500
 
 
+@routes.route('/image_jobs/<job_id>', methods=['GET'])
+def get_image_job(job_id):
+    job = image_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "找不到此生圖任務"}), 404
+    return jsonify(job), 200
+
+
+@routes.route('/image_model', methods=['GET', 'POST'])
+def image_model():
+    # 不重啟即可切換 /generate_ingredients_image 使用的 workflow
+    global IMAGE_MODEL
+    if request.method == 'POST':
+        workflow_path = request.get_json(force=True).get("workflow")
+        # 只允許切換到專案目錄下的 workflow JSON
+        if not isinstance(workflow_path, str) or os.path.basename(workflow_path) != workflow_path \
+                or not workflow_path.endswith(".json"):
+            return jsonify({"error": "workflow 必須是專案目錄下的 .json 檔名"}), 400
+        try:
+            workflows.get(workflow_path)
+        except (OSError, TypeError, ValueError) as e:
+            return jsonify({"error": f"無法載入 workflow：{str(e)}"}), 400
+        IMAGE_MODEL = workflow_path
+    return jsonify({"image_model": IMAGE_MODEL, "workflows": workflows.loaded()}), 200
+
+
+@routes.route('/image_cache/stats', methods=['GET'])
+def get_image_cache_stats():
+    return jsonify(image_cache.stats()), 200
+
+
+@routes.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
-@app.route('/get_historical_recipes', methods=['GET'])
+
+# 最近帶 X-Trace: 1 的請求，以及單一請求的 span 明細
+@routes.route('/traces', methods=['GET'])
+def get_traces():
+    return jsonify({"traces": metrics.recent_traces()}), 200
+
+
+@routes.route('/traces/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    trace = metrics.get_trace(trace_id)
+    if trace is None:
+        return jsonify({"error": "找不到追蹤紀錄"}), 404
+    return jsonify(trace), 200
+
+
+@routes.route('/response_cache/stats', methods=['GET'])
+def get_response_cache_stats():
+    return jsonify(response_cache.stats()), 200
+
+
+@routes.route('/get_historical_recipes', methods=['GET'])
+@response_cache.cached("recipes")
 def get_historical_recipes():
     try:
-        # 設定 recipes 目錄
-        recipes_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "content", "recipes")
-        
-        # 計算 7 天前的日期（包含今天）
-        cutoff_date = datetime.datetime.now() - timedelta(days=UNIQUE_RECIPES_DAYS)
-        
-        # 儲存唯一菜名
-        unique_recipes = set()
-        
-        # 遍歷 recipes 目錄
-        if not os.path.exists(recipes_dir):
-            return jsonify({"recipes": []}), 200
-        
-        for filename in os.listdir(recipes_dir):
-            # 匹配檔案名稱格式: YYYY-MM-DD-HHMMSS_菜名
-            match = re.match(r"(\d{4}-\d{2}-\d{2}-\d{6})_(.+)\.md$", filename)
-            if match:
-                timestamp_str, recipe_name = match.groups()
-                try:
-                    # 解析檔案的日期
-                    file_date = datetime.datetime.strptime(timestamp_str, "%Y-%m-%d-%H%M%S")
-                    # 檢查是否在過去 7 天內
-                    if file_date >= cutoff_date:
-                        unique_recipes.add(recipe_name)
-                except ValueError:
-                    continue  # 無效日期格式，跳過
-        
-        return jsonify({"recipes": list(unique_recipes)}), 200
+        # 查詢天數，預設為 UNIQUE_RECIPES_DAYS
+        days = request.args.get('days', UNIQUE_RECIPES_DAYS, type=int)
+        if days is None or days <= 0:
+            return jsonify({"error": "days 必須是正整數"}), 400
+
+        # 從記憶體中的食譜索引以二分搜尋取出最近 days 天的菜名
+        return jsonify({"recipes": recipe_catalog.recent(days)}), 200
     
     except Exception as e:
         return jsonify({"error": f"伺服器錯誤：{str(e)}"}), 500
     
-@app.route('/push-to-remote', methods=['POST'])
+# 以標題、食材與步驟搜尋已產生的食譜，例如 /search?q=絲瓜 茄子&mode=any&field=ingredients
+@routes.route('/search', methods=['GET'])
+@response_cache.cached("recipes")
+def search_recipes():
+    from recipe_search import MAX_LIMIT, parse_terms
+    from text_convert import convert_text
+
+    mode = request.args.get('mode', 'all')
+    field = request.args.get('field') or None
+    limit = request.args.get('limit', 20, type=int)
+    # 食譜內容都是繁體，查詢詞先轉成繁體
+    terms = parse_terms(convert_text(request.args.get('q', '')))
+    if not terms:
+        return jsonify({"error": "請提供查詢詞 q"}), 400
+    if limit is None or not 0 < limit <= MAX_LIMIT:
+        return jsonify({"error": f"limit 必須是 1 到 {MAX_LIMIT} 的整數"}), 400
+    try:
+        results = recipe_md.recipe_store.search(terms, mode, field, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"伺服器錯誤：{str(e)}"}), 500
+    return jsonify({"terms": terms, "count": len(results), "results": results}), 200
+
+
+@routes.route('/recipe_store/render', methods=['POST'])
+def render_stored_recipes():
+    """
+    由資料庫重新輸出食譜 Markdown；body 可帶 files（只輸出這些檔名）、verify、dry_run
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        filenames = data.get("files")
+        if filenames is not None and not isinstance(filenames, list):
+            return jsonify({"error": "files 必須是檔名陣列"}), 400
+        stats = rerender_recipes(filenames, bool(data.get("verify")), bool(data.get("dry_run")))
+        return jsonify(stats), 200
+
+    except Exception as e:
+        return jsonify({"error": f"伺服器錯誤：{str(e)}"}), 500
+
+
+@routes.route('/push-to-remote', methods=['POST'])
 def push_to_remote():
     try:
         saved_files = request.get_json()['recipes']
-        print(saved_files)
-
-        repo_path = os.path.dirname(os.path.abspath(__file__))
-        repo = Repo(repo_path)
-        git = repo.git
-
-        image_folder = os.path.join(repo_path, "static", "images", "recipes")
-        markdown_folder = os.path.join("content", "recipes")
-
-        added_files = []
-
-        if repo.is_dirty(untracked_files=True):
-            for filename in saved_files:
-                # 加入 markdown 檔案
-                md_path = os.path.join(markdown_folder, filename)
-                if os.path.exists(md_path):
-                    git.add(md_path)
-                    added_files.append(md_path)
-                
-                # 推測圖片檔名並加入
-                if "_" in filename:
-                    image_name = filename.split("_", 1)[1].replace(".md", ".jpg")
-                    image_path = os.path.join("static", "images", "recipes", image_name)
-                    abs_image_path = os.path.join(repo_path, image_path)
-                    if os.path.exists(abs_image_path):
-                        git.add(image_path)
-                        added_files.append(image_path)
-
-            if added_files:
-                commit_message = f"Add recipe markdown and image files: {', '.join(saved_files)}"
-                git.commit(m=commit_message)
-                git.push("origin", "master")
-                return jsonify({
-                    "message": "Recipes successfully converted to Markdown and pushed to remote",
-                    "files": saved_files,
-                    "images": [f.split("_", 1)[1].replace(".md", ".jpg") for f in saved_files]
-                }), 200
-            else:
-                return jsonify({
-                    "message": "No valid files found to push."
-                }), 400
+        logger.debug(f"排入發布佇列：{saved_files}")
 
-        else:
+        # 排入背景發布佇列，短時間內多次請求會合併成一次 commit 與 push
+        job_id = publisher.submit(saved_files)
+        if job_id is None:
             return jsonify({
-                "message": "nothing to push"
-            }), 200
+                "message": "No valid files found to push."
+            }), 400
 
-    except GitCommandError as e:
         return jsonify({
-            "message": f"Git error: {str(e)}"
-        }), 500
+            "message": "Recipes queued for publishing",
+            "files": saved_files,
+            "job_id": job_id,
+            "status_url": f"/publish_jobs/{job_id}"
+        }), 202
+
     except Exception as e:
         return jsonify({
             "message": f"error: {str(e)}"
         }), 500
 
 
+@routes.route('/publish_jobs/<job_id>', methods=['GET'])
+def get_publish_job(job_id):
+    job = publisher.get(job_id)
+    if job is None:
+        return jsonify({"error": f"找不到發布任務：{job_id}"}), 404
+    return jsonify(job), 200
+
 
-@app.route('/generate-recipe', methods=['POST'])
+@routes.route('/generate-recipe', methods=['POST'])
 def generate_recipe():
     try:
         # 從請求中取得 LLM 回傳的 JSON
@@ -157,160 +362,154 @@ def generate_recipe():
 
         if 'recipes' not in data:
             return jsonify({"error": "Invalid data format, 'recipes' not found"}), 400
+
+        # 與既有食譜重複時的處理方式：allow 照常產生（預設，重複判定仍列在 results）、skip 略過、reuse 沿用既有封面
+        duplicate_policy = data.get('duplicate_policy', 'allow')
+        if duplicate_policy not in DUPLICATE_POLICIES:
+            return jsonify({"error": f"duplicate_policy 必須是 {', '.join(DUPLICATE_POLICIES)} 之一"}), 400
         
-        recipe = data['recipes']
-        
-        # 轉換食譜為 markdown
-        saved_files = []
-        for entry in recipe:
-            filename = recipe_to_md(entry)
-            saved_files.append(filename)
-    
-        # 返回所有檔案名稱和推送結果
+        # select：從候選中只產生市場行情估算成本最低的前 select 道
+        select = data.get('select')
+        if select is not None and (isinstance(select, bool) or not isinstance(select, int) or select <= 0):
+            return jsonify({"error": "select 必須是正整數"}), 400
+        if not isinstance(data['recipes'], list):
+            return jsonify({"error": "'recipes' 必須是陣列"}), 400
+
+        # 成本改以最新批發價估算，取代 LLM 估的 price
+        from cost_engine import summary
+        recipes, estimates, indexes = price_candidates(data['recipes'], select)
+
+        # 批次轉換：先排除重複食譜，Markdown 先寫出，圖片以 RECIPE_BATCH_CONCURRENCY 並行生成後回填 cover
+        results = recipes_to_md(recipes, concurrency=RECIPE_BATCH_CONCURRENCY,
+                                duplicate_policy=duplicate_policy)
+        for result, estimate, candidate in zip(results, estimates, indexes):
+            result["candidate"] = candidate
+            result["cost"] = summary(estimate) if estimate is not None else None
+        saved_files = [result["file"] for result in results if result["status"] == "ok"]
+        failed = [result for result in results if result["status"] == "failed"]
+
+        # 全部失敗才回傳錯誤，部分失敗或略過重複時列在 results 中
+        status = 500 if results and len(failed) == len(results) else 200
         return jsonify({
-            "message": "Recipes successfully converted to Markdown and pushed to remote",
-            "files": saved_files
-        }), 200
+            "message": "Recipes successfully converted to Markdown and pushed to remote" if not failed
+                       else f"{len(failed)} 道食譜轉換失敗",
+            "files": saved_files,
+            "candidates": len(data['recipes']),
+            "results": results
+        }), status
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
 # 插入季節性食材資料
-@app.route('/insert_seasonal_ingredients', methods=['POST'])
+@routes.route('/insert_seasonal_ingredients', methods=['POST'])
 def insert_seasonal_ingredients():
     # 接收 JSON 請求
     data = request.get_json(force=True)  # 添加 force=True 确保正确解析 JSON
     seasonal_ingredients = data.get('seasonal_ingredients', [])
 
-    conn = get_db()
-    cursor = conn.cursor()
-
     # 插入數據
-    for ingredient in seasonal_ingredients:
-        cursor.execute("""
-            INSERT INTO seasonal_ingredients (name, month_start, month_end, type)
-            VALUES (?, ?, ?, ?)
-        """, (ingredient['name'], ingredient['month_start'], ingredient['month_end'], ingredient['type']))
-
-    conn.commit()
-    conn.close()
-    return jsonify({"status": "success"}), 200
+    with db.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO seasonal_ingredients (name, month_start, month_end, type, month_mask)
+            VALUES (?, ?, ?, ?, ?)
+        """, [
+            (ingredient['name'], ingredient['month_start'], ingredient['month_end'], ingredient['type'],
+             month_mask(ingredient['month_start'], ingredient['month_end']))
+            for ingredient in seasonal_ingredients
+        ])
+        # 新的食材名稱可能讓更多作物對得上，對照表整張重算
+        rebuild_crop_map(conn)
+        bump_data_version(conn, "seasonal")
+    global crop_matcher
+    crop_matcher = None
+    seasonal_calendar.invalidate()
+    response_cache.invalidate("seasonal")
 
+    return jsonify({"status": "success"}), 200
 
-# 創建當令食材資料表
-def create_seasonal_table():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS seasonal_ingredients (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        type TEXT,
-        month_start INTEGER,
-        month_end INTEGER
-    );
-    """)
-    conn.commit()
-    conn.close()
 
 def existing_seasonals():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM seasonal_ingredients")
-    rows = cursor.fetchall()
-    conn.close()
+    with db.read() as conn:
+        rows = conn.execute(SEASONAL_NAMES_SQL).fetchall()
     return [str(row[0]).strip() for row in rows if row[0]]
 
 
 def unique_crops():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT crop_name FROM product_transactions")
-    results = cursor.fetchall()
-    conn.close()
+    with db.read() as conn:
+        results = conn.execute(MARKET_CROPS_SQL).fetchall()
     return [str(row[0]).strip() for row in results if row[0]]
 
 
-@app.route('/fetch_combined_data')
+def mapped_crops():
+    with db.read() as conn:
+        rows = conn.execute(MAPPED_CROPS_SQL).fetchall()
+    return {row[0] for row in rows}
+
+
+@routes.route('/fetch_combined_data')
+@response_cache.cached("seasonal", "transactions")
 def fetch_combined_data():
     exist_seasonals = existing_seasonals()
     u_crops = unique_crops()
-    new_crops = [crop for crop in u_crops if crop not in exist_seasonals]
+    # 名稱完全相同，或已經對照到季節食材（例如 甘藍-初秋 → 甘藍）的作物都不算新作物
+    known = set(exist_seasonals) | mapped_crops()
+    new_crops = [crop for crop in u_crops if crop not in known]
     return jsonify({
         "new_crops": new_crops,
         "existing_seasonals": exist_seasonals
     })
 
-# 抓取農產品交易資料並儲存
+# 查詢市場作物名稱對應到季節食材的候選與分數
+@routes.route('/crop_matches', methods=['GET'])
+def crop_matches():
+    crop_name = request.args.get('crop_name', '').strip()
+    if not crop_name:
+        return jsonify({"error": "缺少 crop_name 參數"}), 400
+    limit = request.args.get('limit', 5, type=int)
+    if limit is None or limit <= 0:
+        return jsonify({"error": "limit 必須是正整數"}), 400
+    try:
+        with db.read() as conn:
+            mapped = conn.execute(CROP_MAPPINGS_SQL, (crop_name,)).fetchall()
+        return jsonify({
+            "crop_name": crop_name,
+            "mapped": [{"name": row[0], "score": row[1], "method": row[2]} for row in mapped],
+            "candidates": get_crop_matcher().candidates(crop_name, limit),
+        }), 200
+    except Exception as e:
+        return jsonify({"error": f"伺服器錯誤：{str(e)}"}), 500
+
+# 抓取農產品交易資料並儲存（以自然鍵 upsert，重複抓取同一天不會產生重複資料）
 def fetch_and_store_data():
-    today = datetime.datetime.today()
-    roc_year = today.year - 1911
-    date_str = f"{roc_year}.{today.month:02d}.{today.day:02d}"
-    
-    url = f"https://data.moa.gov.tw/api/v1/AgriProductsTransType/?Start_time={date_str}&End_time={date_str}"
-    response = requests.get(url)
-    data = json.loads(response.text)['Data']  # 強制將字串轉成 JSON 陣列
-
-    conn = get_db()
-    cursor = conn.cursor()
-
-    for item in data:
-        cursor.execute("""
-            INSERT INTO product_transactions (
-                trans_date, crop_code, crop_name, tc_type,
-                market_code, market_name, upper_price, middle_price,
-                lower_price, avg_price, trans_quantity
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            item["TransDate"], item["CropCode"], item["CropName"], item["TcType"],
-            item["MarketCode"], item["MarketName"], item["Upper_Price"], item["Middle_Price"],
-            item["Lower_Price"], item["Avg_Price"], item["Trans_Quantity"]
-        ))
-
-    conn.commit()
-    conn.close()
-
-def get_seasonal_ingredients():
-    now = datetime.datetime.now()
-    current_month = now.month
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT name, type, month_start, month_end
-        FROM seasonal_ingredients
-    """)
-    rows = cursor.fetchall()
-    conn.close()
-
-    def is_in_season(start, end, month):
-        if start <= end:
-            return start <= month <= end
-        else:  # 跨年
-            return month >= start or month <= end
-
-    seasonal_today = [
-        {"name": row[0], "type": row[1]}
-        for row in rows
-        if is_in_season(row[2], row[3], current_month)
-    ]
-
-    return seasonal_today
-
-@app.route('/seasonal_top50', methods=['GET'])
+    today = datetime.date.today()
+    rows = ingest_day(db, today)
+    if price_history is not None:
+        price_history.invalidate([roc_date(today)])
+    if cost_engine is not None:
+        cost_engine.invalidate()
+    response_cache.invalidate("transactions")
+    return rows
+
+def get_seasonal_ingredients(month=None):
+    return seasonal_calendar.for_month(month or datetime.datetime.now().month)
+
+@routes.route('/seasonal_top50', methods=['GET'])
+@response_cache.cached("seasonal", "transactions")
 def get_seasonal_top50():
     try:
         # 獲取 seasonal 參數，預設為 True
         seasonal = request.args.get('seasonal', 'true').lower() == 'true'
+        # month 參數可查詢其他月份的當季食材（提前規劃菜單），預設為本月
+        month = datetime.datetime.now().month
+        if 'month' in request.args:
+            month = parse_month(request.args['month'])
+            if month is None:
+                return jsonify({"error": "month 必須是 1 到 12 的整數"}), 400
 
-        # 獲取當季食材（僅在 seasonal=True 時需要）
-        seasonal_ingredients = []
-        seasonal_names = []
-        if seasonal:
-            seasonal_ingredients = get_seasonal_ingredients()
-            if not seasonal_ingredients:
-                return jsonify({"message": "今天沒有當季食材", "data": []}), 200
-            seasonal_names = [item['name'] for item in seasonal_ingredients]
+        # 確認該月有當季食材（僅在 seasonal=True 時需要）
+        if seasonal and not get_seasonal_ingredients(month):
+            return jsonify({"message": "今天沒有當季食材", "data": []}), 200
 
         # 獲取今天的日期
         now = datetime.datetime.now()
@@ -320,70 +519,17 @@ def get_seasonal_top50():
         two_days_ago_date = f"{roc_year:03d}.{two_days_ago.strftime('%m')}.{two_days_ago.strftime('%d')}"
 
         # 連接到資料庫
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-
-            # 基礎 SQL 查詢，使用 ROW_NUMBER() 過濾重複 crop_name
-            query = """
-                WITH RankedCrops AS (
-                    SELECT 
-                        trans_date, 
-                        crop_code, 
-                        crop_name, 
-                        tc_type, 
-                        market_code, 
-                        market_name, 
-                        upper_price, 
-                        middle_price, 
-                        lower_price, 
-                        avg_price, 
-                        trans_quantity,
-                        ROW_NUMBER() OVER (PARTITION BY crop_name ORDER BY trans_quantity DESC) as rn
-                    FROM product_transactions
-                    WHERE trans_quantity > (
-                        SELECT trans_quantity
-                        FROM product_transactions
-                        ORDER BY trans_quantity
-                        LIMIT 1
-                        OFFSET (
-                            SELECT CAST((COUNT(*) * 0.5) AS INTEGER)
-                            FROM product_transactions
-                        )
-                    )
-                    AND trans_date IN (?, ?)
-                    {}
-                )
-                SELECT 
-                    trans_date, 
-                    crop_code, 
-                    crop_name, 
-                    tc_type, 
-                    market_code, 
-                    market_name, 
-                    upper_price, 
-                    middle_price, 
-                    lower_price, 
-                    avg_price, 
-                    trans_quantity
-                FROM RankedCrops
-                WHERE rn = 1
-                ORDER BY trans_quantity DESC
-            """
-
-            # 根據 seasonal 動態添加 crop_name 條件
-            if seasonal:
-                placeholders = ','.join(['?' for _ in seasonal_names])
-                crop_name_condition = f"AND crop_name IN ({placeholders})"
-                query = query.format(crop_name_condition)
-                params = [today, two_days_ago_date] + seasonal_names
+        with db.read() as conn:
+            dates = [today, two_days_ago_date]
+            # 當季篩選在 SQL 內以月份遮罩關聯 seasonal_ingredients
+            season_month = month if seasonal else None
+
+            # 優先查每日排行摘要；摘要尚未刷新時退回舊的全表查詢
+            if rankings_ready(conn, dates):
+                rows = query_top_crops(conn, dates, season_month=season_month)
             else:
-                query = query.format("")
-                params = [today, two_days_ago_date]
-
-            # 執行查詢
-            print(query, params)
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
+                logger.warning(f"排行摘要尚未就緒，改用舊查詢：{dates}")
+                rows = query_top_crops_legacy(conn, dates, season_month=season_month)
 
         # 格式化結果
         results = [
@@ -411,54 +557,132 @@ def get_seasonal_top50():
         return jsonify({"error": f"伺服器錯誤：{str(e)}"}), 500
 
 
-def process_llm_response(llm_response):
-    cleaned_response = re.sub(r"<think>.*?</think>", "", llm_response, flags=re.DOTALL)
-    cleaned_response = re.sub(r"\n+", "\n", cleaned_response).strip()
-    json_block_match = re.search(r"```json\s*(\{[\s\S]*\})\s*", cleaned_response)
-    if not json_block_match:
-        raise ValueError("未找到 JSON 區塊，請確認 LLM 回傳格式")
-    json_str = json_block_match.group(1)
-    repaired_json_str = repair_json(json_str)
-    try:
-        parsed = json.loads(repaired_json_str)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"JSON 解析錯誤：{e}")
-    if "recipes" not in parsed or not isinstance(parsed["recipes"], list):
-        raise ValueError("缺少 'recipes' 陣列或格式錯誤")
-    return parsed
-
-@app.route('/process-llm', methods=['POST'])
+@routes.route('/process-llm', methods=['POST'])
 def handle_llm():
     data = request.get_json()
     llm_response = data.get("llmResponse")
-    print('llm_response',llm_response)
 
     if not llm_response:
         return jsonify({"error": "缺少 llmResponse"}), 400
 
     try:
-        processed = process_llm_response(llm_response)
+        processed = parse_llm_response(llm_response)
         return jsonify(processed)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
-    
 
-@app.route("/api/seasonal-today", methods=["GET"])
+# 串流版本：請求本文直接是 LLM 的原始輸出（可用 chunked 上傳），每完成一道食譜就回傳一行 JSON（NDJSON）
+@routes.route('/process-llm/stream', methods=['POST'])
+def handle_llm_stream():
+    def generate():
+        parser = RecipeStreamParser()
+        # 多位元組字元可能被切在兩個區塊之間，用增量解碼器接起來
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            while True:
+                chunk = request.stream.read(LLM_STREAM_CHUNK)
+                if not chunk:
+                    break
+                for recipe in parser.feed(decoder.decode(chunk)):
+                    yield json.dumps({"recipe": recipe}, ensure_ascii=False) + "\n"
+            for recipe in parser.feed(decoder.decode(b"", final=True)) + parser.close():
+                yield json.dumps({"recipe": recipe}, ensure_ascii=False) + "\n"
+            yield json.dumps({"done": True, "count": parser.count}) + "\n"
+        except ValueError as e:
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@routes.route("/api/seasonal-today", methods=["GET"])
+@response_cache.cached("seasonal")
 def seasonal_today_route():
     return jsonify(get_seasonal_ingredients())
     
-@app.route('/')
+def parse_analytics_args():
+    # 價格分析路由共用的 window 與 date（YYYY-MM-DD，預設為最新交易日）參數
+    from price_analytics import DEFAULT_WINDOW
+
+    window = request.args.get('window', DEFAULT_WINDOW, type=int)
+    if window is None or window <= 1:
+        raise ValueError("window 必須是大於 1 的整數")
+    as_of = None
+    if request.args.get('date'):
+        try:
+            as_of = datetime.date.fromisoformat(request.args['date'])
+        except ValueError:
+            raise ValueError("date 格式必須是 YYYY-MM-DD")
+    return window, as_of
+
+
+# 各作物的移動平均、週漲跌幅、波動度與 z 分數
+@routes.route('/price_analytics', methods=['GET'])
+def price_analytics():
+    try:
+        window, as_of = parse_analytics_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        results = get_price_history().crop_metrics(window, as_of, request.args.get('market_code'))
+        crop_name = request.args.get('crop_name')
+        if crop_name:
+            results = [item for item in results if item["crop_name"] == crop_name]
+        return jsonify(results), 200
+    except Exception as e:
+        return jsonify({"error": f"伺服器錯誤：{str(e)}"}), 500
+
+
+# 今天價格明顯低於近期平均的作物，供產生食譜時優先選用
+@routes.route('/price_analytics/bargains', methods=['GET'])
+def price_bargains():
+    from price_analytics import BARGAIN_ZSCORE
+
+    try:
+        window, as_of = parse_analytics_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    threshold = request.args.get('z', BARGAIN_ZSCORE, type=float)
+    limit = request.args.get('limit', 20, type=int)
+    if threshold is None or limit is None or limit <= 0:
+        return jsonify({"error": "z 必須是數字，limit 必須是正整數"}), 400
+    try:
+        return jsonify(get_price_history().bargains(threshold, window, as_of, limit)), 200
+    except Exception as e:
+        return jsonify({"error": f"伺服器錯誤：{str(e)}"}), 500
+
+
+# 單一作物的每日價格與移動平均
+@routes.route('/price_analytics/history', methods=['GET'])
+def price_history_route():
+    from price_analytics import SHORT_WINDOW
+
+    crop_name = request.args.get('crop_name', '').strip()
+    if not crop_name:
+        return jsonify({"error": "缺少 crop_name 參數"}), 400
+    window = request.args.get('window', SHORT_WINDOW, type=int)
+    days = request.args.get('days', type=int)
+    if window is None or window <= 0 or (days is not None and days <= 0):
+        return jsonify({"error": "window 與 days 必須是正整數"}), 400
+    try:
+        history = get_price_history().history(crop_name, window, request.args.get('market_code'), days)
+        if history is None:
+            return jsonify({"error": f"找不到作物：{crop_name}"}), 404
+        return jsonify(history), 200
+    except Exception as e:
+        return jsonify({"error": f"伺服器錯誤：{str(e)}"}), 500
+
+@routes.route('/')
 def home():
     return "Flask爬蟲應用程式運行中"
 
-@app.route('/fetch_data')
+@routes.route('/fetch_data')
 def fetch_data():
-    fetch_and_store_data()
-    return jsonify({"status": "成功抓取並儲存數據"})
+    rows = fetch_and_store_data()
+    return jsonify({"status": "成功抓取並儲存數據", "rows": rows})
 
 if __name__ == '__main__':
-    # create_seasonal_table()  # 初始化資料庫    
+    app = create_app()
     for rule in app.url_map.iter_rules():
         print(f"{rule} -> {rule.endpoint}")
     app.run(host='0.0.0.0',debug=True)
@@ -0,0 +1,300 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 沒有安裝 pyarrow 時以 .npy 欄位檔封存
+    pa = None
+    pq = None
+
+from db import bump_data_version
+from price_analytics import parse_roc_date
+
+# 已結束月份的交易資料封存在資料庫檔同一目錄的 ARCHIVE_DIR/<YYYY-MM>/，SQLite 只保留最近 RETAIN_DAYS 天。
+# 封存會刪除 SQLite 中的資料，只在明確執行 python archive.py 時進行
+ARCHIVE_DIR = "archive"
+RETAIN_DAYS = 90
+
+# 作物、市場、交易類別以整數代碼存放；代碼表只會追加，已封存的代碼不會改變
+DICTIONARY_FILE = "dictionary.json"
+MANIFEST_FILE = "manifest.json"
+
+CODE_COLUMNS = {"day": np.int32, "crop": np.int32, "market": np.int32, "tc_type": np.int32}
+VALUE_COLUMNS = {
+    "upper_price": np.float32, "middle_price": np.float32, "lower_price": np.float32,
+    "avg_price": np.float32, "trans_quantity": np.float32,
+}
+COLUMNS = {**CODE_COLUMNS, **VALUE_COLUMNS}
+
+ARCHIVE_SQL = """
+    SELECT trans_date, crop_code, crop_name, market_code, market_name, tc_type,
+           upper_price, middle_price, lower_price, avg_price, trans_quantity
+    FROM product_transactions
+    WHERE trans_date >= ? AND trans_date <= ?
+"""
+
+
+def month_key(day):
+    return f"{day.year:04d}-{day.month:02d}"
+
+
+def month_bounds(key):
+    """
+    回傳月份第一天與最後一天的民國日期字串，供 trans_date 範圍查詢
+    """
+    year, month = map(int, key.split("-"))
+    first = datetime.date(year, month, 1)
+    last = (first + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+    return tuple(f"{day.year - 1911}.{day.month:02d}.{day.day:02d}" for day in (first, last))
+
+
+def archive_dir_for(database):
+    """
+    資料庫對應的封存目錄：與資料庫檔放在一起，不受目前工作目錄影響
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(database)), ARCHIVE_DIR)
+
+
+def default_format():
+    return "parquet" if pq is not None else "npy"
+
+
+class ArchiveDictionary:
+    """
+    封存用的代碼表：crops 為 [作物代碼, 作物名稱]、markets 為 [市場代碼, 市場名稱]、tc_types 為交易類別
+    """
+
+    def __init__(self, path):
+        self.path = path
+        data = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        self.tables = {name: [tuple(item) if isinstance(item, list) else item for item in data.get(name, [])]
+                       for name in ("crops", "markets", "tc_types")}
+        self._codes = {name: {value: code for code, value in enumerate(values)}
+                       for name, values in self.tables.items()}
+
+    def encode(self, name, values):
+        codes = self._codes[name]
+        table = self.tables[name]
+        for value in set(values) - codes.keys():
+            codes[value] = len(table)
+            table.append(value)
+        return np.fromiter(map(codes.__getitem__, values), dtype=np.int32, count=len(values))
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.tables, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def _write_partition(path, columns, format):
+    # 先寫到暫存目錄再換名，讀取端不會看到寫到一半的分區
+    tmp_dir = f"{path}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    if format == "parquet":
+        table = pa.table({name: pa.array(values) for name, values in columns.items()})
+        pq.write_table(table, os.path.join(tmp_dir, "part.parquet"), compression="zstd")
+    else:
+        for name, values in columns.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), values)
+    days = columns["day"]
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": format,
+            "rows": int(len(days)),
+            "first_day": int(days.min()),
+            "last_day": int(days.max()),
+        }, f)
+    old_dir = f"{path}.old"
+    if os.path.exists(path):
+        os.replace(path, old_dir)
+    os.replace(tmp_dir, path)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+class Archive:
+    """
+    按月分區的欄式封存。每個分區是一個目錄：.npy 欄位檔（以 mmap 讀取），
+    或安裝 pyarrow 時的單一 Parquet 檔；manifest.json 記錄格式與日期範圍。
+    """
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+
+    @classmethod
+    def for_database(cls, database):
+        return cls(archive_dir_for(database))
+
+    def load_dictionary(self):
+        # 每次重新讀檔：封存可能由另一個程序（排程的 CLI）執行，代碼表只會追加
+        return ArchiveDictionary(os.path.join(self.archive_dir, DICTIONARY_FILE))
+
+    def partitions(self):
+        if not os.path.isdir(self.archive_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.archive_dir)
+            if os.path.exists(os.path.join(self.archive_dir, name, MANIFEST_FILE))
+        )
+
+    def manifest(self, key):
+        with open(os.path.join(self.archive_dir, key, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def read_partition(self, key, columns=None):
+        """
+        讀取單一分區的欄位；.npy 以唯讀 mmap 開啟，只有實際用到的頁面會載入記憶體
+        """
+        path = os.path.join(self.archive_dir, key)
+        names = list(columns or COLUMNS)
+        if self.manifest(key)["format"] == "parquet":
+            table = pq.read_table(os.path.join(path, "part.parquet"), columns=names, memory_map=True)
+            return {name: table.column(name).to_numpy() for name in names}
+        return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in names}
+
+    def scan(self, start=None, end=None, columns=None):
+        """
+        讀取 [start, end] 日期範圍（datetime.date，含頭尾）內所有分區並串接成欄位陣列；
+        只開啟日期範圍有交集的分區
+        """
+        names = list(columns or COLUMNS)
+        if "day" not in names:
+            names.append("day")
+        first = start.toordinal() if start else None
+        last = end.toordinal() if end else None
+        parts = []
+        for key in self.partitions():
+            manifest = self.manifest(key)
+            if (first is not None and manifest["last_day"] < first) or (last is not None and manifest["first_day"] > last):
+                continue
+            part = self.read_partition(key, names)
+            mask = np.ones(len(part["day"]), dtype=bool)
+            if first is not None:
+                mask &= part["day"] >= first
+            if last is not None:
+                mask &= part["day"] <= last
+            parts.append({name: values[mask] for name, values in part.items()})
+        if not parts:
+            return {name: np.array([], dtype=COLUMNS[name]) for name in names}
+        return {name: np.concatenate([part[name] for part in parts]) for name in names}
+
+    def crop_names(self):
+        return [name for _, name in self.load_dictionary().tables["crops"]]
+
+    def market_codes(self):
+        return [code for code, _ in self.load_dictionary().tables["markets"]]
+
+    def write_month(self, key, rows, format=None):
+        """
+        把一個月份的 SQLite 列寫成分區；分區已存在時合併，同一自然鍵以新的列為準。回傳分區列數
+        """
+        format = format or default_format()
+        # 沒有作物名稱的列無法編碼成代碼表，價格分析與排行也都排除；不寫入分區，隨該月份一起刪除
+        rows = [row for row in rows if row[2] is not None]
+        if not rows:
+            return 0
+        dictionary = self.load_dictionary()
+        dates, crop_codes, crop_names, market_codes, market_names, tc_types, *values = zip(*rows)
+        ordinals = {value: parse_roc_date(value).toordinal() for value in set(dates)}
+        columns = {
+            "day": np.fromiter(map(ordinals.__getitem__, dates), dtype=np.int32, count=len(dates)),
+            "crop": dictionary.encode("crops", list(zip(crop_codes, crop_names))),
+            "market": dictionary.encode("markets", list(zip(market_codes, market_names))),
+            "tc_type": dictionary.encode("tc_types", list(tc_types)),
+        }
+        for name, column in zip(VALUE_COLUMNS, values):
+            columns[name] = np.array([np.nan if value is None else value for value in column],
+                                     dtype=VALUE_COLUMNS[name])
+
+        if key in self.partitions():
+            existing = self.read_partition(key)
+            columns = {name: np.concatenate([np.asarray(existing[name]), columns[name]]) for name in COLUMNS}
+            columns = self._dedupe(columns)
+        dictionary.save()
+        _write_partition(os.path.join(self.archive_dir, key), columns, format)
+        return len(columns["day"])
+
+    def _dedupe(self, columns):
+        # 自然鍵 (日期, 作物, 市場, 交易類別) 重複時保留最後出現（較新）的那一列
+        keys = np.stack([columns[name].astype(np.int64) for name in CODE_COLUMNS], axis=1)
+        _, first_in_reversed = np.unique(keys[::-1], axis=0, return_index=True)
+        keep = np.sort(len(keys) - 1 - first_in_reversed)
+        return {name: values[keep] for name, values in columns.items()}
+
+
+def closed_months(conn, today=None, retain_days=RETAIN_DAYS):
+    """
+    SQLite 中整個月份都早於保留期限的月份（YYYY-MM）
+    """
+    cutoff = (today or datetime.date.today()) - datetime.timedelta(days=retain_days)
+    months = set()
+    for (trans_date,) in conn.execute("SELECT DISTINCT trans_date FROM product_transactions"):
+        day = parse_roc_date(trans_date)
+        if day < cutoff.replace(day=1):
+            months.add(month_key(day))
+    return sorted(months)
+
+
+def compact(conn, archive=None, today=None, retain_days=RETAIN_DAYS, format=None, vacuum=False):
+    """
+    封存已結束的月份並從 product_transactions 刪除；先寫分區再刪除，中斷後重跑會合併而不會遺失資料。
+    conn 需以 isolation_level=None 開啟；archive 預設為資料庫檔旁的封存目錄。回傳 {month: 封存列數}
+    """
+    if archive is None:
+        # PRAGMA database_list 的第三欄是主資料庫的檔案路徑
+        archive = Archive.for_database(conn.execute("PRAGMA database_list").fetchone()[2])
+    os.makedirs(archive.archive_dir, exist_ok=True)
+    archived = {}
+    for key in closed_months(conn, today, retain_days):
+        first, last = month_bounds(key)
+        rows = conn.execute(ARCHIVE_SQL, (first, last)).fetchall()
+        if not rows:
+            continue
+        archive.write_month(key, rows, format)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM product_transactions WHERE trans_date >= ? AND trans_date <= ?", (first, last))
+            bump_data_version(conn, "transactions")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        archived[key] = len(rows)
+    if archived and vacuum:
+        conn.execute("VACUUM")
+    return archived
+
+
+# 封存已結束的月份（不會自動執行）：python archive.py --db new.db --retain-days 90 [--format npy] [--vacuum]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把 product_transactions 已結束的月份封存成欄式檔案")
+    parser.add_argument("--db", default="new.db")
+    parser.add_argument("--archive-dir", help="預設為資料庫檔所在目錄下的 archive/")
+    parser.add_argument("--retain-days", type=int, default=RETAIN_DAYS)
+    parser.add_argument("--format", choices=["npy", "parquet"], default=None)
+    parser.add_argument("--vacuum", action="store_true", help="封存後 VACUUM 回收資料庫空間")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        started = time.perf_counter()
+        archive = Archive(args.archive_dir) if args.archive_dir else Archive.for_database(args.db)
+        result = compact(conn, archive, retain_days=args.retain_days,
+                         format=args.format, vacuum=args.vacuum)
+    finally:
+        conn.close()
+    for key, rows in result.items():
+        print(f"{key}：封存 {rows} 筆")
+    print(f"完成，共 {sum(result.values())} 筆，{time.perf_counter() - started:.2f} 秒")
@@ -0,0 +1,465 @@
+import argparse
+import contextlib
+import datetime
+import itertools
+import json
+import os
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from crop_matching import rebuild_crop_map
+from crop_rankings import rebuild_all_rankings
+from ingest import UPSERT_SQL, roc_date
+from llm_parser import sample_response
+from migrations import migrate
+from seasonal import month_mask
+
+# 效能基準：在暫存目錄建立合成資料的 new.db，啟動 app 並以 Flask test client 逐一量測各路由與食譜流程。
+# 結果（p50 / p95 / p99、吞吐量、峰值 RSS）可存成 JSON 基準，之後的執行與基準比較。
+
+SOURCE_DATABASE = "new.db"
+BASELINE_FILE = "bench_baseline.json"
+INSERT_BATCH = 50_000
+# 每個市場每天大約有多少比例的作物有交易
+TRADE_RATIO = 0.6
+# p50 / p95 比基準慢超過 TOLERANCE 視為退步
+TOLERANCE = 0.2
+SEASONAL_TYPES = ["蔬菜", "水果", "菇類", "根莖類"]
+# 成本排序量測的候選食譜數
+CANDIDATE_COUNT = 500
+# /search 量測的查詢：長詞走 FTS MATCH，單字詞走 LIKE
+SEARCH_QUERIES = ["基準食譜", "材", "基準食譜 材"]
+# 基準測試建立的 workdir 會放這個檔案，之後的執行才能沿用（--workdir 不接受其他非空目錄）
+WORKDIR_MARKER = ".recipe-bench"
+
+
+def load_vocabulary(database=SOURCE_DATABASE):
+    """
+    從現有資料庫取出真實的作物、市場、交易類別與季節食材當作合成資料的詞彙；找不到時以編號代替
+    """
+    if os.path.exists(database):
+        with sqlite3.connect(database) as conn:
+            crops = conn.execute("""
+                SELECT crop_code, MIN(crop_name), MIN(tc_type) FROM product_transactions
+                WHERE crop_name IS NOT NULL GROUP BY crop_code
+            """).fetchall()
+            markets = conn.execute(
+                "SELECT DISTINCT market_code, market_name FROM product_transactions"
+            ).fetchall()
+            seasonal = conn.execute(
+                "SELECT name, type, month_start, month_end FROM seasonal_ingredients"
+            ).fetchall()
+        if crops:
+            return crops, markets, seasonal
+    crops = [(f"C{i:04d}", f"作物{i}", "N04") for i in range(800)]
+    return crops, [("100", "台北一")], [(f"作物{i}", "蔬菜", 1, 12) for i in range(0, 800, 2)]
+
+
+def generate_database(path, rows, markets=20, seasonal=2000, seed=0, end=None):
+    """
+    以 migrations 建立空的 new.db 結構，填入約 rows 筆交易（日期往前推到今天為止）與 seasonal 筆季節食材，
+    並重建每日排行摘要與作物對照表。回傳 (實際列數, 交易天數)
+    """
+    rng = np.random.default_rng(seed)
+    crops, market_rows, seasonal_rows = load_vocabulary()
+    market_rows = list(market_rows)
+    for i in range(len(market_rows), markets):
+        market_rows.append((f"{900 + i}", f"合成市場{i}"))
+    market_rows = market_rows[:markets]
+
+    per_day = max(1, int(len(crops) * len(market_rows) * TRADE_RATIO))
+    days = max(2, -(-rows // per_day))
+    end = end or datetime.date.today()
+    dates = [roc_date(end - datetime.timedelta(days=offset)) for offset in range(days - 1, -1, -1)]
+
+    # 每種作物有自己的基準價與交易量，每天在基準附近隨機波動
+    base_price = rng.lognormal(3.5, 0.6, len(crops))
+    base_quantity = rng.lognormal(7, 1.2, len(crops))
+    pairs = np.array([(c, m) for c in range(len(crops)) for m in range(len(market_rows))], dtype=np.int32)
+
+    migrate(path)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    written = 0
+    try:
+        batch = []
+        for day_index, trans_date in enumerate(dates):
+            remaining = rows - written
+            if remaining <= 0:
+                break
+            chosen = pairs[rng.random(len(pairs)) < TRADE_RATIO][:remaining]
+            crop_index, market_index = chosen[:, 0], chosen[:, 1]
+            trend = 1 + 0.15 * np.sin(day_index / 30 + crop_index)
+            avg = base_price[crop_index] * trend * rng.normal(1, 0.08, len(chosen)).clip(0.6)
+            quantity = base_quantity[crop_index] * rng.lognormal(0, 0.5, len(chosen))
+            for c, m, price, qty in zip(crop_index.tolist(), market_index.tolist(), avg.tolist(), quantity.tolist()):
+                crop_code, crop_name, tc_type = crops[c]
+                market_code, market_name = market_rows[m]
+                batch.append((trans_date, crop_code, crop_name, tc_type, market_code, market_name,
+                              round(price * 1.3, 1), round(price * 1.05, 1), round(price * 0.7, 1),
+                              round(price, 1), round(qty)))
+            written += len(chosen)
+            if len(batch) >= INSERT_BATCH:
+                conn.execute("BEGIN")
+                conn.executemany(UPSERT_SQL, batch)
+                conn.execute("COMMIT")
+                batch = []
+        if batch:
+            conn.execute("BEGIN")
+            conn.executemany(UPSERT_SQL, batch)
+            conn.execute("COMMIT")
+
+        # 真實的季節食材之外，以作物主名與隨機月份補到 seasonal 筆
+        names = [crop_name.split("-")[0] for _, crop_name, _ in crops]
+        extra = []
+        for i in range(max(0, seasonal - len(seasonal_rows))):
+            start, length = int(rng.integers(1, 13)), int(rng.integers(1, 7))
+            extra.append((f"{names[i % len(names)]}{i // len(names) or ''}",
+                          SEASONAL_TYPES[i % len(SEASONAL_TYPES)], start, (start + length - 1) % 12 + 1))
+        conn.execute("BEGIN")
+        conn.execute("DELETE FROM seasonal_ingredients")
+        conn.executemany(
+            "INSERT INTO seasonal_ingredients (name, type, month_start, month_end, month_mask) VALUES (?, ?, ?, ?, ?)",
+            [(name, type_, start, end_month, month_mask(start, end_month))
+             for name, type_, start, end_month in list(seasonal_rows)[:seasonal] + extra],
+        )
+        rebuild_crop_map(conn)
+        conn.execute("COMMIT")
+
+        conn.execute("BEGIN")
+        rebuild_all_rankings(conn)
+        if conn.in_transaction:
+            conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return written, len(dates)
+
+
+def peak_rss_mb():
+    # Linux 的 ru_maxrss 單位是 KB
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def measure(name, call, iterations, warmup=2, concurrency=1):
+    """
+    執行 call() 共 iterations 次（前 warmup 次不計），回傳延遲分位數、吞吐量與峰值 RSS
+    """
+    for _ in range(warmup):
+        call()
+
+    def timed(_):
+        started = time.perf_counter()
+        status = call()
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(timed, range(iterations)))
+    else:
+        samples = [timed(i) for i in range(iterations)]
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([sample[0] for sample in samples]) * 1000
+    errors = sum(1 for _, status in samples if status is not None and status >= 400)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "name": name,
+        "iterations": iterations,
+        "errors": errors,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "throughput_per_s": round(iterations / elapsed, 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def sample_recipes(count, prefix):
+    _, recipes = sample_response(recipe_count=count, think_chars=0)
+    # 名稱與 prompt 都不同，才不會被重複檢查略過或命中生圖快取
+    for i, recipe in enumerate(recipes):
+        recipe["name"] = f"{prefix}{i}"
+        recipe["image_prompt"] = f"{recipe['image_prompt']} {prefix}{i}"
+    return recipes
+
+
+@contextlib.contextmanager
+def scratch_clone():
+    """
+    在新的暫存目錄建立 bare repo 與它的 clone，回傳在 clone 裡發布的 Publisher；
+    /push-to-remote 的 commit 與 push 只落在這個暫存目錄，結束後整個刪除，不碰 workdir 或任何既有的 checkout
+    """
+    from publisher import MARKDOWN_DIR, Publisher
+
+    scratch = tempfile.mkdtemp(prefix="recipe-bench-publish-")
+    remote_dir = os.path.join(scratch, "remote.git")
+    clone_dir = os.path.join(scratch, "clone")
+    try:
+        def git(*args):
+            return subprocess.run(["git", *args], cwd=clone_dir, check=True, capture_output=True, text=True).stdout
+
+        subprocess.run(["git", "init", "--bare", "-q", remote_dir], check=True)
+        subprocess.run(["git", "clone", "-q", remote_dir, clone_dir], check=True, capture_output=True)
+        git("config", "user.name", "benchmark")
+        git("config", "user.email", "benchmark@localhost")
+        os.makedirs(os.path.join(clone_dir, MARKDOWN_DIR))
+        branch = git("symbolic-ref", "--short", "HEAD").strip()
+        yield Publisher(clone_dir, remote="origin", branch=branch, debounce=0)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def workdir_error(path):
+    """
+    --workdir 只接受暫存用途的目錄：不在 git checkout 裡，且不存在、是空目錄或之前由基準測試建立；
+    不符合時回傳原因
+    """
+    if not os.path.exists(path):
+        return None
+    if not os.path.isdir(path):
+        return f"{path} 不是目錄"
+    inside = subprocess.run(["git", "rev-parse", "--is-inside-work-tree"], cwd=path, capture_output=True, text=True)
+    if inside.returncode == 0 and inside.stdout.strip() == "true":
+        return f"{path} 在 git checkout 裡，請改用暫存目錄"
+    if os.listdir(path) and not os.path.exists(os.path.join(path, WORKDIR_MARKER)):
+        return f"{path} 不是空目錄，也不是之前的基準測試目錄"
+    return None
+
+
+def run_suite(iterations, render_latency, batch_size, concurrency):
+    """
+    在目前目錄（需已有合成的 new.db）啟動 app，量測所有讀取路由、LLM 解析、食譜產生與背景生圖、
+    食譜搜尋與重新輸出，以及推送到暫存遠端的發布流程
+    """
+    import app
+    import recipe_md
+    from stubs import StubComfyUI
+
+    client = app.app.test_client()
+    crop_name = app.unique_crops()[0]
+    month = datetime.date.today().month
+
+    def get(path, invalidate=False):
+        def call():
+            if invalidate:
+                app.response_cache.invalidate()
+            return client.get(path).status_code
+        return call
+
+    # 讀取路由：cold 每次先清掉回應快取，量到的是實際查詢；cached 量的是快取命中
+    routes = [
+        "/seasonal_top50",
+        "/seasonal_top50?seasonal=false",
+        f"/seasonal_top50?month={month % 12 + 1}",
+        "/api/seasonal-today",
+        "/fetch_combined_data",
+        "/get_historical_recipes",
+    ]
+    results = []
+    for path in routes:
+        results.append(measure(f"GET {path} [cold]", get(path, invalidate=True), iterations,
+                               concurrency=concurrency))
+        results.append(measure(f"GET {path} [cached]", get(path), iterations, concurrency=concurrency))
+    for path in [
+        f"/crop_matches?crop_name={crop_name}",
+        "/price_analytics",
+        "/price_analytics/bargains",
+        f"/price_analytics/history?crop_name={crop_name}",
+        "/metrics",
+    ]:
+        results.append(measure(f"GET {path}", get(path), iterations, concurrency=concurrency))
+
+    response, _ = sample_response(recipe_count=50)
+    results.append(measure(
+        "POST /process-llm (50 道食譜)",
+        lambda: client.post("/process-llm", json={"llmResponse": response}).status_code,
+        iterations,
+    ))
+    results.append(measure(
+        "POST /process-llm/stream (50 道食譜)",
+        lambda: client.post("/process-llm/stream", data=response.encode("utf-8")).status_code,
+        iterations,
+    ))
+
+    from cost_engine import sample_candidates
+
+    engine = app.get_cost_engine()
+    candidates = sample_candidates(CANDIDATE_COUNT, engine.snapshot.crop_names)
+    def rank():
+        engine.rank(candidates, batch_size)
+
+    results.append(measure(f"cost_engine.rank ({CANDIDATE_COUNT} 道候選)", rank, iterations))
+
+    with StubComfyUI(render_latency=render_latency) as stub:
+        recipe_md.comfyui_api_url = stub.prompt_url
+        batches = itertools.count()
+
+        def generate():
+            recipes = sample_recipes(batch_size, f"基準食譜{next(batches)}-")
+            return client.post("/generate-recipe", json={"recipes": recipes, "duplicate_policy": "allow"}).status_code
+
+        def single():
+            recipe_md.recipe_to_md(sample_recipes(1, f"單篇食譜{next(batches)}-")[0])
+
+        rounds = max(3, iterations // 10)
+        results.append(measure(f"POST /generate-recipe ({batch_size} 道)", generate, rounds, warmup=1))
+        results.append(measure("recipe_to_md", single, rounds, warmup=1))
+
+        # 背景生圖：送出只排入佇列，之後查詢任務狀態；每次的 prompt 都不同，才不會命中生圖快取
+        app.image_jobs.comfyui_api_url = stub.prompt_url
+        prompts = itertools.count()
+        image_job_ids = []
+
+        def submit_image():
+            response = client.post("/generate_ingredients_image", json={
+                "image_prompt": f"an illustration of a dish {next(prompts)}", "titles": ["基準生圖"],
+            })
+            image_job_ids.append(response.get_json()["job_id"])
+            return response.status_code
+
+        results.append(measure("POST /generate_ingredients_image", submit_image, iterations))
+        job_ids = itertools.cycle(image_job_ids)
+        results.append(measure(
+            "GET /image_jobs/<id>", lambda: client.get(f"/image_jobs/{next(job_ids)}").status_code, iterations,
+        ))
+        for job_id in image_job_ids:
+            app.image_jobs.wait(job_id, timeout=60)
+
+    # 前面產生的食譜已寫進資料庫與全文檢索表
+    for query in SEARCH_QUERIES:
+        path = f"/search?q={query}&mode=any"
+        results.append(measure(f"GET {path} [cold]", get(path, invalidate=True), iterations,
+                               concurrency=concurrency))
+    results.append(measure(
+        "POST /recipe_store/render",
+        lambda: client.post("/recipe_store/render", json={}).status_code,
+        max(3, iterations // 10),
+    ))
+
+    # 每次推送一篇新的 Markdown，量到的是 add、commit 與 push 到本機 bare repo 的完整流程
+    with scratch_clone() as publisher:
+        original_publisher, app.publisher = app.publisher, publisher
+        pushes = itertools.count()
+
+        def push():
+            filename = f"2000-01-01-000000_基準發布{next(pushes)}.md"
+            with open(os.path.join(publisher.repo_path, recipe_md.RECIPE_DIR, filename), "w", encoding="utf-8") as f:
+                f.write(f"# {filename}\n")
+            response = client.post("/push-to-remote", json={"recipes": [filename]})
+            job = publisher.wait(response.get_json()["job_id"], timeout=60)
+            return response.status_code if job["status"] == "done" else 500
+
+        try:
+            results.append(measure("POST /push-to-remote (commit + push)", push, max(3, iterations // 10), warmup=1))
+        finally:
+            app.publisher = original_publisher
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    與基準比較 p50 / p95，回傳退步的項目名稱
+    """
+    previous = {item["name"]: item for item in baseline.get("results", [])}
+    regressions = []
+    print(f"\n{'項目':<52} {'p50 基準→本次':>22} {'p95 基準→本次':>22}")
+    for item in results:
+        old = previous.get(item["name"])
+        if old is None:
+            print(f"{item['name']:<52} {'（新項目）':>22}")
+            continue
+        cells = []
+        slower = False
+        for key in ("p50_ms", "p95_ms"):
+            change = (item[key] - old[key]) / old[key] if old[key] else 0.0
+            slower |= change > tolerance
+            cells.append(f"{old[key]:.2f}→{item[key]:.2f} ({change:+.0%})")
+        if slower:
+            regressions.append(item["name"])
+        print(f"{item['name']:<52} {cells[0]:>22} {cells[1]:>22}{'  ⚠ 退步' if slower else ''}")
+    return regressions
+
+
+def print_results(results):
+    print(f"\n{'項目':<52} {'p50':>9} {'p95':>9} {'p99':>9} {'次/秒':>9} {'RSS MB':>8} {'錯誤':>4}")
+    for item in results:
+        print(f"{item['name']:<52} {item['p50_ms']:>9.2f} {item['p95_ms']:>9.2f} {item['p99_ms']:>9.2f} "
+              f"{item['throughput_per_s']:>9.1f} {item['peak_rss_mb']:>8.1f} {item['errors']:>4}")
+
+
+# 執行：python benchmark.py --rows 1000000 [--save bench_baseline.json] [--compare bench_baseline.json]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以合成資料量測各路由與食譜流程的延遲、吞吐量與記憶體")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="合成交易筆數（建議 1M～50M）")
+    parser.add_argument("--markets", type=int, default=20)
+    parser.add_argument("--seasonal", type=int, default=2000, help="季節食材筆數")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=1, help="讀取路由的並行請求數")
+    parser.add_argument("--render-latency", type=float, default=0.2, help="假 ComfyUI 的渲染秒數")
+    parser.add_argument("--batch-size", type=int, default=4, help="/generate-recipe 每批食譜數")
+    parser.add_argument("--workdir", help="合成資料庫與產出檔案的暫存目錄（不可在 git checkout 裡）；已有 new.db 時直接沿用")
+    parser.add_argument("--keep", action="store_true", help="結束後保留 workdir")
+    parser.add_argument("--save", metavar="PATH", nargs="?", const=BASELINE_FILE, help="把結果存成基準 JSON")
+    parser.add_argument("--compare", metavar="PATH", nargs="?", const=BASELINE_FILE,
+                        help="與基準 JSON 比較，有退步時以狀態碼 1 結束")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="recipe-bench-"))
+    problem = workdir_error(workdir)
+    if problem:
+        parser.error(problem)
+    os.makedirs(workdir, exist_ok=True)
+    open(os.path.join(workdir, WORKDIR_MARKER), "a").close()
+    database = os.path.join(workdir, SOURCE_DATABASE)
+    # 從儲存庫讀真實詞彙，之後切換到 workdir，app 的相對路徑（new.db、content/、static/）都落在 workdir
+    os.chdir(repo_dir)
+    started = time.perf_counter()
+    if not os.path.exists(database):
+        rows, days = generate_database(database, args.rows, args.markets, args.seasonal)
+        print(f"合成資料：{rows} 筆交易、{days} 天，{time.perf_counter() - started:.1f} 秒")
+    for name in ("flux_api.json", "flux_512_api.json", "lora_api.json"):
+        if not os.path.exists(os.path.join(workdir, name)):
+            shutil.copy(os.path.join(repo_dir, name), workdir)
+    os.chdir(workdir)
+
+    try:
+        results = run_suite(args.iterations, args.render_latency, args.batch_size, args.concurrency)
+    finally:
+        os.chdir(repo_dir)
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print_results(results)
+
+    report = {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "rows": args.rows,
+        "iterations": args.iterations,
+        "concurrency": args.concurrency,
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n已儲存基準：{args.save}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} 項比基準慢超過 {args.tolerance:.0%}")
+            sys.exit(1)
@@ -0,0 +1,393 @@
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+from crop_matching import CropMatcher, name_key, normalize_name, split_variety
+from price_analytics import parse_roc_date
+from recipe_dedup import PANTRY_INGREDIENTS
+from text_convert import convert_text
+
+# 食譜成本估算：以 product_transactions 最新的批發均價（元/公斤）取代 LLM 自行估的價格。
+# 價格快照只在匯入新資料後重建；食材 → 作物的對照與份量換算都以名稱快取，
+# 一批食譜的成本以陣列一次算完，足以在單次 /generate-recipe 內替數百道候選排序。
+
+# 快照取最近幾個交易日，當天沒有交易的作物沿用最近一次的價格
+LOOKBACK_DATES = 7
+# 以名稱相似度（n-gram）對照作物的最低分數
+FALLBACK_MATCH_THRESHOLD = 0.75
+
+LATEST_DATES_SQL = "SELECT DISTINCT trans_date FROM product_transactions ORDER BY trans_date DESC LIMIT ?"
+SNAPSHOT_SQL = """
+    SELECT crop_name, trans_date, SUM(avg_price * trans_quantity), SUM(trans_quantity), AVG(avg_price)
+    FROM product_transactions
+    WHERE trans_date IN ({}) AND crop_name IS NOT NULL AND avg_price > 0
+    GROUP BY crop_name, trans_date
+    ORDER BY trans_date
+"""
+
+# 重量與容量單位換算成公斤（液體以 1 毫升 ≈ 1 公克計）
+UNIT_KG = {
+    "公克": 0.001, "克": 0.001, "g": 0.001,
+    "公斤": 1.0, "千克": 1.0, "kg": 1.0,
+    "台斤": 0.6, "斤": 0.6, "兩": 0.0375,
+    "毫升": 0.001, "ml": 0.001, "cc": 0.001, "公升": 1.0, "l": 1.0,
+    "大匙": 0.015, "湯匙": 0.015, "小匙": 0.005, "茶匙": 0.005, "杯": 0.24,
+}
+# 以個數計的單位：預設每個的重量（公斤）
+PIECE_UNIT_KG = {
+    "顆": 0.2, "個": 0.2, "條": 0.25, "根": 0.1, "支": 0.1, "株": 0.1, "頭": 0.3, "把": 0.2,
+    "朵": 0.02, "塊": 0.1, "片": 0.01, "瓣": 0.005, "粒": 0.005,
+}
+# 片、瓣、粒這類切開後的單位直接用預設重量，不看食材
+PORTION_UNITS = {"片", "瓣", "粒"}
+# 常見蔬果每顆 / 條 / 根的重量（公斤），以作物主名為鍵
+PIECE_KG = {
+    "番茄": 0.2, "洋蔥": 0.25, "馬鈴薯": 0.2, "胡蘿蔔": 0.2, "甘藍": 1.2, "花椰菜": 0.5, "青花菜": 0.4,
+    "茄子": 0.2, "絲瓜": 0.5, "苦瓜": 0.4, "胡瓜": 0.3, "冬瓜": 2.0, "南瓜": 1.2, "玉米": 0.3,
+    "青蔥": 0.02, "大蒜": 0.05, "辣椒": 0.01, "甜椒": 0.15, "檸檬": 0.1, "蘋果": 0.25, "香蕉": 0.15,
+    "蘿蔔": 0.8, "芹菜": 0.05, "韭菜": 0.01, "杏鮑菇": 0.08, "香菇": 0.02,
+}
+_DIGITS = {"半": 0.5, "一": 1, "二": 2, "兩": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+_NUMBER_RE = r"\d+(?:\.\d+)?(?:/\d+)?"
+_AMOUNT_RE = re.compile(rf"^(?:(\d+)\s*(?:又|\s)\s*)?({_NUMBER_RE})(?:\s*(?:~|-|至|到)\s*({_NUMBER_RE}))?\s*(.*)$")
+
+
+def _number(text):
+    if "/" in text:
+        numerator, denominator = text.split("/")
+        return float(numerator) / float(denominator) if float(denominator) else None
+    return float(text)
+
+
+@lru_cache(maxsize=4096)
+def parse_amount(amount, unit=""):
+    """
+    解析份量，回傳 (數量, 單位)；「適量」「少許」等無法換算時回傳 (None, 單位)。
+    支援 1/2、1又1/2、2~3（取平均）、半、兩 等寫法；單位寫在 amount 裡（如 "300克"）時一併拆出
+    """
+    text = unicodedata.normalize("NFKC", convert_text(f"{amount}")).strip().lower()
+    unit = unicodedata.normalize("NFKC", convert_text(f"{unit}")).strip().lower()
+    if text[:1] in _DIGITS:
+        return _DIGITS[text[0]], unit or text[1:].strip()
+    match = _AMOUNT_RE.match(text)
+    if not match:
+        return None, unit
+    whole, low, high, rest = match.groups()
+    value = _number(low)
+    if value is not None and high is not None:
+        upper = _number(high)
+        value = None if upper is None else (value + upper) / 2
+    if value is not None and whole is not None:
+        value += int(whole)
+    return value, unit or rest.strip()
+
+
+def quantity_kg(amount, unit, base=""):
+    """
+    份量換算成公斤；無法換算時回傳 None
+    """
+    value, unit = parse_amount(amount, unit)
+    if value is None:
+        return None
+    if unit in UNIT_KG:
+        return value * UNIT_KG[unit]
+    if unit in PIECE_UNIT_KG:
+        if unit in PORTION_UNITS:
+            return value * PIECE_UNIT_KG[unit]
+        return value * PIECE_KG.get(base, PIECE_UNIT_KG[unit])
+    return None
+
+
+def snapshot_query(dates):
+    placeholders = ','.join(['?' for _ in dates])
+    return SNAPSHOT_SQL.format(placeholders), list(dates)
+
+
+class PriceSnapshot:
+    """
+    最新的作物批發價：crop_names、prices（元/公斤）、dates 三個對齊的陣列，
+    同一作物以最近一個有交易的日期為準，各市場以交易量加權平均
+    """
+
+    def __init__(self, rows):
+        latest = {}
+        for crop_name, trans_date, weighted, quantity, plain in rows:
+            price = weighted / quantity if quantity else plain
+            latest[crop_name] = (price, quantity or 0.0, trans_date)
+        self.crop_names = sorted(latest)
+        self.index = {name: i for i, name in enumerate(self.crop_names)}
+        self.prices = np.array([latest[name][0] for name in self.crop_names], dtype=np.float64)
+        self.quantities = np.array([latest[name][1] for name in self.crop_names], dtype=np.float64)
+        self.dates = [latest[name][2] for name in self.crop_names]
+        # 最新交易日（西元 YYYY-MM-DD），寫進成本說明
+        self.as_of = parse_roc_date(max(self.dates)).isoformat() if self.dates else None
+
+    @classmethod
+    def load(cls, conn, lookback=LOOKBACK_DATES):
+        dates = [row[0] for row in conn.execute(LATEST_DATES_SQL, (lookback,))]
+        if not dates:
+            return cls([])
+        return cls(conn.execute(*snapshot_query(dates)).fetchall())
+
+
+class IngredientMatcher:
+    """
+    食材名稱 → 作物：依序嘗試
+      1. 帶品種的名稱完整相同（茄子-胭脂茄）
+      2. 食材名稱就是某作物的品種（牛番茄 → 番茄-牛番茄、蒜頭 → 大蒜-蒜頭）
+      3. 主名相同的所有品種，價格以交易量加權（茄子 → 茄子-*；同義詞如 高麗菜 → 甘藍-*）
+      4. crop_matching 的 n-gram 相似度
+    """
+
+    def __init__(self, crop_names):
+        self._by_key = {}
+        self._by_base = {}
+        self._by_variety = {}
+        for name in crop_names:
+            base, variety = normalize_name(name)
+            self._by_key.setdefault(name_key(base, variety), []).append(name)
+            self._by_base.setdefault(base, []).append(name)
+            if variety:
+                self._by_variety.setdefault(variety, []).append(name)
+        self._fuzzy = CropMatcher(crop_names)
+        self._cache = {}
+
+    def match(self, ingredient):
+        """
+        回傳 (作物主名, [作物名稱, ...])；對不到時回傳 (主名, [])
+        """
+        if ingredient in self._cache:
+            return self._cache[ingredient]
+        # 俗名（地瓜、高麗菜）由 normalize_name 依 crop_matching.CROP_SYNONYMS 換成作物名稱
+        text = split_variety(ingredient)[0]
+        base, variety = normalize_name(ingredient)
+        key = name_key(base, variety)
+        crops = (
+            (self._by_key.get(key) if variety else None)
+            or self._by_variety.get(key)
+            or self._by_variety.get(text)
+            or self._by_base.get(base)
+            or [item["name"] for item in self._fuzzy.best_matches(ingredient, FALLBACK_MATCH_THRESHOLD)]
+        )
+        if crops and base not in self._by_base:
+            # 以品種或相似度對到時，件數重量改看作物的主名
+            base = normalize_name(crops[0])[0]
+        result = (base, sorted(crops or []))
+        self._cache[ingredient] = result
+        return result
+
+
+def is_pantry(name):
+    return normalize_name(name)[0] in PANTRY_INGREDIENTS
+
+
+class CostEngine:
+    """
+    食譜成本估算。ensure_loaded(conn) 在需要時建立價格快照與對照索引；同程序匯入新交易資料後呼叫 invalidate()，
+    其他程序寫入的資料以交易資料版本號判斷
+    """
+
+    def __init__(self, lookback=LOOKBACK_DATES):
+        self.lookback = lookback
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._version = None
+        self.snapshot = PriceSnapshot([])
+        self.matcher = IngredientMatcher([])
+        self._ingredients = {}
+
+    def ensure_loaded(self, conn, version=None):
+        """
+        version 為交易資料的版本號（db.read_data_versions）；None 表示不檢查
+        """
+        with self._lock:
+            if version is not None and version != self._version:
+                self._loaded = False
+            self._version = version
+            if not self._loaded:
+                self.snapshot = PriceSnapshot.load(conn, self.lookback)
+                self.matcher = IngredientMatcher(self.snapshot.crop_names)
+                self._ingredients = {}
+                self._loaded = True
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def ingredient(self, raw_name):
+        """
+        回傳 (繁體名稱, 是否為調味料, 元/公斤, 作物主名, [作物名稱, ...])，以原始名稱快取；
+        多個品種並列時以交易量加權平均，對不到時價格為 NaN
+        """
+        cached = self._ingredients.get(raw_name)
+        if cached is not None:
+            return cached
+        name = convert_text(raw_name)
+        base, crops = self.matcher.match(name)
+        pantry = is_pantry(name)
+        price = np.nan
+        if crops and not pantry:
+            rows = [self.snapshot.index[crop] for crop in crops]
+            weights = self.snapshot.quantities[rows]
+            prices = self.snapshot.prices[rows]
+            price = float(np.average(prices, weights=weights) if weights.sum() > 0 else prices.mean())
+        cached = (name, pantry, price, base, crops)
+        self._ingredients[raw_name] = cached
+        return cached
+
+    def estimate(self, recipes, detail=True):
+        """
+        估算一批食譜的成本，回傳與 recipes 對齊的列表：
+        {"cost", "price_date", "priced": [{"name", "crops", "kg", "price_per_kg", "cost"}], "unpriced", "pantry"}；
+        沒有任何食材對到市場價格時 cost 為 None。detail=False 時不產生 priced 明細（排序用）
+        """
+        # 逐行只做名稱與份量的快取查詢，乘法與加總以陣列一次完成
+        recipe_rows, kgs, prices, lines = [], [], [], []
+        estimates = []
+        for i, recipe in enumerate(recipes):
+            estimate = {"cost": None, "price_date": self.snapshot.as_of, "priced": [], "unpriced": [], "pantry": []}
+            estimates.append(estimate)
+            ingredients = recipe.get("ingredients") if isinstance(recipe, dict) else None
+            if not isinstance(ingredients, list):
+                continue
+            for item in ingredients:
+                if not isinstance(item, dict) or not item.get("name"):
+                    continue
+                name, pantry, price, base, crops = self.ingredient(f"{item['name']}")
+                if pantry:
+                    estimate["pantry"].append(name)
+                    continue
+                kg = quantity_kg(item.get("amount", ""), item.get("unit", ""), base)
+                if not crops or kg is None:
+                    estimate["unpriced"].append(name)
+                    continue
+                recipe_rows.append(i)
+                kgs.append(kg)
+                prices.append(price)
+                lines.append((i, name, crops))
+
+        if not lines:
+            return estimates
+        recipe_rows = np.array(recipe_rows, dtype=np.int64)
+        line_costs = np.array(kgs, dtype=np.float64) * np.array(prices, dtype=np.float64)
+        totals = np.bincount(recipe_rows, weights=line_costs, minlength=len(recipes))
+        counts = np.bincount(recipe_rows, minlength=len(recipes))
+        if detail:
+            for (i, name, crops), kg, price, cost in zip(lines, kgs, prices, line_costs.tolist()):
+                estimates[i]["priced"].append({
+                    "name": name, "crops": crops, "kg": round(kg, 3),
+                    "price_per_kg": round(price, 1), "cost": round(cost, 1),
+                })
+        for i in np.flatnonzero(counts).tolist():
+            estimates[i]["cost"] = round(float(totals[i]), 1)
+        return estimates
+
+    def rank(self, recipes, limit=None):
+        """
+        依估算成本由低到高排序，回傳 [(原索引, estimate), ...]。
+        未計價的食材越少越前面（缺項的總價會偏低，不能直接比），同樣缺項數再比成本；無法估算的排在最後
+        """
+        estimates = self.estimate(recipes, detail=False)
+        order = sorted(
+            range(len(recipes)),
+            key=lambda i: (estimates[i]["cost"] is None, len(estimates[i]["unpriced"]),
+                           estimates[i]["cost"] or 0.0, i),
+        )
+        if limit is not None:
+            order = order[:limit]
+        return [(i, estimates[i]) for i in order]
+
+
+def format_price(estimate):
+    """
+    成本寫進 Markdown 的文字，例如「約 85 元（依 2025-04-16 批發市場行情估算，未含：雞蛋、豬絞肉）」
+    """
+    cost = max(1, round(estimate["cost"]))
+    note = f"依 {estimate['price_date']} 批發市場行情估算"
+    if estimate["unpriced"]:
+        note += f"，未含：{'、'.join(estimate['unpriced'])}"
+    return f"約 {cost} 元（{note}）"
+
+
+def apply_costs(recipes, estimates):
+    """
+    回傳新的食譜列表：能估算成本的食譜以市場行情取代 LLM 估的 price，其餘維持原值
+    """
+    priced = []
+    for recipe, estimate in zip(recipes, estimates):
+        if isinstance(recipe, dict) and estimate["cost"] is not None:
+            recipe = dict(recipe, price=format_price(estimate))
+        priced.append(recipe)
+    return priced
+
+
+def summary(estimate):
+    """
+    API 回應用的精簡結果
+    """
+    return {
+        "cost": estimate["cost"],
+        "price_date": estimate["price_date"],
+        "unpriced": estimate["unpriced"],
+    }
+
+
+def sample_candidates(count, crop_names, seed=0):
+    """
+    以真實作物名稱組成 count 道候選食譜（基準測試用）
+    """
+    import random
+
+    rng = random.Random(seed)
+    foods = [name for name in crop_names if normalize_name(name)[0] in PIECE_KG] or list(crop_names)
+    units = [("300", "克"), ("1/2", "斤"), ("2", "顆"), ("1~2", "根"), ("半", "條"), ("適量", "")]
+    pantry = [{"name": "鹽", "amount": "1", "unit": "茶匙"}, {"name": "醬油", "amount": "1", "unit": "湯匙"}]
+    recipes = []
+    for i in range(count):
+        ingredients = []
+        for name in rng.sample(foods, min(len(foods), 5)):
+            amount, unit = rng.choice(units)
+            # 一半寫作物主名，一半寫市場名稱（含品種）
+            ingredients.append({"name": normalize_name(name)[0] if i % 2 else name, "amount": amount, "unit": unit})
+        ingredients.append({"name": "雞蛋", "amount": "2", "unit": "顆"})
+        recipes.append({"name": f"候選食譜{i}", "ingredients": ingredients + pantry,
+                        "steps": ["備料", "烹調"], "calories": "每人約 300 卡", "price": "約 100 元"})
+    return recipes
+
+
+# 手動驗證：python cost_engine.py [new.db] [候選數量]
+if __name__ == "__main__":
+    from recipe_md import SAMPLE_RECIPES
+
+    database = sys.argv[1] if len(sys.argv) > 1 else "new.db"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    engine = CostEngine()
+    started = time.perf_counter()
+    with sqlite3.connect(database) as conn:
+        engine.ensure_loaded(conn)
+    print(f"價格快照：{len(engine.snapshot.crop_names)} 種作物，最新 {engine.snapshot.as_of}，"
+          f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+    for recipe, estimate in zip(SAMPLE_RECIPES, engine.estimate(SAMPLE_RECIPES)):
+        print(f"{recipe['name']}：LLM「{recipe['price']}」→ "
+              f"{format_price(estimate) if estimate['cost'] is not None else '無法估算'}")
+        for line in estimate["priced"]:
+            print(f"    {line['name']} {line['kg']} kg × {line['price_per_kg']} 元/kg = {line['cost']} 元"
+                  f"（{'、'.join(line['crops'])}）")
+
+    candidates = sample_candidates(count, engine.snapshot.crop_names)
+    for label in ("第一次", "快取後"):
+        if label == "第一次":
+            engine._ingredients = {}
+            engine.matcher._cache = {}
+            parse_amount.cache_clear()
+        started = time.perf_counter()
+        ranked = engine.rank(candidates, limit=10)
+        print(f"{count} 道候選排序（{label}）：{(time.perf_counter() - started) * 1000:.1f} ms，"
+              f"第一名 {ranked[0][1]['cost']} 元")
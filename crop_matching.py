@@ -0,0 +1,248 @@
+import re
+import sqlite3
+import sys
+import unicodedata
+from collections import defaultdict
+
+from text_convert import convert_text
+
+# 市場作物名稱 → 季節食材名稱的對照表
+CROP_MAP_TABLE = "crop_seasonal_map"
+# 交易資料中出現過的作物名稱
+MARKET_CROPS_SQL = "SELECT DISTINCT crop_name FROM product_transactions WHERE crop_name IS NOT NULL"
+# 已經有對照的作物名稱
+MAPPED_CROPS_SQL = f"SELECT DISTINCT crop_name FROM {CROP_MAP_TABLE}"
+# 單一作物對照到的季節食材
+CROP_MAPPINGS_SQL = f"SELECT seasonal_name, score, method FROM {CROP_MAP_TABLE} WHERE crop_name = ?"
+# 比對索引的來源：所有季節食材名稱
+MATCHER_NAMES_SQL = "SELECT DISTINCT name FROM seasonal_ingredients"
+
+# 俗名 → 農產品交易行情使用的名稱；值可以帶品種（例如 柳丁 → 甜橙-柳橙）。
+# 季節食材對照與食譜成本估算（cost_engine）共用這一份
+CROP_SYNONYMS = {
+    "高麗菜": "甘藍",
+    "空心菜": "蕹菜",
+    "筊白筍": "茭白筍",
+    "蒜頭": "大蒜",
+    "蒜": "大蒜",
+    "迴香": "茴香",
+    "迥香": "茴香",
+    "柳丁": "甜橙-柳橙",
+    "青椒": "甜椒-青椒",
+    "甜桃": "桃子-甜桃",
+    "地瓜": "甘薯",
+    "番薯": "甘薯",
+    "甘藷": "甘薯",
+    "香菜": "芫荽",
+    "紅蘿蔔": "胡蘿蔔",
+    "白蘿蔔": "蘿蔔",
+    "四季豆": "菜豆",
+}
+
+# 不代表特定品種的後綴，比對時視同沒有品種
+GENERIC_VARIETIES = {"其他", "一般", "ㄧ般"}
+
+# 各種比對方式的分數；n-gram 相似度再乘上 NGRAM_WEIGHT
+SCORE_EXACT = 1.0
+SCORE_BASE = 0.9           # 作物帶品種、食材只有主名，例如 甘藍-初秋 → 甘藍
+SCORE_BASE_REVERSE = 0.85  # 作物只有主名、食材帶品種，例如 苦瓜 → 苦瓜-山苦瓜
+SCORE_VARIETY = 0.75       # 主名相同、品種不同
+NGRAM_WEIGHT = 0.7
+# 寫入對照表的最低分數；低於此分數的只作為候選供人工確認
+MATCH_THRESHOLD = 0.75
+
+_VARIETY_RE = re.compile(r"^(?P<base>[^-(]+?)\s*(?:-(?P<variety>.*)|\((?P<note>[^)]*)\))?$")
+
+
+def _canonical(text):
+    # 全形符號轉半形、簡體轉繁體、去掉空白
+    text = unicodedata.normalize("NFKC", text or "")
+    text = convert_text(text)
+    return re.sub(r"\s+", "", text)
+
+
+def split_variety(name):
+    """
+    把名稱拆成 (主名, 品種)，例如 甘藍-初秋 → (甘藍, 初秋)；括號內的別名也視為品種
+    """
+    text = _canonical(name)
+    match = _VARIETY_RE.match(text)
+    if not match:
+        return text, ""
+    variety = match.group("variety") or match.group("note") or ""
+    if variety in GENERIC_VARIETIES:
+        variety = ""
+    return match.group("base"), variety
+
+
+def normalize_name(name):
+    """
+    回傳正規化後的 (主名, 品種)：先套用同義詞，再拆出品種
+    """
+    text = _canonical(name)
+    text = CROP_SYNONYMS.get(text, text)
+    base, variety = split_variety(text)
+    if base in CROP_SYNONYMS:
+        synonym_base, synonym_variety = split_variety(CROP_SYNONYMS[base])
+        base, variety = synonym_base, variety or synonym_variety
+    return base, variety
+
+
+def name_key(base, variety):
+    return f"{base}-{variety}" if variety else base
+
+
+def bigrams(text):
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def dice(a, b):
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class CropMatcher:
+    """
+    季節食材名稱的比對索引：
+    完整名稱與主名各建一個雜湊索引，另以字元 bigram 建倒排索引處理寫法不同的名稱
+    """
+
+    def __init__(self, seasonal_names):
+        self._exact = defaultdict(set)
+        self._by_base = defaultdict(set)
+        self._bigram_index = defaultdict(set)
+        self._normalized = {}
+        for name in set(seasonal_names):
+            if not name:
+                continue
+            base, variety = normalize_name(name)
+            key = name_key(base, variety)
+            self._normalized[name] = (base, variety, bigrams(key))
+            self._exact[key].add(name)
+            self._by_base[base].add(name)
+            for gram in bigrams(key):
+                self._bigram_index[gram].add(name)
+
+    def __len__(self):
+        return len(self._normalized)
+
+    def candidates(self, crop_name, limit=5):
+        """
+        回傳依分數排序的候選：[{"name", "score", "method"}, ...]
+        """
+        base, variety = normalize_name(crop_name)
+        key = name_key(base, variety)
+        scored = {}
+
+        def offer(name, score, method):
+            if name not in scored or scored[name][0] < score:
+                scored[name] = (score, method)
+
+        for name in self._exact.get(key, ()):
+            offer(name, SCORE_EXACT, "exact")
+        for name in self._by_base.get(base, ()):
+            seasonal_variety = self._normalized[name][1]
+            if not seasonal_variety:
+                offer(name, SCORE_BASE, "base")
+            elif not variety:
+                offer(name, SCORE_BASE_REVERSE, "base")
+            else:
+                offer(name, SCORE_VARIETY, "variety")
+
+        grams = bigrams(key)
+        shared = set()
+        for gram in grams:
+            shared |= self._bigram_index.get(gram, set())
+        for name in shared - scored.keys():
+            score = round(dice(grams, self._normalized[name][2]) * NGRAM_WEIGHT, 3)
+            if score > 0:
+                offer(name, score, "ngram")
+
+        ranked = sorted(scored.items(), key=lambda item: (-item[1][0], item[0]))
+        return [
+            {"name": name, "score": score, "method": method}
+            for name, (score, method) in ranked[:limit]
+        ]
+
+    def best_matches(self, crop_name, threshold=MATCH_THRESHOLD):
+        """
+        回傳分數達門檻且並列最高的候選（同一作物可能同時對到同主名的多個品種）
+        """
+        found = self.candidates(crop_name, limit=None)
+        if not found or found[0]["score"] < threshold:
+            return []
+        return [item for item in found if item["score"] == found[0]["score"]]
+
+
+def create_crop_map_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CROP_MAP_TABLE} (
+            crop_name TEXT NOT NULL,       -- product_transactions.crop_name
+            seasonal_name TEXT NOT NULL,   -- seasonal_ingredients.name
+            score REAL NOT NULL,
+            method TEXT NOT NULL,
+            PRIMARY KEY (crop_name, seasonal_name)
+        ) WITHOUT ROWID
+    """)
+    conn.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_csm_seasonal
+        ON {CROP_MAP_TABLE} (seasonal_name)
+    """)
+
+
+def load_matcher(conn):
+    return CropMatcher(row[0] for row in conn.execute(MATCHER_NAMES_SQL))
+
+
+def map_crops(conn, crop_names, matcher=None):
+    """
+    重新計算指定作物的對照並寫入對照表，回傳寫入筆數
+    """
+    matcher = matcher or load_matcher(conn)
+    rows = []
+    for crop_name in crop_names:
+        conn.execute(f"DELETE FROM {CROP_MAP_TABLE} WHERE crop_name = ?", (crop_name,))
+        for match in matcher.best_matches(crop_name):
+            rows.append((crop_name, match["name"], match["score"], match["method"]))
+    conn.executemany(
+        f"INSERT INTO {CROP_MAP_TABLE} (crop_name, seasonal_name, score, method) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+    return len(rows)
+
+
+def map_new_crops(conn, crop_names):
+    """
+    只替還沒有對照的作物計算對照（新匯入的交易資料使用），回傳寫入筆數
+    """
+    mapped = {row[0] for row in conn.execute(MAPPED_CROPS_SQL)}
+    pending = sorted({name for name in crop_names if name} - mapped)
+    if not pending:
+        return 0
+    return map_crops(conn, pending)
+
+
+def rebuild_crop_map(conn):
+    """
+    季節食材變動後整張對照表重算，回傳寫入筆數。
+    已封存月份的作物不在 product_transactions 裡，原本就有對照的作物一併重算，不會因封存而遺失
+    """
+    create_crop_map_table(conn)
+    crop_names = {row[0] for row in conn.execute(MAPPED_CROPS_SQL)}
+    conn.execute(f"DELETE FROM {CROP_MAP_TABLE}")
+    crop_names.update(row[0] for row in conn.execute(MARKET_CROPS_SQL))
+    return map_crops(conn, sorted(crop_names))
+
+
+# 查詢作物的比對候選：python crop_matching.py new.db 甘藍-初秋 苦瓜
+if __name__ == "__main__":
+    database = sys.argv[1] if len(sys.argv) > 1 else "new.db"
+    with sqlite3.connect(database) as conn:
+        matcher = load_matcher(conn)
+    for crop_name in sys.argv[2:]:
+        print(crop_name)
+        for candidate in matcher.candidates(crop_name):
+            print(f"    {candidate['score']:.3f} {candidate['method']:<8} {candidate['name']}")
@@ -0,0 +1,240 @@
+import sqlite3
+import sys
+
+from crop_matching import CROP_MAP_TABLE
+from seasonal import month_bit
+
+# 每日作物排行摘要表：每個 (trans_date, crop_name) 只保留交易量最大的市場那一筆，
+# 並記錄當天交易量中位數，讓 /seasonal_top50 只需查這張小表
+RANKINGS_TABLE = "crop_daily_rankings"
+
+RESULT_COLUMNS = [
+    "trans_date", "crop_code", "crop_name", "tc_type", "market_code", "market_name",
+    "upper_price", "middle_price", "lower_price", "avg_price", "trans_quantity"
+]
+
+# 與舊查詢相同的中位數定義：排序後取第 COUNT(*) * 0.5 筆，只是範圍限縮在當天
+DAY_MEDIAN_SQL = """
+    SELECT trans_quantity
+    FROM product_transactions
+    WHERE trans_date = ?
+    ORDER BY trans_quantity
+    LIMIT 1
+    OFFSET (
+        SELECT CAST((COUNT(*) * 0.5) AS INTEGER)
+        FROM product_transactions
+        WHERE trans_date = ?
+    )
+"""
+# 參數：(當日中位數, 交易日)
+INSERT_TOP_ROWS_SQL = f"""
+    INSERT INTO {RANKINGS_TABLE} (
+        trans_date, crop_name, crop_code, tc_type, market_code, market_name,
+        upper_price, middle_price, lower_price, avg_price, trans_quantity, day_median
+    )
+    SELECT
+        trans_date, crop_name, crop_code, tc_type, market_code, market_name,
+        upper_price, middle_price, lower_price, avg_price, trans_quantity, ?
+    FROM (
+        SELECT *,
+            ROW_NUMBER() OVER (PARTITION BY crop_name ORDER BY trans_quantity DESC) as rn
+        FROM product_transactions
+        WHERE trans_date = ? AND crop_name IS NOT NULL
+    )
+    WHERE rn = 1
+"""
+SUMMARY_EXISTS_SQL = f"SELECT 1 FROM {RANKINGS_TABLE} WHERE trans_date = ? LIMIT 1"
+RAW_EXISTS_SQL = "SELECT 1 FROM product_transactions WHERE trans_date = ? LIMIT 1"
+
+
+def create_rankings_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {RANKINGS_TABLE} (
+            trans_date TEXT NOT NULL,
+            crop_name TEXT NOT NULL,
+            crop_code TEXT,
+            tc_type TEXT,
+            market_code TEXT,
+            market_name TEXT,
+            upper_price REAL,
+            middle_price REAL,
+            lower_price REAL,
+            avg_price REAL,
+            trans_quantity REAL,
+            day_median REAL,           -- 當天所有交易量的中位數
+            PRIMARY KEY (trans_date, crop_name)
+        ) WITHOUT ROWID
+    """)
+
+
+def refresh_daily_rankings(conn, trans_date):
+    """
+    重新計算單一交易日的排行摘要（先刪後寫，可重複執行），回傳寫入筆數
+    """
+    create_rankings_table(conn)
+
+    row = conn.execute(DAY_MEDIAN_SQL, (trans_date, trans_date)).fetchone()
+
+    conn.execute(f"DELETE FROM {RANKINGS_TABLE} WHERE trans_date = ?", (trans_date,))
+    if row is None:
+        return 0
+    day_median = row[0]
+
+    cursor = conn.execute(INSERT_TOP_ROWS_SQL, (day_median, trans_date))
+    return cursor.rowcount
+
+
+def rebuild_all_rankings(conn):
+    """
+    依 product_transactions 既有的所有交易日重建排行摘要，回傳處理的天數
+    """
+    dates = [row[0] for row in conn.execute("SELECT DISTINCT trans_date FROM product_transactions")]
+    for trans_date in dates:
+        refresh_daily_rankings(conn, trans_date)
+    conn.commit()
+    return len(dates)
+
+
+def rankings_ready(conn, dates):
+    """
+    檢查指定日期的摘要是否齊全：原始表有資料、摘要表卻沒有的日期視為尚未刷新
+    """
+    exists = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (RANKINGS_TABLE,)
+    ).fetchone()
+    if not exists:
+        return False
+    for trans_date in dates:
+        if conn.execute(SUMMARY_EXISTS_SQL, (trans_date,)).fetchone():
+            continue
+        has_raw = conn.execute(RAW_EXISTS_SQL, (trans_date,)).fetchone()
+        if has_raw:
+            return False
+    return True
+
+
+def _crop_filter(table, crop_names, season_month):
+    """
+    產生作物篩選條件：crop_names 為明確的名單，season_month 則經由作物對照表關聯
+    seasonal_ingredients 的月份遮罩（走對照表主鍵與 idx_si_name），不必把數百個食材名稱綁成參數
+    """
+    clauses, params = [], []
+    if crop_names is not None:
+        name_placeholders = ','.join(['?' for _ in crop_names])
+        clauses.append(f"AND crop_name IN ({name_placeholders})")
+        params += list(crop_names)
+    if season_month is not None:
+        clauses.append(f"""AND EXISTS (
+                SELECT 1 FROM {CROP_MAP_TABLE} m
+                JOIN seasonal_ingredients s ON s.name = m.seasonal_name
+                WHERE m.crop_name = {table}.crop_name AND s.month_mask & ? != 0
+            )""")
+        params.append(month_bit(season_month))
+    return "\n            ".join(clauses), params
+
+
+def top_crops_query(dates, crop_names=None, season_month=None):
+    """
+    query_top_crops 執行的 SQL 與參數
+    """
+    placeholders = ','.join(['?' for _ in dates])
+    query = f"""
+        SELECT {', '.join(RESULT_COLUMNS)}
+        FROM (
+            SELECT *,
+                ROW_NUMBER() OVER (PARTITION BY crop_name ORDER BY trans_quantity DESC) as rn
+            FROM {RANKINGS_TABLE}
+            WHERE trans_date IN ({placeholders})
+            AND trans_quantity > day_median
+            {{}}
+        )
+        WHERE rn = 1
+        ORDER BY trans_quantity DESC
+    """
+    condition, filter_params = _crop_filter(RANKINGS_TABLE, crop_names, season_month)
+    return query.format(condition), list(dates) + filter_params
+
+
+def query_top_crops(conn, dates, crop_names=None, season_month=None):
+    """
+    從摘要表取出指定日期中、交易量高於當日中位數的作物，每個作物只留交易量最大的一筆；
+    指定 season_month 時只留該月當季的作物
+    """
+    return conn.execute(*top_crops_query(dates, crop_names, season_month)).fetchall()
+
+
+def top_crops_legacy_query(dates, crop_names=None, season_month=None):
+    """
+    query_top_crops_legacy 執行的 SQL 與參數
+    """
+    placeholders = ','.join(['?' for _ in dates])
+    query = f"""
+        WITH RankedCrops AS (
+            SELECT
+                {', '.join(RESULT_COLUMNS)},
+                ROW_NUMBER() OVER (PARTITION BY crop_name ORDER BY trans_quantity DESC) as rn
+            FROM product_transactions
+            WHERE trans_quantity > (
+                SELECT trans_quantity
+                FROM product_transactions
+                ORDER BY trans_quantity
+                LIMIT 1
+                OFFSET (
+                    SELECT CAST((COUNT(*) * 0.5) AS INTEGER)
+                    FROM product_transactions
+                )
+            )
+            AND trans_date IN ({placeholders})
+            {{}}
+        )
+        SELECT {', '.join(RESULT_COLUMNS)}
+        FROM RankedCrops
+        WHERE rn = 1
+        ORDER BY trans_quantity DESC
+    """
+    condition, filter_params = _crop_filter("product_transactions", crop_names, season_month)
+    return query.format(condition), list(dates) + filter_params
+
+
+def query_top_crops_legacy(conn, dates, crop_names=None, season_month=None):
+    """
+    舊版查詢：以全表交易量中位數為門檻，直接對 product_transactions 做視窗函數
+    """
+    return conn.execute(*top_crops_legacy_query(dates, crop_names, season_month)).fetchall()
+
+
+def compare_with_legacy(conn, dates, crop_names=None, season_month=None):
+    """
+    比對摘要查詢與舊查詢的結果。
+    兩者的門檻不同（當日中位數 vs 全表中位數），因此只在門檻附近的作物可能一邊有一邊沒有；
+    兩邊都有的作物，選出的那一筆理應相同，列在 mismatched 的作物需要檢查。
+    """
+    summary = {row[2]: row for row in query_top_crops(conn, dates, crop_names, season_month)}
+    legacy = {row[2]: row for row in query_top_crops_legacy(conn, dates, crop_names, season_month)}
+    shared = summary.keys() & legacy.keys()
+    mismatched = sorted(
+        name for name in shared
+        # 交易量相同的並列筆數可能選到不同市場，只比對交易量與日期
+        if (summary[name][0], summary[name][10]) != (legacy[name][0], legacy[name][10])
+    )
+    return {
+        "shared": len(shared),
+        "only_summary": sorted(summary.keys() - legacy.keys()),
+        "only_legacy": sorted(legacy.keys() - summary.keys()),
+        "mismatched": mismatched,
+    }
+
+
+# 手動重建與比對：python crop_rankings.py new.db 114.04.15 114.04.16
+if __name__ == "__main__":
+    database = sys.argv[1] if len(sys.argv) > 1 else "new.db"
+    check_dates = sys.argv[2:]
+    with sqlite3.connect(database) as conn:
+        days = rebuild_all_rankings(conn)
+        print(f"已重建 {days} 天的排行摘要")
+        if check_dates:
+            report = compare_with_legacy(conn, check_dates)
+            print(f"共同作物：{report['shared']}")
+            print(f"僅摘要有：{report['only_summary']}")
+            print(f"僅舊查詢有：{report['only_legacy']}")
+            print(f"不一致：{report['mismatched']}")
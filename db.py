@@ -0,0 +1,146 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from metrics import metrics, sql_labels
+
+# 連線層級的 pragma：WAL 讓讀取不會被寫入擋住，synchronous=NORMAL 在 WAL 下仍能保證一致性
+CONNECTION_PRAGMAS = [
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",        # 約 16 MB 頁面快取
+    "PRAGMA mmap_size = 268435456",      # 256 MB 記憶體映射讀取
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+]
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    每個 execute / executemany 都計時成 sql_statement_seconds；計量關閉時直接呼叫原本的方法
+    """
+
+    def execute(self, sql, parameters=()):
+        if not metrics.enabled:
+            return super().execute(sql, parameters)
+        with metrics.span("sql_statement_seconds", detail=sql.strip(), **sql_labels(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        if not metrics.enabled:
+            return super().executemany(sql, parameters)
+        with metrics.span("sql_statement_seconds", detail=sql.strip(), **sql_labels(sql)):
+            return super().executemany(sql, parameters)
+
+
+class ConnectionPool:
+    """
+    整個 app 共用的 SQLite 連線池。
+    讀取連線以唯讀模式開啟並重複使用；寫入集中在單一連線上，以鎖保證一次只有一個交易。
+    """
+
+    def __init__(self, database, max_readers=8):
+        self.database = database
+        self.max_readers = max_readers
+        self._readers = queue.LifoQueue(maxsize=max_readers)
+        self._writer = None
+        self._write_lock = threading.Lock()
+
+    def _configure(self, conn):
+        conn.text_factory = str  # 確保正確處理中文
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _connect_writer(self):
+        conn = sqlite3.connect(self.database, isolation_level=None, check_same_thread=False,
+                               factory=TimedConnection)
+        # journal_mode 會寫進資料庫檔，之後的讀取連線也會沿用 WAL
+        conn.execute("PRAGMA journal_mode = WAL")
+        return self._configure(conn)
+
+    def _connect_reader(self):
+        uri = f"{Path(self.database).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=TimedConnection)
+        return self._configure(conn)
+
+    def init(self):
+        """
+        先建立寫入連線，讓資料庫切換成 WAL；唯讀連線無法自行切換 journal mode
+        """
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect_writer()
+
+    @contextmanager
+    def read(self):
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            self.init()
+            conn = self._connect_reader()
+        try:
+            yield conn
+        finally:
+            try:
+                self._readers.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        在共用的寫入連線上開啟 IMMEDIATE 交易，離開時 commit，發生例外則 rollback
+        """
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect_writer()
+            conn = self._writer
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# 各資料群組（transactions、seasonal、recipes）的版本號，寫入資料的交易內遞增。
+# ingest.py、crawl_vegetable_prices.py、archive.py 是另外的程序，app 的快取以版本號判斷資料是否已被改寫。
+def create_data_versions_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def bump_data_version(conn, *names):
+    """
+    在目前的交易內遞增資料群組的版本號
+    """
+    conn.executemany("""
+        INSERT INTO data_versions (name, version) VALUES (?, 1)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    """, [(name,) for name in names])
+
+
+def read_data_versions(conn):
+    """
+    回傳 {資料群組: 版本號}；從未寫入過的群組不在其中（視為 0）
+    """
+    return dict(conn.execute("SELECT name, version FROM data_versions").fetchall())
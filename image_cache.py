@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+# 預設快取上限 512 MB，超過時從最久未使用的圖片開始淘汰
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# 各種 workflow 放亂數種子的節點與欄位
+_SEED_INPUTS = {"RandomNoise": "noise_seed", "KSampler": "seed", "KSamplerAdvanced": "noise_seed"}
+
+
+def normalize_prompt(prompt):
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+def workflow_seed(workflow):
+    """
+    從 workflow 找出亂數種子；找不到回傳 None
+    """
+    for node in workflow.values():
+        field = _SEED_INPUTS.get(node.get("class_type"))
+        if field and field in node.get("inputs", {}):
+            return node["inputs"][field]
+    return None
+
+
+def cache_key(prompt, workflow_bytes, seed=None):
+    """
+    以正規化後的 prompt、workflow 檔案內容與種子計算內容定址的快取鍵
+    """
+    material = json.dumps({
+        "prompt": normalize_prompt(prompt),
+        "workflow": hashlib.sha256(workflow_bytes).hexdigest(),
+        "seed": seed,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """
+    持久化的生圖結果快取。
+    ComfyUI 原始輸出存在 cache_dir/blobs/<key>.img，索引（大小、最後使用時間）與命中統計存在 cache_dir/index.json。
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, "blobs")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = None
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._entries = data.get("entries", {})
+                self._stats.update(data.get("stats", {}))
+            except (OSError, ValueError):
+                # 索引損毀時視為空快取，舊檔案會在下次淘汰或覆寫時處理
+                self._entries = {}
+
+    def _save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"entries": self._entries, "stats": self._stats}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def _blob_path(self, key):
+        return os.path.join(self.blob_dir, f"{key}.img")
+
+    def fetch(self, key, dest_path):
+        """
+        命中時把快取的原始圖片複製到 dest_path 並回傳 True；未命中回傳 False
+        """
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            blob_path = self._blob_path(key)
+            if entry is None or not os.path.exists(blob_path):
+                self._entries.pop(key, None)
+                self._stats["misses"] += 1
+                self._save()
+                return False
+            shutil.copyfile(blob_path, dest_path)
+            entry["last_used"] = time.time()
+            entry["hits"] = entry.get("hits", 0) + 1
+            self._stats["hits"] += 1
+            self._save()
+            return True
+
+    def store(self, key, source_path):
+        """
+        將剛下載的原始圖片存入快取，必要時淘汰最久未使用的項目
+        """
+        with self._lock:
+            self._load()
+            os.makedirs(self.blob_dir, exist_ok=True)
+            shutil.copyfile(source_path, self._blob_path(key))
+            self._entries[key] = {
+                "size": os.path.getsize(source_path),
+                "last_used": time.time(),
+                "hits": 0,
+            }
+            self._evict()
+            self._save()
+
+    def _evict(self):
+        total = sum(entry["size"] for entry in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= self._entries.pop(key)["size"]
+            try:
+                os.remove(self._blob_path(key))
+            except FileNotFoundError:
+                pass
+            self._stats["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": sum(entry["size"] for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+            }
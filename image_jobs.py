@@ -0,0 +1,148 @@
+import asyncio
+import threading
+import time
+import uuid
+
+from recipe_md import (
+    IMAGE_DIR, RENDER_TIMEOUT, discard_raw_image, download_image, fetch_cached_image, get_history, image_cache,
+    image_cache_key, image_info, image_pipeline, logger, poll_delays, raw_image_path,
+    record_wait_phases, sanitize_filename, submit_prompt
+)
+
+# 保留最近完成的任務數量，超過時由最舊的開始清除
+MAX_FINISHED_JOBS = 500
+
+
+class ImageJobQueue:
+    """
+    非同步生圖任務佇列。
+    submit() 立即回傳 job_id；背景執行緒中的 asyncio event loop 負責提交、以遞增間隔輪詢
+    ComfyUI 的 history，以及下載圖片，不佔用 Flask worker。
+    """
+
+    def __init__(self, comfyui_api_url, render_timeout=RENDER_TIMEOUT):
+        self.comfyui_api_url = comfyui_api_url
+        self.render_timeout = render_timeout
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="image-jobs", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def submit(self, prompt, recipe_name, workflow_path, on_done=None):
+        """
+        排入一個生圖任務，回傳 job_id。
+        on_done(job) 會在任務完成或失敗後於背景執行緒呼叫。
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "recipe_name": recipe_name,
+            "workflow": workflow_path,
+            "prompt_id": None,
+            "image_url": None,
+            "error": None,
+            "cached": False,
+            "image": None,
+            "created_at": time.time(),
+            "finished_at": None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+        loop = self._ensure_loop()
+        asyncio.run_coroutine_threadsafe(self._run(job, prompt, on_done), loop)
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def wait(self, job_id, timeout=None):
+        """
+        阻塞等待任務結束（供批次流程使用），回傳任務狀態
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for delay in poll_delays(initial=0.05, maximum=0.5):
+            job = self.get(job_id)
+            if job is None or job["status"] in ("done", "failed"):
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                return job
+            time.sleep(delay)
+
+    def _update(self, job, **changes):
+        with self._lock:
+            job.update(changes)
+
+    async def _render(self, job, prompt, raw_path):
+        self._update(job, status="submitting")
+        prompt_id = await asyncio.to_thread(
+            submit_prompt, prompt, self.comfyui_api_url, job["workflow"]
+        )
+        self._update(job, status="rendering", prompt_id=prompt_id)
+
+        waiting_since = time.time()
+        deadline = time.monotonic() + self.render_timeout
+        for delay in poll_delays():
+            result = await asyncio.to_thread(get_history, self.comfyui_api_url, prompt_id)
+            if result is not None:
+                record_wait_phases(result, waiting_since)
+                break
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError(f"ComfyUI 任務逾時：{prompt_id}")
+            await asyncio.sleep(delay)
+
+        self._update(job, status="downloading")
+        await asyncio.to_thread(
+            download_image, self.comfyui_api_url, result, raw_path, job["workflow"]
+        )
+
+    async def _run(self, job, prompt, on_done):
+        raw_path = None
+        try:
+            key = await asyncio.to_thread(image_cache_key, prompt, job["workflow"])
+            raw_path = raw_image_path(job["recipe_name"])
+            if await asyncio.to_thread(fetch_cached_image, key, raw_path):
+                self._update(job, cached=True)
+            else:
+                await self._render(job, prompt, raw_path)
+                await asyncio.to_thread(image_cache.store, key, raw_path)
+
+            # 轉檔在 process pool 執行，event loop 只等待結果
+            self._update(job, status="processing")
+            processed = await asyncio.wrap_future(
+                image_pipeline.submit(raw_path, IMAGE_DIR, sanitize_filename(job["recipe_name"]))
+            )
+            image = image_info(processed)
+            self._update(job, status="done", image_url=image["url"], image=image, finished_at=time.time())
+        except Exception as e:
+            logger.error(f"生圖任務失敗 {job['job_id']}：{str(e)}")
+            discard_raw_image(raw_path)
+            self._update(job, status="failed", error=str(e), finished_at=time.time())
+        finally:
+            self._prune()
+        if on_done is not None:
+            try:
+                on_done(self.get(job["job_id"]))
+            except Exception as e:
+                logger.error(f"生圖任務回呼失敗 {job['job_id']}：{str(e)}")
+
+    def _prune(self):
+        with self._lock:
+            finished = [job for job in self._jobs.values() if job["finished_at"] is not None]
+            if len(finished) <= MAX_FINISHED_JOBS:
+                return
+            finished.sort(key=lambda job: job["finished_at"])
+            for job in finished[:len(finished) - MAX_FINISHED_JOBS]:
+                del self._jobs[job["job_id"]]
@@ -0,0 +1,97 @@
+import base64
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # 沒有安裝 Pillow 時只保留原始圖片，不產生縮圖
+    Image = None
+
+# 響應式圖片寬度；大於原圖寬度的尺寸會略過
+RESPONSIVE_WIDTHS = (320, 640, 1024)
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+PLACEHOLDER_WIDTH = 16
+
+
+def variant_name(base_name, width, ext):
+    return f"{base_name}-{width}.{ext}" if width else f"{base_name}.{ext}"
+
+
+def _atomic_save(image, path, format, **options):
+    # 同名食譜可能同時在不同的 worker 轉檔，暫存檔以程序與執行緒區分
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    image.save(tmp_path, format=format, **options)
+    os.replace(tmp_path, path)
+
+
+def _resize(image, width):
+    height = round(image.height * width / image.width)
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def process_image(src_path, dest_dir, base_name):
+    """
+    把 ComfyUI 輸出的原始圖片（通常是 PNG）轉成正式的 JPEG / WebP、數個響應式寬度與極小的模糊預覽圖。
+    在 process pool 中執行，回傳的結果只包含檔名與字串，方便跨程序傳遞。
+    """
+    main_jpg = variant_name(base_name, None, "jpg")
+    if Image is None:
+        os.replace(src_path, os.path.join(dest_dir, main_jpg))
+        return {"jpg": main_jpg, "width": None, "variants": [], "placeholder": None}
+
+    with Image.open(src_path) as source:
+        image = source.convert("RGB")
+
+    _atomic_save(image, os.path.join(dest_dir, main_jpg), "JPEG",
+                 quality=JPEG_QUALITY, optimize=True, progressive=True)
+    main_webp = variant_name(base_name, None, "webp")
+    _atomic_save(image, os.path.join(dest_dir, main_webp), "WEBP", quality=WEBP_QUALITY, method=4)
+
+    variants = []
+    for width in RESPONSIVE_WIDTHS:
+        if width >= image.width:
+            continue
+        resized = _resize(image, width)
+        jpg = variant_name(base_name, width, "jpg")
+        webp = variant_name(base_name, width, "webp")
+        _atomic_save(resized, os.path.join(dest_dir, jpg), "JPEG",
+                     quality=JPEG_QUALITY, optimize=True, progressive=True)
+        _atomic_save(resized, os.path.join(dest_dir, webp), "WEBP", quality=WEBP_QUALITY, method=4)
+        variants.append({"width": width, "jpg": jpg, "webp": webp})
+    variants.append({"width": image.width, "jpg": main_jpg, "webp": main_webp})
+
+    buffer = io.BytesIO()
+    _resize(image, PLACEHOLDER_WIDTH).save(buffer, format="JPEG", quality=40)
+    placeholder = "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    os.remove(src_path)
+    return {"jpg": main_jpg, "width": image.width, "variants": variants, "placeholder": placeholder}
+
+
+class ImagePipeline:
+    """
+    以 process pool 執行圖片轉檔，避免編碼與縮圖佔用 Flask worker 或 asyncio 迴圈
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, src_path, dest_dir, base_name):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor.submit(process_image, src_path, dest_dir, base_name)
+
+    def process(self, src_path, dest_dir, base_name):
+        return self.submit(src_path, dest_dir, base_name).result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
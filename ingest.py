@@ -0,0 +1,233 @@
+import argparse
+import codecs
+import datetime
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from crop_matching import map_new_crops
+from crop_rankings import refresh_daily_rankings
+from db import bump_data_version
+
+MOA_API_URL = "https://data.moa.gov.tw/api/v1/AgriProductsTransType/"
+BATCH_SIZE = 500
+REQUEST_TIMEOUT = 60
+
+# 以自然鍵 (trans_date, crop_code, market_code, tc_type) 去重；重跑同一天只會更新價格與交易量
+UPSERT_SQL = """
+    INSERT INTO product_transactions (
+        trans_date, crop_code, crop_name, tc_type,
+        market_code, market_name, upper_price, middle_price,
+        lower_price, avg_price, trans_quantity
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (trans_date, crop_code, market_code, tc_type) DO UPDATE SET
+        crop_name = excluded.crop_name,
+        market_name = excluded.market_name,
+        upper_price = excluded.upper_price,
+        middle_price = excluded.middle_price,
+        lower_price = excluded.lower_price,
+        avg_price = excluded.avg_price,
+        trans_quantity = excluded.trans_quantity
+"""
+
+
+def roc_date(day):
+    """
+    西元日期轉民國日期字串，如 2025-04-16 -> 114.04.16
+    """
+    return f"{day.year - 1911}.{day.month:02d}.{day.day:02d}"
+
+
+def item_to_row(item):
+    return (
+        item["TransDate"], item["CropCode"], item["CropName"], item["TcType"],
+        item["MarketCode"], item["MarketName"], item["Upper_Price"], item["Middle_Price"],
+        item["Lower_Price"], item["Avg_Price"], item["Trans_Quantity"]
+    )
+
+
+def iter_json_array(chunks, key="Data"):
+    """
+    逐段解析 {"...": ..., "Data": [ {...}, {...} ]} 形式的回應，每解析完一個陣列元素就立刻產出，
+    不需要先把整個回應讀進記憶體
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    exhausted = False
+
+    def read_more():
+        nonlocal buffer, pos, exhausted
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            exhausted = True
+            return False
+        # 已解析的部分直接丟掉，避免 buffer 無限制成長
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    # 找到 "Data": [
+    marker = f'"{key}"'
+    while True:
+        index = buffer.find(marker, pos)
+        if index != -1:
+            bracket = buffer.find("[", index + len(marker))
+            if bracket != -1:
+                pos = bracket + 1
+                break
+        elif len(buffer) > len(marker):
+            pos = len(buffer) - len(marker)
+        if not read_more():
+            return
+
+    while True:
+        # 略過元素之間的空白與逗號
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buffer):
+            if not read_more():
+                raise ValueError(f"回應在 {key} 陣列結束前中斷")
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # 元素尚未完整，再讀一段
+            if exhausted or not read_more():
+                raise
+            continue
+        pos = end
+        yield item
+
+
+def iter_response_text(response, chunk_size=65536):
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")()
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def fetch_day_rows(session, day, api_url=MOA_API_URL):
+    """
+    下載單日交易資料，串流解析成 tuple 列表（不保留原始回應字串與字典）
+    """
+    date_str = roc_date(day)
+    params = {"Start_time": date_str, "End_time": date_str}
+    with session.get(api_url, params=params, stream=True, timeout=REQUEST_TIMEOUT) as response:
+        response.raise_for_status()
+        return [item_to_row(item) for item in iter_json_array(iter_response_text(response))]
+
+
+def store_rows(db, rows, batch_size=BATCH_SIZE):
+    """
+    單一交易內分批 executemany 寫入，並刷新涉及日期的作物排行摘要與新作物的名稱對照、遞增交易資料版本
+    """
+    if not rows:
+        return 0
+    with db.transaction() as conn:
+        for start in range(0, len(rows), batch_size):
+            conn.executemany(UPSERT_SQL, rows[start:start + batch_size])
+        for trans_date in {row[0] for row in rows}:
+            refresh_daily_rankings(conn, trans_date)
+        # 新出現的作物名稱補上與季節食材的對照
+        map_new_crops(conn, {row[2] for row in rows})
+        bump_data_version(conn, "transactions")
+    return len(rows)
+
+
+def make_session(concurrency):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def ingest_day(db, day, session=None, api_url=MOA_API_URL):
+    """
+    匯入單日資料，回傳寫入筆數
+    """
+    own_session = session is None
+    session = session or make_session(1)
+    try:
+        return store_rows(db, fetch_day_rows(session, day, api_url))
+    finally:
+        if own_session:
+            session.close()
+
+
+def backfill(db, start, end, concurrency=4, api_url=MOA_API_URL):
+    """
+    以有上限的並行下載回補 start ~ end（含）之間每一天的資料，每天一個寫入交易。
+    回傳統計：{"days", "rows", "failed", "seconds", "rows_per_sec"}
+    """
+    days = [start + datetime.timedelta(days=offset) for offset in range((end - start).days + 1)]
+    totals = {"rows": 0}
+    failed = {}
+    lock = threading.Lock()
+    began = time.perf_counter()
+
+    with make_session(concurrency) as session:
+        def run(day):
+            try:
+                count = ingest_day(db, day, session=session, api_url=api_url)
+            except Exception as e:
+                with lock:
+                    failed[roc_date(day)] = str(e)
+                return
+            with lock:
+                totals["rows"] += count
+            print(f"{roc_date(day)}：寫入 {count} 筆")
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(run, days))
+
+    seconds = time.perf_counter() - began
+    return {
+        "days": len(days),
+        "rows": totals["rows"],
+        "failed": failed,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(totals["rows"] / seconds, 1) if seconds > 0 else 0.0,
+    }
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+# 回補多日資料：python ingest.py --start 2025-04-01 --end 2025-04-16
+if __name__ == "__main__":
+    from db import ConnectionPool
+    from migrations import migrate
+
+    today = datetime.date.today()
+    parser = argparse.ArgumentParser(description="匯入農產品交易行情")
+    parser.add_argument("--start", type=parse_date, default=today)
+    parser.add_argument("--end", type=parse_date, default=today)
+    parser.add_argument("--db", default="new.db")
+    parser.add_argument("--api-url", default=MOA_API_URL)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    migrate(args.db)
+    pool = ConnectionPool(args.db)
+    try:
+        stats = backfill(pool, args.start, args.end, args.concurrency, args.api_url)
+    finally:
+        pool.close()
+    print(f"共 {stats['days']} 天、{stats['rows']} 筆，耗時 {stats['seconds']} 秒（{stats['rows_per_sec']} 筆/秒）")
+    for date_str, error in stats["failed"].items():
+        print(f"失敗：{date_str} -> {error}")
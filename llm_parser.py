@@ -0,0 +1,329 @@
+import json
+import re
+import time
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+JSON_FENCE = "```json"
+
+_RECIPES_ARRAY_RE = re.compile(r'"recipes"\s*:\s*\[')
+# 掃描 JSON 物件邊界時只需要停在這幾種字元
+_STRUCTURE_RE = re.compile(r'[{}"\\\]]')
+
+
+def strip_think(text):
+    """
+    移除 <think>...</think> 區塊；以 str.find 單次掃描，沒有正規表示式回溯。
+    未閉合的 <think> 視為其後全部都是思考內容。
+    """
+    parts = []
+    pos = 0
+    while True:
+        start = text.find(THINK_OPEN, pos)
+        if start == -1:
+            parts.append(text[pos:])
+            break
+        parts.append(text[pos:start])
+        end = text.find(THINK_CLOSE, start + len(THINK_OPEN))
+        if end == -1:
+            break
+        pos = end + len(THINK_CLOSE)
+    return "".join(parts)
+
+
+def extract_json_text(text):
+    """
+    取出 JSON 本體：有 ```json 區塊時取區塊內第一個 { 到最後一個 }，否則取整段文字中的範圍
+    """
+    start_at = 0
+    end_at = len(text)
+    fence = text.find(JSON_FENCE)
+    if fence != -1:
+        start_at = fence + len(JSON_FENCE)
+        closing = text.find("```", start_at)
+        if closing != -1:
+            end_at = closing
+    start = text.find("{", start_at, end_at)
+    end = text.rfind("}", start_at, end_at)
+    if start == -1 or end < start:
+        raise ValueError("未找到 JSON 區塊，請確認 LLM 回傳格式")
+    return text[start:end + 1]
+
+
+def loads_lenient(json_str):
+    """
+    先以標準 json.loads 解析，失敗才交給 repair_json 修復
+    """
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        pass
+    # json_repair 只有在需要修復時才載入
+    from json_repair import repair_json
+
+    try:
+        return json.loads(repair_json(json_str))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON 解析錯誤：{e}")
+
+
+def parse_llm_response(llm_response):
+    """
+    解析完整的 LLM 回應，回傳含 recipes 陣列的物件
+    """
+    parsed = loads_lenient(extract_json_text(strip_think(llm_response)))
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("recipes"), list):
+        raise ValueError("缺少 'recipes' 陣列或格式錯誤")
+    return parsed
+
+
+class RecipeStreamParser:
+    """
+    逐段解析 LLM 的串流輸出：即時丟掉 <think> 區塊，找到 "recipes": [ 之後，
+    每個陣列元素的大括號一閉合就解析並產出，不必等整個回應結束。
+
+        parser = RecipeStreamParser()
+        for chunk in stream:
+            for recipe in parser.feed(chunk):
+                ...
+        parser.close()
+    """
+
+    def __init__(self):
+        self._pending = ""      # 可能是被切斷的 <think> / </think> 標籤
+        self._in_think = False
+        self._buffer = ""       # 已去除思考內容、尚未解析的文字
+        self._fenced = False    # 已看到 ```json
+        self._anchored = False  # 已看到 ```json 或第一個 {，之後才找 "recipes": [
+        self._in_array = False
+        self._finished = False
+        # 目前物件的掃描狀態
+        self._object_start = None
+        self._depth = 0
+        self._in_string = False
+        self._scan_pos = 0
+        self.count = 0
+
+    def _visible(self, chunk):
+        # 只保留 <think> 區塊外的文字；標籤可能被切在兩段之間，尾端不完整的部分留到下一段
+        text = self._pending + chunk
+        self._pending = ""
+        output = []
+        pos = 0
+        while pos < len(text):
+            tag = THINK_CLOSE if self._in_think else THINK_OPEN
+            index = text.find(tag, pos)
+            if index == -1:
+                tail = len(text)
+                for size in range(min(len(tag) - 1, len(text) - pos), 0, -1):
+                    if tag.startswith(text[-size:]):
+                        tail = len(text) - size
+                        self._pending = text[tail:]
+                        break
+                if not self._in_think:
+                    output.append(text[pos:tail])
+                break
+            if not self._in_think:
+                output.append(text[pos:index])
+            self._in_think = not self._in_think
+            pos = index + len(tag)
+        return "".join(output)
+
+    def feed(self, chunk):
+        """
+        餵入一段輸出，回傳這段之後新完成的食譜列表
+        """
+        if self._finished:
+            return []
+        self._buffer += self._visible(chunk)
+        recipes = []
+
+        if not self._in_array:
+            # 與 extract_json_text 相同：有 ```json 區塊時只看區塊之內，說明文字裡的 "recipes": [ 不算
+            if not self._fenced:
+                fence = self._buffer.find(JSON_FENCE)
+                if fence != -1:
+                    self._buffer = self._buffer[fence + len(JSON_FENCE):]
+                    self._fenced = self._anchored = True
+            if not self._anchored:
+                brace = self._buffer.find("{")
+                if brace != -1:
+                    self._buffer = self._buffer[brace:]
+                    self._anchored = True
+            match = _RECIPES_ARRAY_RE.search(self._buffer) if self._anchored else None
+            if not match:
+                # 保留可能被切斷的 ```json 或 "recipes": [ 前綴
+                self._buffer = self._buffer[-32:]
+                return recipes
+            self._in_array = True
+            self._buffer = self._buffer[match.end():]
+            self._scan_pos = 0
+
+        buffer = self._buffer
+        pos = self._scan_pos
+        while True:
+            if self._object_start is None:
+                # 元素之間只會有空白、逗號或陣列結尾
+                brace = buffer.find("{", pos)
+                close = buffer.find("]", pos)
+                if close != -1 and (brace == -1 or close < brace):
+                    self._finished = True
+                    buffer = ""
+                    pos = 0
+                    break
+                if brace == -1:
+                    buffer, pos = "", 0
+                    break
+                self._object_start = brace
+                self._depth = 0
+                pos = brace
+
+            match = _STRUCTURE_RE.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+            char = match.group()
+            pos = match.end()
+            if self._in_string:
+                if char == "\\":
+                    if pos >= len(buffer):
+                        # 被跳脫的字元還在下一段，等資料到齊再掃
+                        pos = match.start()
+                        break
+                    pos += 1  # 跳過被跳脫的字元
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    recipes.append(self._decode(buffer[self._object_start:pos]))
+                    self._object_start = None
+
+        # 已產出的部分丟掉，只留下目前物件未完成的文字
+        if self._object_start is not None:
+            buffer = buffer[self._object_start:]
+            pos -= self._object_start
+            self._object_start = 0
+        else:
+            buffer = buffer[pos:]
+            pos = 0
+        self._buffer = buffer
+        self._scan_pos = min(pos, len(buffer))
+        self.count += len(recipes)
+        return recipes
+
+    def _decode(self, text):
+        recipe = loads_lenient(text)
+        if not isinstance(recipe, dict):
+            raise ValueError("recipes 陣列的元素必須是物件")
+        return recipe
+
+    def close(self):
+        """
+        串流結束：回傳被截斷的最後一個物件經修復後的結果（若可修復）；完全找不到 recipes 陣列時丟出 ValueError
+        """
+        if not self._in_array:
+            raise ValueError("未找到 recipes 陣列，請確認 LLM 回傳格式")
+        if self._finished or self._object_start is None:
+            return []
+        try:
+            recipe = self._decode(self._buffer[self._object_start:])
+        except ValueError:
+            return []
+        self._finished = True
+        self.count += 1
+        return [recipe]
+
+
+def iter_recipes(chunks):
+    """
+    對一連串文字片段逐一產出完整的食譜物件
+    """
+    parser = RecipeStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def _legacy_parse(llm_response):
+    from json_repair import repair_json
+
+    # 舊做法：三次正規表示式掃描整段文字，一律先 repair_json 再解析
+    cleaned_response = re.sub(r"<think>.*?</think>", "", llm_response, flags=re.DOTALL)
+    cleaned_response = re.sub(r"\n+", "\n", cleaned_response).strip()
+    json_block_match = re.search(r"```json\s*(\{[\s\S]*\})\s*", cleaned_response)
+    if not json_block_match:
+        raise ValueError("未找到 JSON 區塊，請確認 LLM 回傳格式")
+    return json.loads(repair_json(json_block_match.group(1)))
+
+
+def sample_response(recipe_count=200, think_chars=200_000, broken=False):
+    """
+    產生大型、雜亂的 LLM 回應：很長的 <think> 區塊、前後說明文字、```json 區塊；
+    broken=True 時加入結尾多餘的逗號，需要修復才能解析。回傳 (回應文字, 預期的 recipes)
+    """
+    recipes = [
+        {
+            "name": f"測試食譜{i}",
+            "servings": "適合 4 人的份量",
+            "ingredients": [{"name": f"食材{j}", "amount": str(j + 1), "unit": "克"} for j in range(8)],
+            "steps": [f"步驟 {j}：把材料 {{處理}} 好，注意 \"火候\"。" for j in range(6)],
+            "calories": "每人約 300 卡",
+            "price": "零售價估算（單位：台幣）：120",
+            "image_prompt": "an illustration of a dish, watercolor style, " * 4,
+        }
+        for i in range(recipe_count)
+    ]
+    body = json.dumps({"recipes": recipes}, ensure_ascii=False, indent=2)
+    if broken:
+        body = body.replace('"克"\n', '"克",\n')
+    thinking = ("讓我想想今天的當季食材 { 與 } 價格……\n" * (think_chars // 24))[:think_chars]
+    response = f"<think>{thinking}</think>\n\n以下是今天的菜單：\n\n```json\n{body}\n```\n\n祝您用餐愉快！{{有問題再告訴我}}"
+    return response, recipes
+
+
+def benchmark(response, rounds=5, chunk_size=512):
+    """
+    比較舊做法、快速路徑與串流解析的耗時（毫秒），以及串流模式產出第一道食譜的時間
+    """
+    timings = {}
+    for label, parse in (("legacy", _legacy_parse), ("fast", parse_llm_response)):
+        # 舊做法的貪婪比對會把 ``` 之後的大括號也吃進去，結果可能錯誤，但仍計時
+        started = time.perf_counter()
+        for _ in range(rounds):
+            parse(response)
+        timings[label] = round((time.perf_counter() - started) * 1000 / rounds, 1)
+
+    chunks = [response[i:i + chunk_size] for i in range(0, len(response), chunk_size)]
+    started = time.perf_counter()
+    first = None
+    for _ in range(rounds):
+        parser = RecipeStreamParser()
+        for chunk in chunks:
+            if parser.feed(chunk) and first is None:
+                first = time.perf_counter() - started
+        parser.close()
+    timings["stream"] = round((time.perf_counter() - started) * 1000 / rounds, 1)
+    timings["stream_first_recipe"] = round(first * 1000, 1)
+    return timings
+
+
+# 基準測試：python llm_parser.py
+if __name__ == "__main__":
+    for broken in (False, True):
+        response, expected = sample_response(broken=broken)
+        legacy = _legacy_parse(response)
+        assert parse_llm_response(response)["recipes"] == expected
+        assert list(iter_recipes(response[i:i + 7] for i in range(0, len(response), 7))) == expected
+        timings = benchmark(response)
+        label = "需修復的回應" if broken else "標準 JSON 回應"
+        print(f"{label}（{len(response) // 1024} KB，{len(expected)} 道食譜）")
+        legacy_ok = isinstance(legacy, dict) and legacy.get("recipes") == expected
+        print(f"    舊做法：{timings['legacy']} ms（結果{'正確' if legacy_ok else '錯誤'}）")
+        print(f"    快速路徑：{timings['fast']} ms")
+        print(f"    串流解析：{timings['stream']} ms，第一道食譜 {timings['stream_first_recipe']} ms 產出")
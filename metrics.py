@@ -0,0 +1,231 @@
+import bisect
+import collections
+import contextlib
+import contextvars
+import functools
+import os
+import re
+import threading
+import time
+import uuid
+
+# 設定環境變數 METRICS_ENABLED=0 可關閉所有計時；關閉時 span() 只回傳共用的空 context manager
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+# 延遲直方圖的桶（秒）：涵蓋 SQL 的毫秒級到 ComfyUI 生圖的分鐘級
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# 保留最近的請求追蹤筆數，以及單一追蹤最多記錄的 span 數
+MAX_TRACES = 100
+MAX_TRACE_SPANS = 2000
+# 請求帶這個標頭（值為 1）時記錄該請求的所有 span，回應以 X-Trace-Id 告知追蹤編號
+TRACE_HEADER = "X-Trace"
+
+_SQL_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_NOOP = contextlib.nullcontext()
+
+
+def sql_labels(sql):
+    """
+    SQL 的標籤只取語句種類與第一個資料表，避免每種參數組合都變成一條時間序列
+    """
+    sql = sql.lstrip()
+    op = sql.split(None, 1)[0].upper() if sql else ""
+    match = _SQL_TABLE_RE.search(sql)
+    return {"op": op, "table": match.group(1) if match else ""}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+class Metrics:
+    """
+    程序內的計量登錄：延遲直方圖與計數器，輸出 Prometheus 文字格式。
+    span() 同時把耗時記到直方圖，並在有追蹤中的請求時附加到該請求的追蹤紀錄。
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}   # (名稱, 標籤) → [各桶計數, 總和, 次數]
+        self._counters = {}     # (名稱, 標籤) → 數值
+        self._help = {}
+        self._traces = collections.OrderedDict()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def span(self, name, detail=None, **labels):
+        """
+        計時區塊：with metrics.span("comfyui_phase_seconds", phase="render"): ...
+        detail 只寫進追蹤紀錄（例如完整 SQL），不當作標籤
+        """
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, name, detail, labels)
+
+    def record(self, name, seconds, ended_ago=0.0, detail=None, **labels):
+        """
+        記錄已量好的耗時（例如從 ComfyUI 的時間戳推算的排隊時間）；ended_ago 為該段在幾秒前結束
+        """
+        if not self.enabled:
+            return
+        self.observe(name, seconds, **labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            self._record(trace, name, labels, detail, time.perf_counter() - ended_ago - seconds, seconds)
+
+    def _record(self, trace, name, labels, detail, started, elapsed):
+        spans = trace["spans"]
+        if len(spans) >= MAX_TRACE_SPANS:
+            trace["dropped"] += 1
+            return
+        span = {
+            "name": name,
+            **labels,
+            "start_ms": round((started - trace["started"]) * 1000, 3),
+            "duration_ms": round(elapsed * 1000, 3),
+            "thread": threading.current_thread().name,
+        }
+        if detail is not None:
+            span["detail"] = detail
+        spans.append(span)
+
+    def start_trace(self, **info):
+        """
+        開始記錄目前 context 的追蹤，回傳 (追蹤紀錄, 還原用的 token)
+        """
+        trace = {"trace_id": uuid.uuid4().hex, **info, "started": time.perf_counter(),
+                 "spans": [], "dropped": 0, "duration_ms": None}
+        with self._lock:
+            self._traces[trace["trace_id"]] = trace
+            while len(self._traces) > MAX_TRACES:
+                self._traces.popitem(last=False)
+        return trace, _current_trace.set(trace)
+
+    def finish_trace(self, trace, token):
+        trace["duration_ms"] = round((time.perf_counter() - trace["started"]) * 1000, 3)
+        _current_trace.reset(token)
+
+    def get_trace(self, trace_id):
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None:
+                return None
+            return {key: value for key, value in trace.items() if key != "started"}
+
+    def recent_traces(self):
+        with self._lock:
+            return [
+                {key: trace[key] for key in ("trace_id", "method", "path", "status", "duration_ms")
+                 if key in trace} | {"spans": len(trace["spans"])}
+                for trace in reversed(self._traces.values())
+            ]
+
+    def render(self):
+        """
+        輸出 Prometheus 文字格式（text/plain; version=0.0.4）
+        """
+        with self._lock:
+            histograms = {key: (list(value[0]), value[1], value[2]) for key, value in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        for name in sorted({key[0] for key in counters}):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        for name in sorted({key[0] for key in histograms}):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(bounds, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels, {'le': bound})} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class _Span:
+    # 以類別實作 context manager，比 contextlib.contextmanager 的產生器少一半以上的成本
+    __slots__ = ("metrics", "name", "detail", "labels", "started")
+
+    def __init__(self, metrics, name, detail, labels):
+        self.metrics = metrics
+        self.name = name
+        self.detail = detail
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        self.metrics.observe(self.name, elapsed, **self.labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            self.metrics._record(trace, self.name, self.labels, self.detail, self.started, elapsed)
+        return False
+
+
+def propagate(fn):
+    """
+    讓交給執行緒池的函式沿用呼叫端的追蹤 context（ThreadPoolExecutor 不會自動複製 contextvars）
+    """
+    if _current_trace.get() is None:
+        return fn
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # 同一個 Context 不能同時在多個執行緒 run，每次呼叫各自複製一份
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+metrics = Metrics()
+metrics.describe("http_request_duration_seconds", "Flask 路由的處理時間")
+metrics.describe("http_requests_total", "Flask 路由的請求數")
+metrics.describe("sql_statement_seconds", "SQLite 語句的執行時間（不含取回結果）")
+metrics.describe("comfyui_phase_seconds", "ComfyUI 生圖各階段的耗時：submit、queue_wait、render、download")
+metrics.describe("recipe_stage_seconds", "食譜產生各階段的耗時：convert、markdown_write、image_finalize")
+metrics.describe("git_operation_seconds", "發布食譜時 git add / commit / push 的耗時")
@@ -0,0 +1,450 @@
+import re
+import sqlite3
+import sys
+
+from crop_matching import CROP_MAPPINGS_SQL, MAPPED_CROPS_SQL, MARKET_CROPS_SQL, MATCHER_NAMES_SQL
+from crop_rankings import (
+    DAY_MEDIAN_SQL, INSERT_TOP_ROWS_SQL, RAW_EXISTS_SQL, SUMMARY_EXISTS_SQL, top_crops_legacy_query, top_crops_query,
+)
+from recipe_search import STATIC_INDEX_SQL, search_query
+from recipe_store import CHILD_TABLES, DELETE_CHILDREN_SQL, LOAD_SQL, RECIPE_ID_SQL, SET_RENDERED_HASH_SQL
+from seasonal import SEASONAL_NAMES_SQL, SEASONAL_ROWS_SQL
+
+# 資料庫結構版本以 PRAGMA user_version 記錄，每個 migration 只會套用一次。
+# 新增結構變更時請在 MIGRATIONS 末端追加，不要修改已發布的版本。
+# 每個 migration 的 SQL 與資料轉換都寫死在這裡，不呼叫其他模組目前的函式：
+# 之後改動那些函式，舊版資料庫升級時的結果也不會跟著改變。
+
+
+def _create_base_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS product_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trans_date TEXT,           -- 交易日期 (民國格式，如 114.04.11)
+            crop_code TEXT,            -- 作物代碼
+            crop_name TEXT,            -- 作物名稱
+            tc_type TEXT,              -- 交易類別代碼 (如 N05)
+            market_code TEXT,          -- 市場代碼
+            market_name TEXT,          -- 市場名稱
+            upper_price REAL,          -- 上價
+            middle_price REAL,         -- 中價
+            lower_price REAL,          -- 下價
+            avg_price REAL,            -- 平均價
+            trans_quantity REAL,       -- 交易量
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP  -- 建立時間
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS seasonal_ingredients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            type TEXT,
+            month_start INTEGER,
+            month_end INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS crop_daily_rankings (
+            trans_date TEXT NOT NULL,
+            crop_name TEXT NOT NULL,
+            crop_code TEXT,
+            tc_type TEXT,
+            market_code TEXT,
+            market_name TEXT,
+            upper_price REAL,
+            middle_price REAL,
+            lower_price REAL,
+            avg_price REAL,
+            trans_quantity REAL,
+            day_median REAL,           -- 當天所有交易量的中位數
+            PRIMARY KEY (trans_date, crop_name)
+        ) WITHOUT ROWID
+    """)
+
+
+def _create_indexes(conn):
+    # trans_date IN (?, ?) 與排行刷新都以日期為前綴；帶上 crop_name、trans_quantity 讓分組與排序不必回表
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pt_date_crop_quantity
+        ON product_transactions (trans_date, crop_name, trans_quantity)
+    """)
+    # SELECT DISTINCT crop_name 與 crop_name IN (...) 使用
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pt_crop_date
+        ON product_transactions (crop_name, trans_date)
+    """)
+    # 舊版 /seasonal_top50 查詢的全表中位數子查詢使用
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pt_quantity
+        ON product_transactions (trans_quantity)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_si_name
+        ON seasonal_ingredients (name)
+    """)
+
+
+def _backfill_rankings(conn):
+    # 既有交易日的排行摘要一次補齊，之後由 fetch_and_store_data 逐日刷新：
+    # 每天交易量排序後第 floor(筆數 / 2) 筆為中位數，每種作物取當天交易量最大的一筆
+    conn.execute("DELETE FROM crop_daily_rankings")
+    conn.execute("""
+        WITH ordered AS (
+            SELECT trans_date, trans_quantity,
+                ROW_NUMBER() OVER (PARTITION BY trans_date ORDER BY trans_quantity) - 1 AS position,
+                COUNT(*) OVER (PARTITION BY trans_date) AS total
+            FROM product_transactions
+        ),
+        medians AS (
+            SELECT trans_date, trans_quantity AS day_median
+            FROM ordered
+            WHERE position = CAST((total * 0.5) AS INTEGER)
+        ),
+        top_rows AS (
+            SELECT *,
+                ROW_NUMBER() OVER (PARTITION BY trans_date, crop_name ORDER BY trans_quantity DESC) AS rn
+            FROM product_transactions
+            WHERE crop_name IS NOT NULL
+        )
+        INSERT INTO crop_daily_rankings (
+            trans_date, crop_name, crop_code, tc_type, market_code, market_name,
+            upper_price, middle_price, lower_price, avg_price, trans_quantity, day_median
+        )
+        SELECT
+            t.trans_date, t.crop_name, t.crop_code, t.tc_type, t.market_code, t.market_name,
+            t.upper_price, t.middle_price, t.lower_price, t.avg_price, t.trans_quantity, m.day_median
+        FROM top_rows t
+        JOIN medians m ON m.trans_date = t.trans_date
+        WHERE t.rn = 1
+    """)
+
+
+def _add_natural_key(conn):
+    # 重複匯入同一天會產生重複列，保留最後一次匯入的那筆後再建立唯一索引
+    conn.execute("""
+        DELETE FROM product_transactions
+        WHERE id NOT IN (
+            SELECT MAX(id)
+            FROM product_transactions
+            GROUP BY trans_date, crop_code, market_code, tc_type
+        )
+    """)
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_pt_natural_key
+        ON product_transactions (trans_date, crop_code, market_code, tc_type)
+    """)
+    # 去重後中位數會改變，排行摘要重算一次
+    _backfill_rankings(conn)
+
+
+def _month_mask_v5(month_start, month_end):
+    # 第 n 月對應第 n - 1 位元；起始月大於結束月表示跨年，例如 11 月到隔年 2 月
+    if month_start is None or month_end is None:
+        return 0
+    if month_start <= month_end:
+        months = range(month_start, month_end + 1)
+    else:
+        months = [month for month in range(1, 13) if month >= month_start or month <= month_end]
+    mask = 0
+    for month in months:
+        mask |= 1 << (month - 1)
+    return mask
+
+
+def _add_month_mask(conn):
+    # 當季判斷改成位元運算，查詢時不必在 Python 逐筆比較起訖月份
+    conn.execute("ALTER TABLE seasonal_ingredients ADD COLUMN month_mask INTEGER NOT NULL DEFAULT 0")
+    rows = conn.execute("SELECT id, month_start, month_end FROM seasonal_ingredients").fetchall()
+    conn.executemany(
+        "UPDATE seasonal_ingredients SET month_mask = ? WHERE id = ?",
+        [(_month_mask_v5(start, end), row_id) for row_id, start, end in rows],
+    )
+
+
+def _create_crop_map(conn):
+    # 市場作物名稱（甘藍-初秋）與季節食材名稱（甘藍）的對照，取代人工 LIKE 比對；
+    # 對照內容由 apply_migrations 在全部 migration 套用後重算（見 DERIVED_DATA）
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS crop_seasonal_map (
+            crop_name TEXT NOT NULL,       -- product_transactions.crop_name
+            seasonal_name TEXT NOT NULL,   -- seasonal_ingredients.name
+            score REAL NOT NULL,
+            method TEXT NOT NULL,
+            PRIMARY KEY (crop_name, seasonal_name)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_csm_seasonal
+        ON crop_seasonal_map (seasonal_name)
+    """)
+
+
+def _create_recipe_store(conn):
+    # 產生的食譜改存成結構化資料（食譜、食材、步驟、封面），Markdown 由資料重新輸出；
+    # 既有的 Markdown 以 python recipe_store.py import 匯入
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recipes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL UNIQUE,   -- content/recipes 下的檔名
+            title TEXT NOT NULL,
+            publish_date TEXT NOT NULL,      -- front matter 的 date (YYYY-MM-DD)
+            draft INTEGER NOT NULL DEFAULT 0,
+            description TEXT NOT NULL,
+            tags TEXT NOT NULL DEFAULT '[]', -- JSON 陣列
+            servings TEXT,
+            calories TEXT,
+            price TEXT,
+            image_prompt TEXT,
+            rendered_hash TEXT,              -- 最後一次寫出的 Markdown sha256
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recipe_ingredients (
+            recipe_id INTEGER NOT NULL REFERENCES recipes (id),
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            amount TEXT NOT NULL DEFAULT '',
+            unit TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (recipe_id, position)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_ri_name
+        ON recipe_ingredients (name)
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recipe_steps (
+            recipe_id INTEGER NOT NULL REFERENCES recipes (id),
+            position INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (recipe_id, position)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recipe_images (
+            recipe_id INTEGER PRIMARY KEY REFERENCES recipes (id),
+            url TEXT NOT NULL,
+            srcset TEXT,
+            webp_srcset TEXT,
+            placeholder TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _create_recipe_search(conn):
+    # 食譜標題、食材與步驟的 FTS5 trigram 全文檢索，補上既有食譜（食材與步驟各以換行串接）
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS recipe_search USING fts5(
+            title, ingredients, steps, tokenize = 'trigram'
+        )
+    """)
+    conn.execute("DELETE FROM recipe_search")
+    conn.execute("""
+        INSERT INTO recipe_search (rowid, title, ingredients, steps)
+        SELECT r.id, r.title,
+            (SELECT group_concat(name, char(10)) FROM (
+                SELECT name FROM recipe_ingredients WHERE recipe_id = r.id ORDER BY position)),
+            (SELECT group_concat(text, char(10)) FROM (
+                SELECT text FROM recipe_steps WHERE recipe_id = r.id ORDER BY position))
+        FROM recipes r
+    """)
+
+
+def _create_data_versions(conn):
+    # 資料群組的版本號：另一個程序（ingest.py、封存）寫入後，app 的回應快取與價格快照據此失效
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _remap_crops(conn):
+    # 食譜成本估算的同義詞併入 crop_matching.CROP_SYNONYMS（地瓜 → 甘薯 等），依新的同義詞重算對照；
+    # 結構不變，重算交給 DERIVED_DATA
+    pass
+
+
+MIGRATIONS = [
+    (1, "建立 product_transactions、seasonal_ingredients 與每日排行摘要表", _create_base_tables),
+    (2, "建立查詢用的複合與覆蓋索引", _create_indexes),
+    (3, "回填每日作物排行摘要", _backfill_rankings),
+    (4, "移除重複交易列並建立自然鍵唯一索引", _add_natural_key),
+    (5, "季節食材新增月份位元遮罩欄位", _add_month_mask),
+    (6, "建立作物名稱與季節食材的對照表", _create_crop_map),
+    (7, "建立結構化食譜資料表", _create_recipe_store),
+    (8, "建立食譜全文檢索表", _create_recipe_search),
+    (9, "建立資料版本表", _create_data_versions),
+    (10, "統一同義詞表後重算作物對照", _remap_crops),
+]
+
+
+def _rebuild_crop_map(conn):
+    from crop_matching import rebuild_crop_map
+
+    rebuild_crop_map(conn)
+
+
+# 由目前的程式重算、無法寫死成 SQL 的衍生資料：作物對照依 crop_matching 的比對規則與同義詞表產生。
+# 套用到這些版本時，等全部 migration 完成（結構已是最新）才以目前的程式重算一次
+DERIVED_DATA = {
+    6: ("作物對照", _rebuild_crop_map),
+    10: ("作物對照", _rebuild_crop_map),
+}
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn):
+    """
+    依序套用尚未執行的 migration，回傳套用後的版本號
+    """
+    version = current_version(conn)
+    rebuilds = {}
+    for target, description, step in MIGRATIONS:
+        if target <= version:
+            continue
+        try:
+            conn.execute("BEGIN")
+            step(conn)
+            # PRAGMA 不接受參數綁定，target 來自上方常數
+            conn.execute(f"PRAGMA user_version = {int(target)}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"已套用資料庫 migration {target}：{description}")
+        version = target
+        if target in DERIVED_DATA:
+            name, rebuild = DERIVED_DATA[target]
+            rebuilds[name] = rebuild
+
+    for name, rebuild in rebuilds.items():
+        try:
+            conn.execute("BEGIN")
+            rebuild(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"已重算{name}")
+    return version
+
+
+def migrate(database):
+    conn = sqlite3.connect(database, isolation_level=None)
+    try:
+        return apply_migrations(conn)
+    finally:
+        conn.close()
+
+
+# 檢查用的代表性參數
+SAMPLE_DATES = ["114.04.16", "114.04.15"]
+SAMPLE_MONTH = 4
+SAMPLE_FILENAME = "2025-04-17-094927_番茄炒蛋.md"
+
+
+def _check(name, query, allow_scan=False):
+    sql, params = query
+    return {"name": name, "sql": sql, "params": params, "allow_scan": allow_scan}
+
+
+def query_checks():
+    """
+    程式實際執行的 SQL（模組常數與組 SQL 的函式，以代表性參數展開），供 EXPLAIN QUERY PLAN 檢查。
+    allow_scan 表示查詢本身就要讀整張表（例如取出全部季節食材），掃表是預期行為。
+    """
+    # 這幾個模組會載入 numpy，app 啟動時匯入 migrations 不應連帶載入
+    from archive import ARCHIVE_SQL
+    from cost_engine import LATEST_DATES_SQL, LOOKBACK_DATES, snapshot_query
+    from price_analytics import history_query
+
+    date = SAMPLE_DATES[0]
+    return [
+        _check("seasonal.rows", (SEASONAL_ROWS_SQL, []), allow_scan=True),
+        _check("seasonal.names", (SEASONAL_NAMES_SQL, []), allow_scan=True),
+        _check("crop_matching.market_crops", (MARKET_CROPS_SQL, [])),
+        _check("crop_matching.mapped_crops", (MAPPED_CROPS_SQL, []), allow_scan=True),
+        _check("crop_matching.mappings", (CROP_MAPPINGS_SQL, ["甘藍-初秋"])),
+        _check("crop_matching.matcher_names", (MATCHER_NAMES_SQL, [])),
+        _check("crop_rankings.day_median", (DAY_MEDIAN_SQL, [date, date])),
+        _check("crop_rankings.insert_top_rows", (INSERT_TOP_ROWS_SQL, [0, date])),
+        _check("crop_rankings.summary_exists", (SUMMARY_EXISTS_SQL, [date])),
+        _check("crop_rankings.raw_exists", (RAW_EXISTS_SQL, [date])),
+        _check("crop_rankings.top_crops", top_crops_query(SAMPLE_DATES)),
+        _check("crop_rankings.top_crops_month", top_crops_query(SAMPLE_DATES, season_month=SAMPLE_MONTH)),
+        _check("crop_rankings.legacy_month", top_crops_legacy_query(SAMPLE_DATES, season_month=SAMPLE_MONTH)),
+        _check("price_analytics.history", history_query(), allow_scan=True),
+        _check("price_analytics.history_dates", history_query(SAMPLE_DATES)),
+        _check("cost_engine.latest_dates", (LATEST_DATES_SQL, [LOOKBACK_DATES])),
+        _check("cost_engine.snapshot", snapshot_query(SAMPLE_DATES)),
+        _check("archive.month", (ARCHIVE_SQL, ["114.01.01", "114.01.31"])),
+        _check("recipe_store.recipe_id", (RECIPE_ID_SQL, [SAMPLE_FILENAME])),
+        _check("recipe_store.set_rendered_hash", (SET_RENDERED_HASH_SQL, ["", SAMPLE_FILENAME])),
+        *(_check(f"recipe_store.delete_{table}", (DELETE_CHILDREN_SQL.format(table), [1]))
+          for table in CHILD_TABLES),
+        *(_check(f"recipe_store.load_{name}", (sql, []), allow_scan=True) for name, sql in LOAD_SQL.items()),
+        _check("recipe_search.match", search_query(["番茄炒蛋"])),
+        _check("recipe_search.like", search_query(["蛋"])),
+        _check("recipe_search.mixed", search_query(["番茄炒蛋", "蛋"])),
+        _check("recipe_search.mixed_any", search_query(["番茄炒蛋", "蛋"], mode="any")),
+        _check("recipe_search.static_index", (STATIC_INDEX_SQL, []), allow_scan=True),
+    ]
+
+
+CHECKED_TABLES = {
+    "product_transactions", "seasonal_ingredients", "crop_daily_rankings", "crop_seasonal_map",
+    "recipes", "recipe_ingredients", "recipe_steps", "recipe_images",
+}
+
+# 新版 SQLite 輸出 "SCAN t"，舊版輸出 "SCAN TABLE t"；後面接 USING ... INDEX 的是索引掃描
+_TABLE_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(?! USING)\s*$")
+
+
+def explain_query_plan(conn, sql, params):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def find_table_scans(conn, checks=None):
+    """
+    回傳會對 CHECKED_TABLES 做全表掃描的查詢：[(查詢名稱, 查詢計畫細節), ...]
+    """
+    if checks is None:
+        checks = query_checks()
+    problems = []
+    for check in checks:
+        if check.get("allow_scan"):
+            continue
+        for detail in explain_query_plan(conn, check["sql"], check["params"]):
+            match = _TABLE_SCAN_RE.match(detail)
+            if match and match.group(1) in CHECKED_TABLES:
+                problems.append((check["name"], detail))
+    return problems
+
+
+# 套用 migration 並檢查查詢計畫：python migrations.py new.db --check-plans
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    database = args[0] if args else "new.db"
+    version = migrate(database)
+    print(f"資料庫版本：{version}")
+    if "--check-plans" in sys.argv:
+        with sqlite3.connect(database) as conn:
+            for check in query_checks():
+                print(f"[{check['name']}]")
+                for detail in explain_query_plan(conn, check["sql"], check["params"]):
+                    print(f"    {detail}")
+            problems = find_table_scans(conn)
+        if problems:
+            for name, detail in problems:
+                print(f"全表掃描：{name} -> {detail}")
+            sys.exit(1)
+        print("所有查詢皆使用索引")
@@ -0,0 +1,421 @@
+import datetime
+import sqlite3
+import sys
+import threading
+import time
+import warnings
+
+import numpy as np
+
+# 預設的比較視窗（日曆天）；休市日在矩陣中是 NaN，不計入平均與標準差
+DEFAULT_WINDOW = 28
+SHORT_WINDOW = 7
+# 今日價格低於近期平均超過此標準差倍數，視為特價
+BARGAIN_ZSCORE = -1.0
+# 近期觀測值少於此數時不計算 z 分數，避免兩三筆資料就判定特價
+MIN_OBSERVATIONS = 5
+
+HISTORY_SQL = """
+    SELECT trans_date, crop_name, market_code, avg_price, trans_quantity
+    FROM product_transactions
+    WHERE crop_name IS NOT NULL AND avg_price IS NOT NULL {}
+"""
+
+
+def history_query(trans_dates=None):
+    """
+    PriceHistory 讀取交易資料的 SQL 與參數；不指定日期時讀取整張表
+    """
+    if trans_dates is None:
+        return HISTORY_SQL.format(""), []
+    placeholders = ','.join(['?' for _ in trans_dates])
+    return HISTORY_SQL.format(f"AND trans_date IN ({placeholders})"), list(trans_dates)
+
+
+def parse_roc_date(value):
+    """
+    民國日期字串轉西元日期，如 114.04.16 -> 2025-04-16
+    """
+    year, month, day = value.split(".")
+    return datetime.date(int(year) + 1911, int(month), int(day))
+
+
+def _nanmean(values, axis=1):
+    # 整列都是 NaN（期間內沒有交易）時回傳 NaN，不發出 RuntimeWarning
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return np.nanmean(values, axis=axis)
+
+
+def _nanstd(values, axis=1):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return np.nanstd(values, axis=axis)
+
+
+def rolling_mean(matrix, window):
+    """
+    對 (序列, 日) 矩陣逐列計算忽略 NaN 的移動平均；以累加和一次算完，不逐日迴圈
+    """
+    observed = ~np.isnan(matrix)
+    sums = np.cumsum(np.where(observed, matrix, 0.0), axis=1)
+    counts = np.cumsum(observed, axis=1)
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    counts[:, window:] = counts[:, window:] - counts[:, :-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def window_metrics(matrix, end, window=DEFAULT_WINDOW):
+    """
+    以第 end 天為基準，對矩陣每一列計算價格指標，回傳各欄位等長的 NumPy 陣列：
+    today（當天價格，休市為 NaN）、mean_short（近 7 天平均）、mean_window（近 window 天平均）、
+    wow_change（近 7 天平均相對前 7 天的漲跌幅）、volatility（window 天內的變異係數）、
+    zscore（當天價格相對前 window 天的標準分數）、observations（window 天內有交易的天數）
+    """
+    start = max(0, end - window + 1)
+    recent = matrix[:, start:end + 1]
+    baseline = matrix[:, start:end]
+    today = matrix[:, end]
+
+    this_week = _nanmean(matrix[:, max(0, end - SHORT_WINDOW + 1):end + 1])
+    last_week = _nanmean(matrix[:, max(0, end - 2 * SHORT_WINDOW + 1):max(0, end - SHORT_WINDOW + 1)])
+    mean_window = _nanmean(recent)
+    baseline_mean = _nanmean(baseline)
+    baseline_std = _nanstd(baseline)
+    observations = np.count_nonzero(~np.isnan(baseline), axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        wow_change = this_week / last_week - 1
+        volatility = _nanstd(recent) / mean_window
+        zscore = np.where(
+            (observations >= MIN_OBSERVATIONS) & (baseline_std > 0),
+            (today - baseline_mean) / baseline_std,
+            np.nan,
+        )
+    return {
+        "today": today,
+        "mean_short": this_week,
+        "mean_window": mean_window,
+        "wow_change": wow_change,
+        "volatility": volatility,
+        "zscore": zscore,
+        "observations": observations + ~np.isnan(today),
+    }
+
+
+def _clean(value, digits=4):
+    # NaN 轉成 None，JSON 才會輸出 null
+    value = float(value)
+    return None if np.isnan(value) else round(value, digits)
+
+
+class PriceHistory:
+    """
+    交易資料的欄式快取：原始列以整數代碼（日序、作物、市場）存成 NumPy 欄位，
+    再彙整成 (作物, 日) 與 (作物×市場, 日) 兩個價格矩陣；作物層級以交易量加權平均各市場價格。
+    匯入新資料後呼叫 invalidate(dates)，下一次查詢只重新讀取這幾天的資料並重建矩陣；
+    ensure_loaded 帶入的資料版本與「上次版本 + 同程序匯入次數」不符時（其他程序匯入或封存），整份重新載入。
+    指定 archive（archive.Archive）時，完整載入會一併讀入已封存月份的欄位檔。
+    """
+
+    def __init__(self, archive=None):
+        self.archive = archive
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._version = None
+        self._stale_dates = set()
+        self._own_writes = 0  # invalidate(dates) 的次數：同程序每次匯入各遞增一次交易資料版本
+        # 字串 → 整數代碼的字典，跨多次載入沿用
+        self._date_codes = {}
+        self._crop_codes = {}
+        self._market_codes = {}
+        self._crop_list = []
+        self._market_list = []
+        self._columns = None
+        self._rebuild()
+
+    # ---- 載入 ----
+
+    def _encode(self, values, codes, names=None):
+        for value in set(values) - codes.keys():
+            if names is None:
+                codes[value] = parse_roc_date(value).toordinal()
+            else:
+                codes[value] = len(names)
+                names.append(value)
+        return np.fromiter(map(codes.__getitem__, values), dtype=np.int64, count=len(values))
+
+    def encode(self, dates, crops, markets, prices, quantities):
+        """
+        把逐欄的原始值（民國日期、作物名稱、市場代碼、價格、交易量）轉成整數代碼欄位
+        """
+        return {
+            "day": self._encode(dates, self._date_codes),
+            "crop": self._encode(crops, self._crop_codes, self._crop_list),
+            "market": self._encode([market or "" for market in markets], self._market_codes, self._market_list),
+            "price": np.array(prices, dtype=np.float64),
+            "quantity": np.nan_to_num(np.array(quantities, dtype=np.float64)),
+        }
+
+    def _read(self, conn, trans_dates=None):
+        rows = conn.execute(*history_query(trans_dates)).fetchall()
+        if not rows:
+            return None
+        return self.encode(*zip(*rows))
+
+    def _read_archive(self, live):
+        # 封存的代碼表轉成本快取的代碼：只對代碼表逐項查詢，逐列的轉換是陣列索引
+        part = self.archive.scan(columns=["day", "crop", "market", "avg_price", "trans_quantity"])
+        keep = ~np.isnan(part["avg_price"])
+        if live is not None:
+            # 封存後尚未刪除的月份兩邊都有，以 SQLite 為準
+            keep &= ~np.isin(part["day"], np.unique(live["day"]))
+        if not keep.any():
+            return live
+        crop_map = self._encode(self.archive.crop_names(), self._crop_codes, self._crop_list)
+        market_map = self._encode([code or "" for code in self.archive.market_codes()],
+                                  self._market_codes, self._market_list)
+        archived = {
+            "day": part["day"][keep].astype(np.int64),
+            "crop": crop_map[part["crop"][keep]],
+            "market": market_map[part["market"][keep]],
+            "price": part["avg_price"][keep].astype(np.float64),
+            "quantity": np.nan_to_num(part["trans_quantity"][keep].astype(np.float64)),
+        }
+        if live is None:
+            return archived
+        return {name: np.concatenate([archived[name], live[name]]) for name in live}
+
+    def set_columns(self, columns):
+        """
+        以 encode() 產生的欄位取代快取內容並重建矩陣
+        """
+        self._columns = columns
+        self._rebuild()
+        self._loaded = True
+
+    def ensure_loaded(self, conn, version=None):
+        """
+        version 為交易資料的版本號（db.read_data_versions）；None 表示不檢查
+        """
+        with self._lock:
+            # 即使有標記的交易日也要比對版本：同時有其他程序寫入時，版本會超過同程序匯入的次數
+            if version is not None and (self._version is None or version != self._version + self._own_writes):
+                self._loaded = False
+            self._version = version
+            self._own_writes = 0
+            if not self._loaded:
+                columns = self._read(conn)
+                if self.archive is not None:
+                    columns = self._read_archive(columns)
+                self.set_columns(columns)
+                self._stale_dates.clear()
+            elif self._stale_dates:
+                dates = sorted(self._stale_dates)
+                fresh = self._read(conn, dates)
+                columns = self._columns
+                if columns is not None:
+                    stale_days = [parse_roc_date(value).toordinal() for value in dates]
+                    keep = ~np.isin(columns["day"], stale_days)
+                    columns = {name: values[keep] for name, values in columns.items()}
+                if fresh is not None:
+                    columns = fresh if columns is None else {
+                        name: np.concatenate([columns[name], fresh[name]]) for name in fresh
+                    }
+                self.set_columns(columns)
+                self._stale_dates.clear()
+
+    def invalidate(self, trans_dates=None):
+        """
+        標記需要重新讀取的交易日；不指定日期時下一次查詢整份重新載入
+        """
+        with self._lock:
+            if trans_dates is None:
+                self._loaded = False
+            else:
+                self._stale_dates.update(trans_dates)
+                self._own_writes += 1
+
+    # ---- 矩陣 ----
+
+    def _rebuild(self):
+        columns = self._columns
+        self.crop_names = np.array(self._crop_list, dtype=object)
+        self.market_codes = np.array(self._market_list, dtype=object)
+        if columns is None or len(columns["price"]) == 0:
+            self.dates = []
+            self.crop_prices = np.empty((len(self.crop_names), 0))
+            self.series_crop = np.array([], dtype=np.int64)
+            self.series_market = np.array([], dtype=object)
+            self.series_prices = np.empty((0, 0))
+            return
+
+        first_day = int(columns["day"].min())
+        day_count = int(columns["day"].max()) - first_day + 1
+        day = columns["day"] - first_day
+        self.dates = [datetime.date.fromordinal(first_day + offset) for offset in range(day_count)]
+
+        crop = columns["crop"]
+        price = columns["price"]
+        weight = columns["quantity"]
+        self.crop_prices = self._aggregate(crop, day, price, weight, len(self.crop_names), day_count)
+
+        market_count = max(len(self.market_codes), 1)
+        pairs, series = np.unique(crop * market_count + columns["market"], return_inverse=True)
+        self.series_crop = pairs // market_count
+        self.series_market = self.market_codes[pairs % market_count]
+        self.series_prices = self._aggregate(series, day, price, weight, len(pairs), day_count)
+
+    @staticmethod
+    def _aggregate(row_index, day, price, weight, row_count, day_count):
+        # 同一格有多筆時以交易量加權平均；交易量全為 0 時退回簡單平均
+        flat = row_index * day_count + day
+        size = row_count * day_count
+        weighted = np.bincount(flat, weights=price * weight, minlength=size)
+        weights = np.bincount(flat, weights=weight, minlength=size)
+        plain = np.bincount(flat, weights=price, minlength=size)
+        counts = np.bincount(flat, minlength=size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            matrix = np.where(weights > 0, weighted / weights, plain / counts)
+        return matrix.reshape(row_count, day_count)
+
+    # ---- 查詢 ----
+
+    def _day_index(self, as_of):
+        if not self.dates:
+            return None
+        if as_of is None:
+            return len(self.dates) - 1
+        offset = as_of.toordinal() - self.dates[0].toordinal()
+        if offset < 0:
+            return None
+        return min(offset, len(self.dates) - 1)
+
+    def crop_metrics(self, window=DEFAULT_WINDOW, as_of=None, market_code=None):
+        """
+        回傳每個作物（或指定市場的作物）在 as_of 當天的價格指標列表
+        """
+        with self._lock:
+            return self._crop_metrics(window, as_of, market_code)
+
+    def _crop_metrics(self, window, as_of, market_code):
+        end = self._day_index(as_of)
+        if end is None:
+            return []
+        if market_code is None:
+            names = self.crop_names
+            metrics = window_metrics(self.crop_prices, end, window)
+        else:
+            selected = self.series_market == market_code
+            names = self.crop_names[self.series_crop[selected]]
+            metrics = window_metrics(self.series_prices[selected], end, window)
+
+        results = []
+        for i, name in enumerate(names):
+            if metrics["observations"][i] == 0:
+                continue
+            results.append({
+                "crop_name": name,
+                "market_code": market_code,
+                "date": self.dates[end].isoformat(),
+                "price_today": _clean(metrics["today"][i], 2),
+                f"mean_{SHORT_WINDOW}d": _clean(metrics["mean_short"][i], 2),
+                f"mean_{window}d": _clean(metrics["mean_window"][i], 2),
+                "wow_change": _clean(metrics["wow_change"][i]),
+                "volatility": _clean(metrics["volatility"][i]),
+                "zscore": _clean(metrics["zscore"][i], 3),
+                "observations": int(metrics["observations"][i]),
+            })
+        return results
+
+    def bargains(self, threshold=BARGAIN_ZSCORE, window=DEFAULT_WINDOW, as_of=None, limit=20):
+        """
+        當天價格明顯低於近期平均的作物，z 分數由低到高排序
+        """
+        found = [
+            item for item in self.crop_metrics(window, as_of)
+            if item["zscore"] is not None and item["zscore"] <= threshold
+        ]
+        found.sort(key=lambda item: item["zscore"])
+        return found[:limit]
+
+    def history(self, crop_name, window=SHORT_WINDOW, market_code=None, days=None):
+        """
+        單一作物的每日價格與移動平均；休市日價格為 None
+        """
+        with self._lock:
+            return self._history(crop_name, window, market_code, days)
+
+    def _history(self, crop_name, window, market_code, days):
+        if market_code is None:
+            rows = np.flatnonzero(self.crop_names == crop_name)
+            matrix = self.crop_prices
+        else:
+            crop_rows = np.flatnonzero(self.crop_names == crop_name)
+            rows = np.flatnonzero(np.isin(self.series_crop, crop_rows) & (self.series_market == market_code))
+            matrix = self.series_prices
+        if len(rows) == 0:
+            return None
+        prices = matrix[rows[:1]]
+        averages = rolling_mean(prices, window)[0]
+        prices = prices[0]
+        start = 0 if days is None else max(0, len(self.dates) - days)
+        return {
+            "crop_name": crop_name,
+            "market_code": market_code,
+            "window": window,
+            "dates": [day.isoformat() for day in self.dates[start:]],
+            "prices": [_clean(value, 2) for value in prices[start:]],
+            "rolling_mean": [_clean(value, 2) for value in averages[start:]],
+        }
+
+
+def synthetic_rows(rows, crops=800, markets=10, days=3 * 365, seed=0):
+    """
+    產生指定列數的隨機交易資料（逐欄），用來量測大資料量下的計算時間
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime.date(2022, 1, 1)
+    date_keys = [
+        f"{day.year - 1911}.{day.month:02d}.{day.day:02d}"
+        for day in (start + datetime.timedelta(days=offset) for offset in range(days))
+    ]
+    crop_keys = [f"作物{i}" for i in range(crops)]
+    market_keys = [f"{i:03d}" for i in range(markets)]
+    crop = rng.integers(0, crops, rows)
+    return (
+        [date_keys[i] for i in rng.integers(0, days, rows)],
+        [crop_keys[i] for i in crop],
+        [market_keys[i] for i in rng.integers(0, markets, rows)],
+        20 + crop % 50 + rng.normal(0, 5, rows).clip(-15),
+        rng.integers(1, 5000, rows).astype(np.float64),
+    )
+
+
+# 量測載入與計算時間：python price_analytics.py new.db，或 python price_analytics.py --synthetic 2000000
+if __name__ == "__main__":
+    history = PriceHistory()
+    if "--synthetic" in sys.argv:
+        row_count = int(sys.argv[sys.argv.index("--synthetic") + 1])
+        raw = synthetic_rows(row_count)
+        started = time.perf_counter()
+        columns = history.encode(*raw)
+        encoded = time.perf_counter()
+        history.set_columns(columns)
+        print(f"編碼 {row_count} 列：{encoded - started:.3f} 秒，建立矩陣：{time.perf_counter() - encoded:.3f} 秒")
+    else:
+        database = sys.argv[1] if len(sys.argv) > 1 else "new.db"
+        started = time.perf_counter()
+        with sqlite3.connect(database) as conn:
+            history.ensure_loaded(conn)
+        print(f"載入：{len(history.crop_names)} 種作物，{len(history.dates)} 天，{time.perf_counter() - started:.3f} 秒")
+
+    started = time.perf_counter()
+    metrics = history.crop_metrics()
+    print(f"計算 {len(metrics)} 種作物的指標：{time.perf_counter() - started:.3f} 秒")
+    started = time.perf_counter()
+    found = history.bargains()
+    print(f"特價作物 {len(found)} 種：{time.perf_counter() - started:.3f} 秒")
+    for item in found[:10]:
+        print(f"    {item['crop_name']} z={item['zscore']} 今日 {item['price_today']}")
@@ -0,0 +1,252 @@
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MARKDOWN_DIR = os.path.join("content", "recipes")
+IMAGE_DIR = os.path.join("static", "images", "recipes")
+# 前端搜尋索引隨食譜一起發布，沒有變更的分片不會進 commit
+SEARCH_INDEX_DIR = os.path.join("static", "search")
+
+# 最後一次送出後再等 DEBOUNCE_SECONDS 沒有新的請求才發布；持續有請求時最多等 MAX_WAIT_SECONDS
+DEBOUNCE_SECONDS = 2.0
+MAX_WAIT_SECONDS = 30.0
+# 保留最近完成的發布任務數量
+MAX_FINISHED_JOBS = 500
+
+
+def recipe_paths(repo_path, filenames):
+    """
+    依食譜檔名找出要發布的檔案（相對於儲存庫根目錄）：markdown 本身，
+    同名的封面圖（含 WebP 與各寬度版本），以及前端搜尋索引。只列出目錄一次。
+    """
+    try:
+        image_names = sorted(os.listdir(os.path.join(repo_path, IMAGE_DIR)))
+    except FileNotFoundError:
+        image_names = []
+
+    paths = []
+    for filename in filenames:
+        md_path = os.path.join(MARKDOWN_DIR, filename)
+        if os.path.exists(os.path.join(repo_path, md_path)):
+            paths.append(md_path)
+
+        if "_" in filename:
+            image_base = filename.split("_", 1)[1][:-len(".md")]
+            for image_name in image_names:
+                stem = os.path.splitext(image_name)[0]
+                base, _, width = stem.rpartition("-")
+                if stem == image_base or (base == image_base and width.isdigit()):
+                    paths.append(os.path.join(IMAGE_DIR, image_name))
+
+    if paths:
+        try:
+            paths += [os.path.join(SEARCH_INDEX_DIR, name)
+                      for name in sorted(os.listdir(os.path.join(repo_path, SEARCH_INDEX_DIR)))
+                      if name.endswith(".json")]
+        except FileNotFoundError:
+            pass
+    return paths
+
+
+class Publisher:
+    """
+    合併多次 /push-to-remote 的背景發布佇列。
+    submit() 立即回傳 job_id；背景執行緒等請求停歇（debounce）後，把這段期間所有任務的檔案
+    以一次 git add 加入索引，只針對這些路徑 commit，再 push 一次。不掃描整個工作目錄。
+    """
+
+    def __init__(self, repo_path, remote="origin", branch="master",
+                 debounce=DEBOUNCE_SECONDS, max_wait=MAX_WAIT_SECONDS):
+        self.repo_path = repo_path
+        self.remote = remote
+        self.branch = branch
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self._jobs = {}
+        self._pending = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="publisher", daemon=True)
+            self._thread.start()
+
+    def submit(self, filenames):
+        """
+        排入發布任務，回傳 job_id；找不到任何檔案時回傳 None
+        """
+        paths = recipe_paths(self.repo_path, filenames)
+        if not paths:
+            return None
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "files": list(filenames),
+            "paths": paths,
+            "commit": None,
+            "batch_size": None,
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None,
+        }
+        with self._condition:
+            self._jobs[job_id] = job
+            self._pending.append(job)
+            self._ensure_worker()
+            self._condition.notify()
+        return job_id
+
+    def get(self, job_id):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def wait(self, job_id, timeout=None):
+        """
+        阻塞等待任務結束，回傳任務狀態
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None or job["finished_at"] is not None:
+                    return dict(job) if job else None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return dict(job)
+                self._condition.wait(remaining)
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            first_at = time.monotonic()
+            while True:
+                last_at = max(job["created_at"] for job in self._pending)
+                quiet = self.debounce - (time.time() - last_at)
+                limit = self.max_wait - (time.monotonic() - first_at)
+                if quiet <= 0 or limit <= 0:
+                    break
+                self._condition.wait(min(quiet, limit))
+            batch, self._pending = self._pending, []
+            for job in batch:
+                job["status"] = "publishing"
+                job["batch_size"] = len(batch)
+            return batch
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                result = self.publish([path for job in batch for path in job["paths"]],
+                                      [name for job in batch for name in job["files"]])
+                changes = {"status": "done" if result else "nothing", "commit": result}
+            except Exception as e:
+                logger.error(f"發布失敗：{str(e)}")
+                changes = {"status": "failed", "error": str(e)}
+            with self._condition:
+                for job in batch:
+                    job.update(changes, finished_at=time.time())
+                self._prune()
+                self._condition.notify_all()
+
+    def _unpushed(self, git):
+        """
+        本機分支領先遠端的 commit 數；遠端分支還不存在時視為有未推送的 commit
+        """
+        from git import GitCommandError
+
+        try:
+            return int(git.rev_list("--count", f"{self.remote}/{self.branch}..{self.branch}"))
+        except GitCommandError:
+            return 1
+
+    def publish(self, paths, filenames):
+        """
+        加入並 commit 指定路徑後 push，回傳 commit hash；這些路徑沒有變更且沒有未推送的 commit 時回傳 None。
+        上一次 push 失敗留在本機的 commit，下一次發布時即使沒有新變更也會一併推送；push 失敗時拋出例外
+        """
+        # GitPython 載入要幾十毫秒，只在真的發布時才匯入
+        from git import Repo
+
+        paths = sorted(set(paths))
+        git = Repo(self.repo_path).git
+        with metrics.span("git_operation_seconds", operation="add"):
+            git.add("--", *paths)
+            staged = git.diff("--cached", "--name-only", "--", *paths)
+        if staged:
+            with metrics.span("git_operation_seconds", operation="commit"):
+                git.commit("-m", f"Add recipe markdown and image files: {', '.join(filenames)}", "--", *paths)
+        elif not self._unpushed(git):
+            return None
+        commit = git.rev_parse("HEAD")
+        with metrics.span("git_operation_seconds", operation="push"):
+            git.push(self.remote, self.branch)
+        logger.info(f"已發布 {len(paths) if staged else 0} 個檔案：{commit}")
+        return commit
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job["finished_at"] is not None]
+        if len(finished) <= MAX_FINISHED_JOBS:
+            return
+        finished.sort(key=lambda job: job["finished_at"])
+        for job in finished[:len(finished) - MAX_FINISHED_JOBS]:
+            del self._jobs[job["job_id"]]
+
+
+# 以本機 bare repo 當遠端手動驗證：python publisher.py
+if __name__ == "__main__":
+    from git import Repo
+
+    logging.basicConfig(level=logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        remote_path = os.path.join(tmp, "remote.git")
+        work_path = os.path.join(tmp, "site")
+        subprocess.run(["git", "init", "--bare", "-q", "-b", "master", remote_path], check=True)
+        repo = Repo.clone_from(remote_path, work_path)
+        with repo.config_writer() as config:
+            config.set_value("user", "name", "publisher")
+            config.set_value("user", "email", "publisher@localhost")
+        os.makedirs(os.path.join(work_path, MARKDOWN_DIR))
+        os.makedirs(os.path.join(work_path, IMAGE_DIR))
+        # 不相關的未追蹤檔案不應被加入
+        with open(os.path.join(work_path, "scratch.txt"), "w") as f:
+            f.write("scratch")
+
+        publisher = Publisher(work_path, debounce=0.3)
+        job_ids = []
+        for i, name in enumerate(["番茄炒蛋", "麻婆豆腐", "三杯雞"]):
+            filename = f"2025-04-16-12000{i}_{name}.md"
+            with open(os.path.join(work_path, MARKDOWN_DIR, filename), "w", encoding="utf-8") as f:
+                f.write(f"# {name}\n")
+            for image_name in (f"{name}.jpg", f"{name}-320.jpg", f"{name}.webp"):
+                with open(os.path.join(work_path, IMAGE_DIR, image_name), "wb") as f:
+                    f.write(b"image")
+            job_ids.append(publisher.submit([filename]))
+
+        results = [publisher.wait(job_id, timeout=30) for job_id in job_ids]
+        remote = Repo(remote_path)
+        commits = list(remote.iter_commits("master"))
+        files = sorted(commits[0].stats.files)
+        print(f"任務狀態：{[job['status'] for job in results]}，批次大小：{results[0]['batch_size']}")
+        print(f"遠端 commit 數：{len(commits)}，檔案數：{len(files)}")
+        for path in files:
+            print(f"    {path}")
+        assert len(commits) == 1 and len(files) == 12 and "scratch.txt" not in files
+        assert all(job["status"] == "done" and job["commit"] == commits[0].hexsha for job in results)
+
+        # 沒有變更時不產生新的 commit
+        again = publisher.wait(publisher.submit(results[0]["files"]), timeout=30)
+        print(f"重複發布：{again['status']}")
+        assert again["status"] == "nothing"
+    print("OK")
@@ -0,0 +1,267 @@
+import datetime
+import hashlib
+import os
+import random
+import re
+import sys
+import threading
+import unicodedata
+
+from crop_matching import normalize_name
+from recipe_index import parse_recipe_filename
+from text_convert import convert_text
+
+# MinHash 簽章長度與 LSH 分段：NUM_PERM = BANDS * ROWS_PER_BAND
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20250416)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+# 相似度達 DUPLICATE_THRESHOLD 視為重複；達 SIMILAR_THRESHOLD 只標記為相似，照常產生
+DUPLICATE_THRESHOLD = 0.8
+SIMILAR_THRESHOLD = 0.5
+# 標題完全相同時，食材簽章也重疊達此比例才直接判定重複；同名但食材不同的做法照一般相似度計算
+TITLE_INGREDIENT_OVERLAP = 0.5
+# 只和最近這些天內發布的食譜比對；更早做過的菜可以再出現
+DUPLICATE_WINDOW_DAYS = 90
+
+# 幾乎每道菜都會用到的調味料與基本材料，不列入食材簽章
+PANTRY_INGREDIENTS = {
+    "鹽", "糖", "砂糖", "白糖", "水", "清水", "油", "食用油", "沙拉油", "橄欖油", "香油", "麻油",
+    "醬油", "米酒", "胡椒", "胡椒粉", "白胡椒粉", "太白粉", "蠔油", "味精", "雞粉",
+}
+
+# front matter 與食材清單的格式見 recipe_store.RECIPE_TEMPLATE
+_FRONT_MATTER_RE = re.compile(r'^(\w+): "(.*)"$', re.MULTILINE)
+_INGREDIENT_SECTION_RE = re.compile(r"^## 🧾 食材準備.*?$(.*?)^(?:---|## )", re.MULTILINE | re.DOTALL)
+_INGREDIENT_LINE_RE = re.compile(r"^- (.+?)：", re.MULTILINE)
+_TITLE_STRIP_RE = re.compile(r"[\s\W_]+")
+
+
+def normalize_title(title):
+    """
+    標題正規化：全形轉半形、簡轉繁、去掉空白與標點
+    """
+    text = unicodedata.normalize("NFKC", title or "")
+    return _TITLE_STRIP_RE.sub("", convert_text(text))
+
+
+def ingredient_names(items):
+    """
+    LLM 回傳的食材清單取出名稱；食材可能是 {"name": ...} 或單純字串，缺名稱的項目略過
+    """
+    names = []
+    for item in items or []:
+        name = item.get("name") if isinstance(item, dict) else item
+        if name:
+            names.append(str(name))
+    return names
+
+
+def ingredient_signature(names):
+    """
+    食材名稱正規化成主名（大蒜-軟梗、蒜頭 → 大蒜），並去掉調味料，回傳集合
+    """
+    signature = set()
+    for name in names:
+        base, _ = normalize_name(name)
+        if base and base not in PANTRY_INGREDIENTS:
+            signature.add(base)
+    return signature
+
+
+def recipe_tokens(title, ingredient_names):
+    # 標題的字元 bigram 加上食材主名；同名不同做法、或換名字的同一道菜都會有大量重疊
+    normalized = normalize_title(title)
+    tokens = {f"t:{normalized[i:i + 2]}" for i in range(max(len(normalized) - 1, 1))}
+    tokens |= {f"i:{name}" for name in ingredient_signature(ingredient_names)}
+    return tokens
+
+
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def minhash(tokens):
+    hashes = [_token_hash(token) for token in tokens] or [0]
+    return tuple(
+        min((a * value + b) % _MERSENNE_PRIME for value in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def parse_recipe_markdown(markdown):
+    """
+    從 recipe_md 產生的 Markdown 取出標題、食材名稱與封面圖片欄位
+    """
+    fields = dict(_FRONT_MATTER_RE.findall(markdown.split("\n---", 1)[0] if markdown.startswith("---") else ""))
+    section = _INGREDIENT_SECTION_RE.search(markdown)
+    ingredients = _INGREDIENT_LINE_RE.findall(section.group(1)) if section else []
+    image = None
+    if fields.get("cover"):
+        image = {"url": fields["cover"]}
+        if fields.get("coverPlaceholder"):
+            image.update(
+                srcset=fields.get("coverSrcset", ""),
+                webp_srcset=fields.get("coverWebpSrcset", ""),
+                placeholder=fields["coverPlaceholder"],
+            )
+    return fields.get("title", ""), ingredients, image
+
+
+class RecipeFingerprints:
+    """
+    已發布食譜的指紋索引：正規化標題的雜湊表，加上 MinHash 簽章的 LSH 分段索引找近似重複。
+    第一次查詢時掃描目錄；之後由 remember() / forget() 逐筆維護，目錄 mtime 改變時只解析新出現的檔案。
+    發布時間（檔名的時間戳記）早於 window_days 天的食譜不參與比對。
+    """
+
+    def __init__(self, recipe_dir, window_days=DUPLICATE_WINDOW_DAYS):
+        self.recipe_dir = recipe_dir
+        self.window_days = window_days
+        self._lock = threading.Lock()
+        self._entries = {}        # 檔名 → {title, tokens, ingredients, signature, published, image}
+        self._by_title = {}       # 正規化標題 → 檔名集合
+        self._buckets = {}        # (分段序號, 分段雜湊) → 檔名集合
+        self._dir_mtime = None
+        self._scanned = False
+
+    def _dir_state(self):
+        try:
+            return os.stat(self.recipe_dir).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _bands(self, signature):
+        for band in range(BANDS):
+            yield band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+
+    def _add(self, filename, title, ingredient_names, image):
+        self._remove(filename)
+        tokens = recipe_tokens(title, ingredient_names)
+        signature = minhash(tokens)
+        parsed = parse_recipe_filename(filename)
+        self._entries[filename] = {
+            "title": title,
+            "tokens": tokens,
+            "ingredients": {token for token in tokens if token.startswith("i:")},
+            "signature": signature,
+            "published": parsed[0] if parsed else None,
+            "image": image,
+        }
+        self._by_title.setdefault(normalize_title(title), set()).add(filename)
+        for key in self._bands(signature):
+            self._buckets.setdefault(key, set()).add(filename)
+
+    def _remove(self, filename):
+        entry = self._entries.pop(filename, None)
+        if entry is None:
+            return
+        self._by_title.get(normalize_title(entry["title"]), set()).discard(filename)
+        for key in self._bands(entry["signature"]):
+            self._buckets.get(key, set()).discard(filename)
+
+    def refresh(self):
+        mtime = self._dir_state()
+        if self._scanned and mtime == self._dir_mtime:
+            return
+        with self._lock:
+            filenames = set(os.listdir(self.recipe_dir)) if mtime is not None else set()
+            filenames = {name for name in filenames if name.endswith(".md") and not name.startswith("_")}
+            for filename in self._entries.keys() - filenames:
+                self._remove(filename)
+            for filename in filenames - self._entries.keys():
+                try:
+                    with open(os.path.join(self.recipe_dir, filename), "r", encoding="utf-8") as f:
+                        title, ingredients, image = parse_recipe_markdown(f.read())
+                except (OSError, UnicodeDecodeError):
+                    continue
+                self._add(filename, title, ingredients, image)
+            self._dir_mtime = mtime
+            self._scanned = True
+
+    def remember(self, filename, title, ingredient_names, image=None):
+        """
+        登記剛寫出（或更新封面）的食譜，不必重新掃描目錄
+        """
+        with self._lock:
+            self._add(filename, title, ingredient_names, image)
+            if self._scanned:
+                self._dir_mtime = self._dir_state()
+
+    def set_image(self, filename, image):
+        with self._lock:
+            if filename in self._entries:
+                self._entries[filename]["image"] = image
+
+    def forget(self, filename):
+        with self._lock:
+            self._remove(filename)
+            if self._scanned:
+                self._dir_mtime = self._dir_state()
+
+    def _score(self, tokens, ingredients, entry, exact_title):
+        # 同名且食材大致相同才算同一道菜；同名不同食材（例如換了主要蔬菜）以整體相似度計算
+        if exact_title and jaccard(ingredients, entry["ingredients"]) >= TITLE_INGREDIENT_OVERLAP:
+            return 1.0
+        return jaccard(tokens, entry["tokens"])
+
+    def check(self, title, ingredient_names, refresh=True, now=None):
+        """
+        回傳與最近 window_days 天內食譜的比對結果（now 預設為現在）：
+        {"decision": "duplicate" | "similar" | "new", "match": 檔名, "similarity": 0~1, "image": 既有封面}
+        """
+        if refresh:
+            self.refresh()
+        tokens = recipe_tokens(title, ingredient_names)
+        ingredients = {token for token in tokens if token.startswith("i:")}
+        signature = minhash(tokens)
+        cutoff = (now or datetime.datetime.now()) - datetime.timedelta(days=self.window_days)
+        with self._lock:
+            exact_titles = set(self._by_title.get(normalize_title(title), set()))
+            candidates = set(exact_titles)
+            for key in self._bands(signature):
+                candidates |= self._buckets.get(key, set())
+
+            # LSH 只負責找候選，分數以實際的 token 集合計算；同分時取檔名較新的
+            scored = [
+                (self._score(tokens, ingredients, entry, filename in exact_titles), filename)
+                for filename, entry in ((filename, self._entries[filename]) for filename in candidates)
+                if entry["published"] is None or entry["published"] >= cutoff
+            ]
+            best_score, best = max(scored, default=(0.0, None))
+            image = self._entries[best]["image"] if best else None
+
+        if best_score >= DUPLICATE_THRESHOLD:
+            decision = "duplicate"
+        elif best_score >= SIMILAR_THRESHOLD:
+            decision = "similar"
+        else:
+            decision, best, image = "new", None, None
+        return {"decision": decision, "match": best, "similarity": round(best_score, 3), "image": image}
+
+
+# 依時間順序列出目錄內的重複食譜：python recipe_dedup.py content/recipes/
+if __name__ == "__main__":
+    recipe_dir = sys.argv[1] if len(sys.argv) > 1 else "content/recipes/"
+    index = RecipeFingerprints(recipe_dir)
+    filenames = sorted(name for name in os.listdir(recipe_dir) if name.endswith(".md") and not name.startswith("_"))
+    duplicates = 0
+    for filename in filenames:
+        with open(os.path.join(recipe_dir, filename), "r", encoding="utf-8") as f:
+            title, ingredients, image = parse_recipe_markdown(f.read())
+        parsed = parse_recipe_filename(filename)
+        result = index.check(title, ingredients, refresh=False, now=parsed[0] if parsed else None)
+        if result["decision"] != "new":
+            duplicates += result["decision"] == "duplicate"
+            print(f"{result['decision']:<9} {result['similarity']:.2f} {filename} ≈ {result['match']}")
+        index.remember(filename, title, ingredients, image)
+    print(f"共 {len(filenames)} 篇，重複 {duplicates} 篇")
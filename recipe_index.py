@@ -0,0 +1,106 @@
+import bisect
+import datetime
+import os
+import re
+import threading
+
+# 檔案名稱格式: YYYY-MM-DD-HHMMSS_菜名.md
+RECIPE_FILENAME_RE = re.compile(r"(\d{4}-\d{2}-\d{2}-\d{6})_(.+)\.md$")
+
+
+def parse_recipe_filename(filename):
+    """
+    解析食譜檔名，回傳 (時間, 菜名)；格式不符回傳 None
+    """
+    match = RECIPE_FILENAME_RE.match(filename)
+    if not match:
+        return None
+    timestamp_str, recipe_name = match.groups()
+    try:
+        return datetime.datetime.strptime(timestamp_str, "%Y-%m-%d-%H%M%S"), recipe_name
+    except ValueError:
+        return None  # 無效日期格式，跳過
+
+
+class RecipeCatalog:
+    """
+    依時間排序的食譜索引。
+    第一次查詢時掃描目錄建立索引，之後由 recipe_to_md 逐筆加入；
+    目錄 mtime 改變（例如手動新增或刪除檔案）時才重新掃描。
+    """
+
+    def __init__(self, recipe_dir):
+        self.recipe_dir = recipe_dir
+        self._lock = threading.Lock()
+        self._timestamps = []
+        self._entries = []  # 與 _timestamps 對齊的 (菜名, 檔名)
+        self._filenames = set()
+        self._dir_mtime = None
+        self._scanned = False
+
+    def _dir_state(self):
+        try:
+            return os.stat(self.recipe_dir).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _rescan(self, mtime):
+        items = []
+        if mtime is not None:
+            for filename in os.listdir(self.recipe_dir):
+                parsed = parse_recipe_filename(filename)
+                if parsed:
+                    items.append((parsed[0], parsed[1], filename))
+        items.sort()
+        self._timestamps = [item[0] for item in items]
+        self._entries = [(item[1], item[2]) for item in items]
+        self._filenames = {item[2] for item in items}
+        self._dir_mtime = mtime
+        self._scanned = True
+
+    def refresh(self):
+        mtime = self._dir_state()
+        if not self._scanned or mtime != self._dir_mtime:
+            with self._lock:
+                if not self._scanned or mtime != self._dir_mtime:
+                    self._rescan(mtime)
+
+    def add(self, filename):
+        """
+        新寫入的食譜直接插入索引，不必重新掃描目錄
+        """
+        parsed = parse_recipe_filename(filename)
+        if not parsed:
+            return
+        with self._lock:
+            if not self._scanned:
+                # 還沒建立過索引，交給下一次查詢完整掃描
+                return
+            if filename not in self._filenames:
+                index = bisect.bisect_right(self._timestamps, parsed[0])
+                self._timestamps.insert(index, parsed[0])
+                self._entries.insert(index, (parsed[1], filename))
+                self._filenames.add(filename)
+            # 目錄的變動來自自己寫入的檔案，不需要觸發重新掃描
+            self._dir_mtime = self._dir_state()
+
+    def remove(self, filename):
+        with self._lock:
+            if filename in self._filenames:
+                index = next(i for i, entry in enumerate(self._entries) if entry[1] == filename)
+                del self._timestamps[index]
+                del self._entries[index]
+                self._filenames.discard(filename)
+            if self._scanned:
+                self._dir_mtime = self._dir_state()
+
+    def recent(self, days, now=None):
+        """
+        回傳最近 days 天內的不重複菜名，新的在前
+        """
+        self.refresh()
+        cutoff = (now or datetime.datetime.now()) - datetime.timedelta(days=days)
+        with self._lock:
+            start = bisect.bisect_left(self._timestamps, cutoff)
+            names = [name for name, _ in reversed(self._entries[start:])]
+        return list(dict.fromkeys(names))
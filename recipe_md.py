@@ -1,186 +1,432 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import contextlib
 import os
 import uuid
-import opencc
-import json
 import re
 import logging
-import requests
+import tempfile
+import threading
 from pathlib import Path
 import time
 import traceback
-
-
-# 設置日誌記錄
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from image_cache import ImageCache, cache_key
+from workflows import WorkflowRegistry
+from image_pipeline import ImagePipeline
+from text_convert import convert_text, convert_tree
+from recipe_index import RecipeCatalog
+from recipe_dedup import RecipeFingerprints, ingredient_names
+from recipe_store import atomic_write, content_hash, cover_front_matter, new_record, render_recipe
+from metrics import metrics, propagate
+from concurrent.futures import ThreadPoolExecutor
+
+
+# 日誌格式由呼叫端設定（app.create_app 或各 CLI）；匯入本模組不會改動 logging
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
 logger = logging.getLogger(__name__)
 
 # 設定 Markdown 檔案儲存路徑
 RECIPE_DIR = 'content/recipes/'
 IMAGE_DIR = 'static/images/recipes/'
+# 前端搜尋用的分片索引
+SEARCH_INDEX_DIR = 'static/search/'
+# 生圖快取（不進版控），相同 prompt + workflow + 種子直接重用圖片
+IMAGE_CACHE_DIR = '.image_cache/'
+IMAGE_URL_PREFIX = "https://www.youraichefs.com/images/recipes/"
 comfyui_api_url = "http://localhost:8188/prompt"
 
-# 確保目錄存在
-try:
-    os.makedirs(RECIPE_DIR, exist_ok=True)
-    os.makedirs(IMAGE_DIR, exist_ok=True)
-    logger.info(f"確保目錄存在：{RECIPE_DIR}, {IMAGE_DIR}")
-except Exception as e:
-    logger.error(f"無法創建目錄：{str(e)}")
-    raise
+# ComfyUI 請求逾時、渲染等待上限與輪詢間隔（秒）
+HTTP_TIMEOUT = 30
+RENDER_TIMEOUT = 600
+POLL_INITIAL_DELAY = 0.2
+POLL_MAX_DELAY = 2.0
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# 單篇寫入後等這麼多秒沒有新的寫入才重新輸出前端搜尋索引，連續寫入只輸出一次
+SEARCH_INDEX_DEBOUNCE = 2.0
+
+
+def init(store=None):
+    """
+    建立輸出目錄並設定結構化食譜資料庫（recipe_store.RecipeStore，None 表示只寫 Markdown）；
+    匯入時不做任何檔案系統操作，由 app.create_app 或 CLI 在啟動時呼叫
+    """
+    global recipe_store
+    recipe_store = store
+    try:
+        os.makedirs(RECIPE_DIR, exist_ok=True)
+        os.makedirs(IMAGE_DIR, exist_ok=True)
+        logger.info(f"確保目錄存在：{RECIPE_DIR}, {IMAGE_DIR}")
+    except Exception as e:
+        logger.error(f"無法創建目錄：{str(e)}")
+        raise
+
 
 def sanitize_filename(filename):
     return re.sub(r'[<>:"/\\|?*]', '_', filename)
 
-def generate_image_with_comfyui(prompt, comfyui_api_url, recipe_name, workflow_path="flux_api.json"):
 
-    client_id = str(uuid.uuid4())
-    try:
-        # 讀取 ComfyUI 的 API 專用格式 workflow（Save as API Format）
-        with open(workflow_path, "r", encoding="utf-8") as f:
-            workflow = json.load(f)
-
-        # 👉 修改正向 prompt（注意是節點 ID 為 "6"）
-        if "6" in workflow:
-            workflow["6"]["inputs"]["text"] = prompt
-        else:
-            raise ValueError("找不到 CLIPTextEncode 正向節點 ID '6'")
-
-        # ⚙️ 組合完整 payload 結構
-        payload = {
-            "client_id": client_id,
-            "prompt": workflow
-        }
-
-        # 🚀 發送 API 請求
-        logger.info(f"傳送 ComfyUI 請求：{comfyui_api_url}")
-        response = requests.post(comfyui_api_url, json=payload)
+def notify_recipe_change(filename):
+    for hook in recipe_change_hooks:
+        hook(filename)
+
+
+image_cache = ImageCache(IMAGE_CACHE_DIR)
+# 已發布食譜的時間索引，寫入新食譜時同步更新
+recipe_catalog = RecipeCatalog(RECIPE_DIR)
+# 已發布食譜的指紋（標題 + 食材 MinHash），生圖前先檢查是否重複
+recipe_fingerprints = RecipeFingerprints(RECIPE_DIR)
+# 產生的食譜同時存進資料庫，由 init() 設定
+recipe_store = None
+# 食譜新增或移除後呼叫的函式（例如清掉讀取路由的回應快取），參數為檔名
+recipe_change_hooks = []
+# 重複食譜的處理方式：allow 照常產生（預設，重複判定只列在結果中）、skip 略過、reuse 寫出新的 Markdown 但沿用既有封面（不生圖）
+DUPLICATE_POLICIES = ("skip", "reuse", "allow")
+# workflow 範本只在檔案變更時重新讀取
+workflows = WorkflowRegistry()
+# 圖片轉檔（JPEG / WebP / 響應式寬度 / 預覽圖）在獨立程序中執行
+image_pipeline = ImagePipeline()
+
+
+def raw_image_path(recipe_name):
+    """
+    ComfyUI 原始輸出的暫存路徑，轉檔完成後即刪除；每次呼叫各自建立一個檔案，同名食譜同時生圖不會互相覆蓋
+    """
+    fd, path = tempfile.mkstemp(prefix=f".{sanitize_filename(recipe_name)}.", suffix=".download", dir=IMAGE_DIR)
+    os.close(fd)
+    return path
+
+
+def discard_raw_image(raw_path):
+    """
+    生圖失敗時刪除暫存的原始圖片
+    """
+    if raw_path is not None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(raw_path)
+
+
+def image_cache_key(prompt, workflow_path):
+    template = workflows.get(workflow_path)
+    return cache_key(prompt, template.raw_bytes, template.seed)
+
+
+def fetch_cached_image(key, raw_path):
+    """
+    快取命中時把原始圖片複製到 raw_path 並回傳 True
+    """
+    if image_cache.fetch(key, raw_path):
+        logger.info(f"生圖快取命中：{raw_path}")
+        return True
+    return False
+
+
+def image_info(processed):
+    """
+    轉檔結果轉成 front matter 使用的網址與 srcset
+    """
+    def url(name):
+        return f"{IMAGE_URL_PREFIX}{name}"
+
+    variants = processed["variants"]
+    return {
+        "url": url(processed["jpg"]),
+        "srcset": ", ".join(f"{url(v['jpg'])} {v['width']}w" for v in variants),
+        "webp_srcset": ", ".join(f"{url(v['webp'])} {v['width']}w" for v in variants),
+        "placeholder": processed["placeholder"],
+    }
+
+
+def finalize_image(raw_path, recipe_name):
+    """
+    原始圖片轉成正式檔案與各尺寸版本，回傳 image_info
+    """
+    with metrics.span("recipe_stage_seconds", stage="image_finalize"):
+        processed = image_pipeline.process(raw_path, IMAGE_DIR, sanitize_filename(recipe_name))
+    logger.info(f"圖片已轉檔：{processed['jpg']}（{len(processed['variants'])} 種尺寸）")
+    return image_info(processed)
+
+def submit_prompt(prompt, comfyui_api_url, workflow_path="flux_api.json", client_id=None):
+    """
+    取出預先載入的 workflow、填入正向 prompt 並提交到 ComfyUI，回傳 prompt_id
+    """
+    # ⚙️ 組合完整 payload 結構（正向 prompt 節點由 class_type 自動找出）
+    payload = {
+        "client_id": client_id or str(uuid.uuid4()),
+        "prompt": workflows.get(workflow_path).build(prompt)
+    }
+
+    # 🚀 發送 API 請求（requests 載入較慢，第一次呼叫時才匯入）
+    import requests
+
+    logger.info(f"傳送 ComfyUI 請求：{comfyui_api_url}")
+    with metrics.span("comfyui_phase_seconds", phase="submit"):
+        response = requests.post(comfyui_api_url, json=payload, timeout=HTTP_TIMEOUT)
         response.raise_for_status()
-        prompt_id = response.json()["prompt_id"]
-        logger.info(f"ComfyUI 任務已提交，prompt_id：{prompt_id}")
-
-        # 🔁 等待任務完成
-        history_url = comfyui_api_url.replace("/prompt", "/history")
-        while True:
-            response = requests.get(f"{history_url}/{prompt_id}")
-            response.raise_for_status()
-            history = response.json()
-            if prompt_id in history:
-                break
-            time.sleep(1)
-
-        # 🖼 取得生成圖像，節點 ID 為 "9"
-        output_node_id = "9"
-        output_files = history[prompt_id]["outputs"][output_node_id]["images"]
-        if not output_files:
-            raise ValueError("未找到生成的圖片")
-
-        # 💾 下載圖片
-        image_filename = sanitize_filename(f"{recipe_name}.jpg")
-        image_path = os.path.join(IMAGE_DIR, image_filename)
-        image_url = comfyui_api_url.replace(
-            "/prompt",
-            f"/view?filename={output_files[0]['filename']}&subfolder={output_files[0].get('subfolder', '')}&type={output_files[0].get('type', 'output')}"
-        )
-        image_response = requests.get(image_url)
+    prompt_id = response.json()["prompt_id"]
+    logger.info(f"ComfyUI 任務已提交，prompt_id：{prompt_id}")
+    return prompt_id
+
+
+def get_history(comfyui_api_url, prompt_id):
+    """
+    查詢一次任務狀態，完成時回傳該任務的 history，尚未完成回傳 None
+    """
+    import requests
+
+    history_url = comfyui_api_url.replace("/prompt", "/history")
+    response = requests.get(f"{history_url}/{prompt_id}", timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    history = response.json()
+    return history.get(prompt_id)
+
+
+def poll_delays(initial=POLL_INITIAL_DELAY, maximum=POLL_MAX_DELAY, factor=1.5):
+    """
+    輪詢間隔：一開始查得勤，之後逐步拉長到上限
+    """
+    delay = initial
+    while True:
+        yield delay
+        delay = min(delay * factor, maximum)
+
+
+def record_wait_phases(result, waiting_since):
+    """
+    把提交後等待的時間拆成排隊與渲染：ComfyUI 的 history 在 status.messages 帶有
+    execution_start / execution_success 的時間戳（毫秒）；沒有時間戳時整段記為 wait
+    """
+    finished_at = time.time()
+    timestamps = {}
+    for message in (result.get("status") or {}).get("messages", []):
+        if isinstance(message, list) and len(message) == 2 and isinstance(message[1], dict):
+            if "timestamp" in message[1]:
+                timestamps[message[0]] = message[1]["timestamp"] / 1000
+    started = timestamps.get("execution_start")
+    if started is None:
+        metrics.record("comfyui_phase_seconds", finished_at - waiting_since, phase="wait")
+        return
+    ended = timestamps.get("execution_success", timestamps.get("execution_error", finished_at))
+    started = max(started, waiting_since)
+    metrics.record("comfyui_phase_seconds", started - waiting_since, ended_ago=finished_at - started,
+                   phase="queue_wait")
+    metrics.record("comfyui_phase_seconds", max(ended - started, 0.0), ended_ago=max(finished_at - ended, 0.0),
+                   phase="render")
+
+
+def wait_for_history(comfyui_api_url, prompt_id, timeout=RENDER_TIMEOUT):
+    # 🔁 等待任務完成
+    waiting_since = time.time()
+    deadline = time.monotonic() + timeout
+    for delay in poll_delays():
+        result = get_history(comfyui_api_url, prompt_id)
+        if result is not None:
+            record_wait_phases(result, waiting_since)
+            return result
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"ComfyUI 任務逾時：{prompt_id}")
+        time.sleep(delay)
+
+
+def download_image(comfyui_api_url, result, dest_path, workflow_path="flux_api.json"):
+    """
+    從任務結果串流下載第一張輸出圖片到 dest_path，不把整張圖讀進記憶體
+    """
+    # 🖼 取得生成圖像（SaveImage 節點）
+    output_node_id = workflows.get(workflow_path).output_node_id
+    output_files = result["outputs"][output_node_id]["images"]
+    if not output_files:
+        raise ValueError("未找到生成的圖片")
+
+    # 💾 下載圖片
+    import requests
+
+    image_url = comfyui_api_url.replace(
+        "/prompt",
+        f"/view?filename={output_files[0]['filename']}&subfolder={output_files[0].get('subfolder', '')}&type={output_files[0].get('type', 'output')}"
+    )
+    tmp_path = f"{dest_path}.part"
+    with metrics.span("comfyui_phase_seconds", phase="download"), \
+            requests.get(image_url, stream=True, timeout=HTTP_TIMEOUT) as image_response:
         image_response.raise_for_status()
+        with open(tmp_path, "wb") as f:
+            for chunk in image_response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+    os.replace(tmp_path, dest_path)
+    logger.info(f"圖片已下載：{dest_path}")
+    return dest_path
 
-        with open(image_path, "wb") as f:
-            f.write(image_response.content)
-        logger.info(f"圖片已儲存：{image_path}")
 
-        return f"https://www.youraichefs.com/images/recipes/{image_filename}"
+def generate_recipe_image(prompt, comfyui_api_url, recipe_name, workflow_path="flux_api.json"):
+    """
+    同步生圖：查快取、提交、等待完成、下載並轉檔，回傳 image_info。
+    非同步版本請使用 image_jobs.ImageJobQueue
+    """
+    raw_path = None
+    try:
+        key = image_cache_key(prompt, workflow_path)
+        raw_path = raw_image_path(recipe_name)
+        if not fetch_cached_image(key, raw_path):
+            prompt_id = submit_prompt(prompt, comfyui_api_url, workflow_path)
+            result = wait_for_history(comfyui_api_url, prompt_id)
+            download_image(comfyui_api_url, result, raw_path, workflow_path)
+            image_cache.store(key, raw_path)
+        return finalize_image(raw_path, recipe_name)
 
     except Exception as e:
         logger.error(f"使用 ComfyUI 生成圖片失敗：{str(e)}")
+        discard_raw_image(raw_path)
         raise
-    
-def recipe_to_md(recipe):
+
+
+def generate_image_with_comfyui(prompt, comfyui_api_url, recipe_name, workflow_path="flux_api.json"):
     """
-    將單個食譜轉換為 Markdown 檔案（帶 Hugo-friendly 前後排版與內容）
+    同步生圖，只回傳主圖網址
     """
-    try:
-        if not isinstance(recipe, dict) or "name" not in recipe or "image_prompt" not in recipe:
-            raise ValueError("recipe 必須是一個字典並包含 'name' 和 'image_prompt' 鍵")
+    return generate_recipe_image(prompt, comfyui_api_url, recipe_name, workflow_path)["url"]
 
-        converter = opencc.OpenCC('s2t.json')
-        title = converter.convert(recipe["name"])
-        filename_base = f"{datetime.now().strftime('%Y-%m-%d-%H%M%S')}_{title}"
-        filename = sanitize_filename(filename_base) + ".md"
-        logger.info(f"生成的檔案名稱：{filename}")
 
-        json_str = json.dumps(recipe, ensure_ascii=False)
-        converted_str = converter.convert(json_str)
-        converted_recipe = json.loads(converted_str)
+def unique_filename(timestamp, title, taken=()):
+    """
+    以時間與菜名組成檔名；同一秒內已有同名食譜（同批已規劃的 taken 或目錄中已存在）時把時間往後推一秒
+    """
+    while True:
+        filename = sanitize_filename(f"{timestamp.strftime('%Y-%m-%d-%H%M%S')}_{title}") + ".md"
+        if filename not in taken and not os.path.exists(os.path.join(RECIPE_DIR, filename)):
+            return filename
+        timestamp += timedelta(seconds=1)
 
-        required_keys = ["ingredients", "steps", "calories", "price"]
-        for key in required_keys:
-            if key not in converted_recipe:
-                raise ValueError(f"recipe 缺少必要的鍵：{key}")
 
-        # 使用 ComfyUI 生成圖片
-        image_url = generate_image_with_comfyui(converted_recipe["image_prompt"], comfyui_api_url, title, "flux_512_api.json")
+def prepare_recipe(recipe, taken=()):
+    """
+    驗證並轉換成繁體，回傳 (標題, 檔名, 轉換後的食譜)；taken 為同批已使用的檔名
+    """
+    if not isinstance(recipe, dict) or "name" not in recipe or "image_prompt" not in recipe:
+        raise ValueError("recipe 必須是一個字典並包含 'name' 和 'image_prompt' 鍵")
 
-        # 組成 ingredients 與 steps 的 markdown
-        ingredients_md = "\n".join(
-            f"- {item['name']}：{item['amount']} {item['unit']}" for item in converted_recipe["ingredients"]
-        )
-        steps_md = "\n".join(
-            f"{i+1}. {step}" for i, step in enumerate(converted_recipe["steps"])
-        )
+    with metrics.span("recipe_stage_seconds", stage="convert"):
+        title = convert_text(recipe["name"])
+        # 只轉換字串值，短字串（食材、單位）的轉換結果會被重複使用
+        converted_recipe = convert_tree(recipe)
+    filename = unique_filename(datetime.now(), title, taken)
+    logger.info(f"生成的檔案名稱：{filename}")
 
-        description = f"這是一道經典料理「{title}」，簡單易做，適合夏季與日常餐桌享用。"
 
-        # Front Matter
-        front_matter = f"""---
-title: "{title}"
-date: {datetime.now().strftime('%Y-%m-%d')}
-draft: false
-cover: "{image_url}"
-description: "{description}"
-tags: ["家常菜"]
-theme: "light"
----"""
+    required_keys = ["ingredients", "steps", "calories", "price"]
+    for key in required_keys:
+        if key not in converted_recipe:
+            raise ValueError(f"recipe 缺少必要的鍵：{key}")
 
-        # Markdown 內容組合
-        markdown = f"""{front_matter}
+    return title, filename, converted_recipe
 
-## 🥄 每人卡路里  
-{converted_recipe['calories']}
 
-## 💰 預估成本  
-{converted_recipe['price']}
+def render_markdown(title, converted_recipe, image):
+    return render_recipe(new_record(title, converted_recipe, image))
 
----
 
-## 🧾 食材準備（約 2~3 人份）
+def write_markdown(filename, markdown):
+    path = os.path.join(RECIPE_DIR, filename)
+    logger.info(f"準備寫入檔案：{path}")
+
+    if not os.access(RECIPE_DIR, os.W_OK):
+        raise PermissionError(f"沒有寫入權限：{RECIPE_DIR}")
+
+    with metrics.span("recipe_stage_seconds", stage="markdown_write"):
+        atomic_write(path, markdown)
+    logger.info(f"成功寫入檔案：{path}")
+    recipe_catalog.add(filename)
+    notify_recipe_change(filename)
+    return path
+
+
+_COVER_RE = re.compile(r'^cover: ".*"$(\n^cover\w+: ".*"$)*', re.MULTILINE)
+
+
+def patch_cover(filename, image):
+    """
+    只替換 front matter 的 cover 相關欄位，其餘內容不變；回傳替換後的 Markdown
+    """
+    path = os.path.join(RECIPE_DIR, filename)
+    with metrics.span("recipe_stage_seconds", stage="cover_patch"):
+        with open(path, "r", encoding="utf-8") as f:
+            markdown = f.read()
+        markdown = _COVER_RE.sub(lambda _: cover_front_matter(image), markdown, count=1)
+        atomic_write(path, markdown)
+    return markdown
+
+
+def store_call(action, filename, *args):
+    """
+    寫入結構化食譜資料庫；Markdown 已經寫出，資料庫失敗只記錄錯誤，之後可用 recipe_store.py import 補回。
+    寫入後再通知一次變更，讓依資料庫回應的路由（例如 /search）不會快取到寫入前的結果
+    """
+    if recipe_store is None:
+        return
+    try:
+        getattr(recipe_store, action)(filename, *args)
+    except Exception as e:
+        logger.error(f"食譜資料庫 {action} 失敗：{str(e)}\n{traceback.format_exc()}")
+        return
+    notify_recipe_change(filename)
+
 
-{ingredients_md}
+def refresh_search_index():
+    """
+    重新輸出前端搜尋索引（只改寫內容有變的分片），回傳統計；未設定資料庫時回傳 None
+    """
+    if recipe_store is None:
+        return None
+    try:
+        return recipe_store.build_search_index(SEARCH_INDEX_DIR)
+    except Exception as e:
+        logger.error(f"輸出搜尋索引失敗：{str(e)}\n{traceback.format_exc()}")
+        return None
 
----
 
-## 👩‍🍳 作法步驟
+_search_index_timer = None
+_search_index_lock = threading.Lock()
 
-{steps_md}
 
----
+def schedule_search_index_refresh(delay=SEARCH_INDEX_DEBOUNCE):
+    """
+    延遲 delay 秒後在背景重新輸出前端搜尋索引；期間再次呼叫會重新計時
+    """
+    global _search_index_timer
+    with _search_index_lock:
+        if _search_index_timer is not None:
+            _search_index_timer.cancel()
+        _search_index_timer = threading.Timer(delay, refresh_search_index)
+        _search_index_timer.daemon = True
+        _search_index_timer.start()
 
-## 📝 小提醒
 
-- 可依個人口味調整醬料濃淡。
-- 可搭配白飯、炒青菜組合成營養套餐。
-"""
+def rerender_recipes(filenames=None, verify=False, dry_run=False):
+    """
+    由資料庫重新輸出 content/recipes，只改寫內容有變的檔案
+    """
+    if recipe_store is None:
+        raise RuntimeError("尚未設定食譜資料庫，請先呼叫 init(store)")
+    stats = recipe_store.render_all(RECIPE_DIR, filenames, verify, dry_run)
+    if not dry_run:
+        for filename in stats["files"]:
+            notify_recipe_change(filename)
+        stats["search_index"] = refresh_search_index()
+    return stats
 
-        path = os.path.join(RECIPE_DIR, filename)
-        logger.info(f"準備寫入檔案：{path}")
 
-        if not os.access(RECIPE_DIR, os.W_OK):
-            raise PermissionError(f"沒有寫入權限：{RECIPE_DIR}")
+def recipe_to_md(recipe):
+    """
+    將單個食譜轉換為 Markdown 檔案（帶 Hugo-friendly 前後排版與內容）
+    """
+    try:
+        title, filename, converted_recipe = prepare_recipe(recipe)
 
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(markdown)
-        logger.info(f"成功寫入檔案：{path}")
+        # 使用 ComfyUI 生成圖片
+        image = generate_recipe_image(converted_recipe["image_prompt"], comfyui_api_url, title, "flux_512_api.json")
 
+        record = new_record(title, converted_recipe, image)
+        markdown = render_recipe(record)
+        write_markdown(filename, markdown)
+        store_call("save", filename, record, content_hash(markdown))
+        schedule_search_index_refresh()
         return filename
 
     except PermissionError as e:
@@ -190,48 +436,155 @@ theme: "light"
         logger.error(f"寫入檔案失敗：{str(e)}\n{traceback.format_exc()}")
         raise
 
-# 測試程式碼
-if __name__ == "__main__":
-    test_recipes = [
-        {
-            "name": "涼拌油麥菜",
-            "servings": "適合 4 人的份量",
-            "ingredients": [
-                {"name": "油麥菜", "amount": "1", "unit": "把"},
-                {"name": "蒜末", "amount": "1", "unit": "小匙"},
-                {"name": "辣椒油", "amount": "1", "unit": "大匙"},
-                {"name": "鹽", "amount": "適量", "unit": ""}
-            ],
-            "steps": [
-                "將油麥菜清洗乾淨，切成段。",
-                "鍋中加水煮沸，焯燉10秒後撈出瀝幹水分。",
-                "加入蒜末、辣椒油和鹽調味即可。"
-            ],
-            "calories": "每人約 60 卡",
-            "price": "零售價估算（單位：台幣）：30",
-            "image_prompt": "an illustration of a 涼拌油麥菜, with glistening surface, placed on a white porcelain plate, surrounded by minced garlic and drizzled with chili oil. The dish is cooked to perfection, with tender texture, presented with soft lighting, minimal shadows, and meticulous watercolor style, emphasizing the freshness and flavor of the ingredients. Clean white background, realistic food drawing, magazine-style presentation."
-        },
-        {
-            "name": "絲瓜炒蛋",
-            "servings": "適合 4 人的份量",
-            "ingredients": [
-                {"name": "絲瓜", "amount": "2", "unit": "根"},
-                {"name": "雞蛋", "amount": "4", "unit": "個"},
-                {"name": "鹽", "amount": "適量", "unit": ""}
-            ],
-            "steps": [
-                "將絲瓜去皮切段，雞蛋打散備用。",
-                "熱鍋加油，炒香雞蛋後加入絲瓜翻炒。",
-                "加鹽調味，炒至絲瓜軟嫩即可。"
-            ],
-            "calories": "每人約 100 卡",
-            "price": "零售價估算（單位：台幣）：40",
-            "image_prompt": "an illustration of a 絲瓜炒蛋, with glistening surface, placed on a white porcelain plate, garnished with chopped green onions. The dish is cooked to perfection, with tender texture, presented with soft lighting, minimal shadows, and meticulous watercolor style, emphasizing the freshness and flavor of the ingredients. Clean white background, realistic food drawing, magazine-style presentation."
-        }
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def recipes_to_md(recipes, concurrency=2, workflow_path="flux_512_api.json", duplicate_policy="allow"):
+    """
+    批次轉換食譜：先依序檢查是否與既有食譜（或同批較早的食譜）重複，再並行寫出 Markdown（cover 先留空），
+    最後以最多 concurrency 個並行向 ComfyUI 生圖，每張圖完成就回填該篇的 cover。
+    單篇失敗不影響其他篇，回傳每篇的結果、重複判定與耗時。
+    """
+    started = time.perf_counter()
+    results = [
+        {"index": i, "name": recipe.get("name") if isinstance(recipe, dict) else None,
+         "file": None, "image_url": None, "status": "pending", "error": None, "duplicate": None}
+        for i, recipe in enumerate(recipes)
     ]
 
+    # 重複檢查只做雜湊與集合運算，依序執行即可讓同批的食譜彼此比對；
+    # 同批同名的食譜在同一秒內準備，檔名以 planned 避開彼此
+    plans = []
+    planned = set()
+    for i, recipe in enumerate(recipes):
+        result = results[i]
+        try:
+            title, filename, converted_recipe = prepare_recipe(recipe, planned)
+            names = ingredient_names(converted_recipe["ingredients"])
+            duplicate = recipe_fingerprints.check(title, names)
+            existing_image = duplicate.pop("image")
+            result.update(name=title, duplicate=duplicate)
+
+            image = None
+            if duplicate["decision"] == "duplicate" and duplicate_policy != "allow":
+                if duplicate_policy == "reuse" and existing_image is not None:
+                    image = existing_image
+                else:
+                    logger.info(f"略過重複食譜：{title} ≈ {duplicate['match']}")
+                    result["status"] = "skipped"
+                    continue
+            recipe_fingerprints.remember(filename, title, names, image)
+        except Exception as e:
+            logger.error(f"食譜格式錯誤：{str(e)}")
+            result.update(status="failed", error=str(e))
+            continue
+        planned.add(filename)
+        plans.append((i, title, filename, converted_recipe, image))
+
+    def write_one(plan):
+        i, title, filename, converted_recipe, image = plan
+        result = results[i]
+        try:
+            record = new_record(title, converted_recipe, image)
+            markdown = render_recipe(record)
+            write_markdown(filename, markdown)
+            store_call("save", filename, record, content_hash(markdown))
+            result["file"] = filename
+            result["markdown_ms"] = _elapsed_ms(started)
+            if image is not None:
+                # 沿用既有封面，不需要生圖
+                result.update(image_url=image["url"], status="ok", total_ms=_elapsed_ms(started))
+                return None
+            return plan
+        except Exception as e:
+            logger.error(f"寫入檔案失敗：{str(e)}\n{traceback.format_exc()}")
+            recipe_fingerprints.forget(filename)
+            result.update(status="failed", error=str(e))
+            return None
+
+    def render_one(plan):
+        i, title, filename, converted_recipe, _ = plan
+        result = results[i]
+        render_started = time.perf_counter()
+        try:
+            image = generate_recipe_image(
+                converted_recipe["image_prompt"], comfyui_api_url, title, workflow_path
+            )
+            markdown = patch_cover(filename, image)
+            store_call("set_image", filename, image, content_hash(markdown))
+            recipe_fingerprints.set_image(filename, image)
+            result.update(image_url=image["url"], status="ok")
+        except Exception as e:
+            # 沒有圖片的食譜不發布，移除已寫出的 Markdown（可能已被其他流程刪除）
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(RECIPE_DIR, filename))
+            recipe_catalog.remove(filename)
+            recipe_fingerprints.forget(filename)
+            store_call("delete", filename)
+            notify_recipe_change(filename)
+            result.update(status="failed", error=str(e), file=None)
+        result["image_ms"] = _elapsed_ms(render_started)
+        result["total_ms"] = _elapsed_ms(started)
+
+    workers = max(1, min(concurrency, len(plans)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 有追蹤中的請求時，讓執行緒內的 span 也記到同一份追蹤
+        written = list(executor.map(propagate(write_one), plans))
+        futures = [executor.submit(propagate(render_one), plan) for plan in written if plan is not None]
+        for future in futures:
+            future.result()
+    refresh_search_index()
+    return results
+
+# 測試用食譜，也供 text_convert.py 的微基準測試使用
+SAMPLE_RECIPES = [
+    {
+        "name": "涼拌油麥菜",
+        "servings": "適合 4 人的份量",
+        "ingredients": [
+            {"name": "油麥菜", "amount": "1", "unit": "把"},
+            {"name": "蒜末", "amount": "1", "unit": "小匙"},
+            {"name": "辣椒油", "amount": "1", "unit": "大匙"},
+            {"name": "鹽", "amount": "適量", "unit": ""}
+        ],
+        "steps": [
+            "將油麥菜清洗乾淨，切成段。",
+            "鍋中加水煮沸，焯燉10秒後撈出瀝幹水分。",
+            "加入蒜末、辣椒油和鹽調味即可。"
+        ],
+        "calories": "每人約 60 卡",
+        "price": "零售價估算（單位：台幣）：30",
+        "image_prompt": "an illustration of a 涼拌油麥菜, with glistening surface, placed on a white porcelain plate, surrounded by minced garlic and drizzled with chili oil. The dish is cooked to perfection, with tender texture, presented with soft lighting, minimal shadows, and meticulous watercolor style, emphasizing the freshness and flavor of the ingredients. Clean white background, realistic food drawing, magazine-style presentation."
+    },
+    {
+        "name": "絲瓜炒蛋",
+        "servings": "適合 4 人的份量",
+        "ingredients": [
+            {"name": "絲瓜", "amount": "2", "unit": "根"},
+            {"name": "雞蛋", "amount": "4", "unit": "個"},
+            {"name": "鹽", "amount": "適量", "unit": ""}
+        ],
+        "steps": [
+            "將絲瓜去皮切段，雞蛋打散備用。",
+            "熱鍋加油，炒香雞蛋後加入絲瓜翻炒。",
+            "加鹽調味，炒至絲瓜軟嫩即可。"
+        ],
+        "calories": "每人約 100 卡",
+        "price": "零售價估算（單位：台幣）：40",
+        "image_prompt": "an illustration of a 絲瓜炒蛋, with glistening surface, placed on a white porcelain plate, garnished with chopped green onions. The dish is cooked to perfection, with tender texture, presented with soft lighting, minimal shadows, and meticulous watercolor style, emphasizing the freshness and flavor of the ingredients. Clean white background, realistic food drawing, magazine-style presentation."
+    }
+]
+
+
+# 測試程式碼
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    init()
     try:
-        filename = recipe_to_md(test_recipes, comfyui_api_url)
-        print(f"返回的檔案名稱：{filename}")
+        for recipe in SAMPLE_RECIPES:
+            filename = recipe_to_md(recipe)
+            print(f"返回的檔案名稱：{filename}")
     except Exception as e:
-        print(f"錯誤：{str(e)}")
\ No newline at end of file
+        print(f"錯誤：{str(e)}")
@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+
+# 食譜全文檢索：SQLite FTS5 trigram 索引涵蓋標題、食材與步驟，資料列的 rowid 即 recipes.id，
+# 由 RecipeStore 在寫入食譜的同一個交易內更新。
+# trigram 只能用 MATCH 查三個字以上的詞；「絲瓜」這類兩字詞改用 LIKE，資料量是食譜篇數，掃描也很快。
+#
+# 另外輸出給 Hugo 前端用的靜態索引（static/search/）：
+#   index.json   版本、分片數與文件數
+#   docs.json    [[網址, 標題, 日期, 封面, 食材], ...]，陣列位置即文件編號
+#   shard-NN.json {詞: [文件編號, ...]}，詞為標題與食材名稱的單字與雙字組，依第一個字的碼位分片
+# 前端只需下載查詢詞所在的分片，不必載入每一頁。
+
+SEARCH_TABLE = "recipe_search"
+SEARCH_COLUMNS = ("title", "ingredients", "steps")
+STATIC_INDEX_VERSION = 2
+STATIC_SHARDS = 16
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MIN_MATCH_CHARS = 3  # trigram 能以 MATCH 查詢的最短長度
+
+# 靜態索引的文件：已發布、非草稿的食譜
+STATIC_INDEX_SQL = f"""
+    SELECT r.filename, r.title, r.publish_date, i.url, s.ingredients
+    FROM recipes r
+    JOIN {SEARCH_TABLE} s ON s.rowid = r.id
+    LEFT JOIN recipe_images i ON i.recipe_id = r.id
+    WHERE r.draft = 0
+    ORDER BY r.filename
+"""
+
+_TERM_SPLIT_RE = re.compile(r"[\s,，、;；]+")
+_GRAM_STRIP_RE = re.compile(r"[\s\W_]+")
+
+
+def create_search_table(conn):
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+            title, ingredients, steps, tokenize = 'trigram'
+        )
+    """)
+
+
+def rebuild_search_index(conn):
+    """
+    由 recipes、recipe_ingredients、recipe_steps 重建整個檢索表
+    """
+    conn.execute(f"DELETE FROM {SEARCH_TABLE}")
+    conn.execute(f"""
+        INSERT INTO {SEARCH_TABLE} (rowid, title, ingredients, steps)
+        SELECT r.id, r.title,
+            (SELECT group_concat(name, char(10)) FROM (
+                SELECT name FROM recipe_ingredients WHERE recipe_id = r.id ORDER BY position)),
+            (SELECT group_concat(text, char(10)) FROM (
+                SELECT text FROM recipe_steps WHERE recipe_id = r.id ORDER BY position))
+        FROM recipes r
+    """)
+
+
+def index_recipe(conn, recipe_id, record):
+    conn.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = ?", (recipe_id,))
+    conn.execute(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, title, ingredients, steps) VALUES (?, ?, ?, ?)",
+        (
+            recipe_id,
+            record["title"],
+            "\n".join(item["name"] for item in record["ingredients"]),
+            "\n".join(record["steps"]),
+        ),
+    )
+
+
+def remove_recipe(conn, recipe_id):
+    conn.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = ?", (recipe_id,))
+
+
+def parse_terms(query):
+    """
+    以空白或逗號分隔查詢詞，去除重複並保留順序
+    """
+    terms = []
+    for term in _TERM_SPLIT_RE.split(query or ""):
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def _match_expression(terms, mode, field):
+    quoted = ['"' + term.replace('"', '""') + '"' for term in terms]
+    expression = (" OR " if mode == "any" else " AND ").join(quoted)
+    return f"{field} : ({expression})" if field else expression
+
+
+def _like_clause(terms, mode, field):
+    columns = (field,) if field else SEARCH_COLUMNS
+    clauses = []
+    params = []
+    for term in terms:
+        pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        clauses.append("(" + " OR ".join(f"s.{column} LIKE ? ESCAPE '\\'" for column in columns) + ")")
+        params += [pattern] * len(columns)
+    return (" OR " if mode == "any" else " AND ").join(clauses), params
+
+
+def search_query(terms, mode="all", field=None, limit=DEFAULT_LIMIT):
+    """
+    search 執行的 SQL 與參數：夠長的詞以 MATCH 查詢，只有 trigram 查不到的短詞才用 LIKE。
+    結果由 MATCH 決定時依 bm25 排序；只有短詞、或 any 模式混合長短詞時依日期由新到舊排序
+    """
+    long_terms = [term for term in terms if len(term) >= MIN_MATCH_CHARS]
+    short_terms = [term for term in terms if len(term) < MIN_MATCH_CHARS]
+    either = mode == "any" and long_terms and short_terms
+    clauses, params = [], []
+    if long_terms:
+        # MATCH 不能放在 OR 之中，any 模式混合長短詞時改以子查詢取出符合的 rowid
+        if either:
+            clauses.append(f"s.rowid IN (SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH ?)")
+        else:
+            clauses.append(f"{SEARCH_TABLE} MATCH ?")
+        params.append(_match_expression(long_terms, mode, field))
+    if short_terms:
+        clause, like_params = _like_clause(short_terms, mode, field)
+        clauses.append(f"({clause})")
+        params += like_params
+    order = "s.rank" if long_terms and not either else "r.publish_date DESC, r.filename DESC"
+    sql = f"""
+        SELECT r.filename, r.title, r.publish_date, r.draft, i.url, s.ingredients
+        FROM {SEARCH_TABLE} s
+        JOIN recipes r ON r.id = s.rowid
+        LEFT JOIN recipe_images i ON i.recipe_id = r.id
+        WHERE {(" OR " if either else " AND ").join(clauses)}
+        ORDER BY {order}
+        LIMIT ?
+    """
+    return sql, params + [limit]
+
+
+def search(conn, terms, mode="all", field=None, limit=DEFAULT_LIMIT):
+    """
+    查詢食譜：mode 為 all（每個詞都要出現）或 any（任一詞出現），field 限定欄位（None 表示全部）
+    """
+    if mode not in ("all", "any"):
+        raise ValueError("mode 必須是 all 或 any")
+    if field is not None and field not in SEARCH_COLUMNS:
+        raise ValueError(f"field 必須是 {', '.join(SEARCH_COLUMNS)} 之一")
+    if not terms:
+        return []
+
+    rows = conn.execute(*search_query(terms, mode, field, limit)).fetchall()
+    return [
+        {
+            "file": filename,
+            "title": title,
+            "date": publish_date,
+            "draft": bool(draft),
+            "url": recipe_url(filename),
+            "cover": cover,
+            "ingredients": ingredients.split("\n") if ingredients else [],
+        }
+        for filename, title, publish_date, draft, cover, ingredients in rows
+    ]
+
+
+def recipe_url(filename):
+    # Hugo 的預設網址：content/recipes/<檔名>.md -> /recipes/<檔名>/（urlize 會轉小寫、空白轉 -）
+    return f"/recipes/{os.path.splitext(filename)[0].lower().replace(' ', '-')}/"
+
+
+def grams(text):
+    """
+    單字與雙字組；去掉空白與標點，英文轉小寫
+    """
+    result = set()
+    for chunk in _GRAM_STRIP_RE.split(text.lower()):
+        result.update(chunk)
+        result.update(chunk[i:i + 2] for i in range(len(chunk) - 1))
+    return result
+
+
+def shard_of(gram, shards=STATIC_SHARDS):
+    return ord(gram[0]) % shards
+
+
+def _dump(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def build_static_index(conn, out_dir, shards=STATIC_SHARDS):
+    """
+    輸出前端用的分片索引（只含已發布、非草稿的食譜）；內容沒變的檔案不改寫。
+    回傳 {"docs", "grams", "written"}（written 為改寫的檔名）
+    """
+    # 延後匯入，避免 recipe_store 與本模組互相匯入
+    from recipe_store import atomic_write, content_hash, file_hash
+
+    rows = conn.execute(STATIC_INDEX_SQL).fetchall()
+
+    docs = []
+    postings = {}
+    for doc_id, (filename, title, publish_date, cover, ingredients) in enumerate(rows):
+        names = ingredients.split("\n") if ingredients else []
+        docs.append([recipe_url(filename), title, publish_date, cover or "", names])
+        for gram in grams(" ".join([title] + names)):
+            postings.setdefault(gram, []).append(doc_id)
+
+    files = {
+        "index.json": _dump({"version": STATIC_INDEX_VERSION, "shards": shards, "docs": len(docs)}),
+        "docs.json": _dump(docs),
+    }
+    shard_maps = [{} for _ in range(shards)]
+    for gram in sorted(postings):
+        shard_maps[shard_of(gram, shards)][gram] = postings[gram]
+    for number, shard in enumerate(shard_maps):
+        files[f"shard-{number:02d}.json"] = _dump(shard)
+
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for name, text in files.items():
+        path = os.path.join(out_dir, name)
+        if file_hash(path) != content_hash(text):
+            atomic_write(path, text)
+            written.append(name)
+    # 分片數變少時移除多出來的舊分片
+    for name in os.listdir(out_dir):
+        if name.startswith("shard-") and name not in files:
+            os.remove(os.path.join(out_dir, name))
+            written.append(name)
+    return {"docs": len(docs), "grams": len(postings), "written": written}
+
+
+# 執行：python recipe_search.py 絲瓜 茄子 [--any] [--field ingredients]
+#       python recipe_search.py --rebuild [--static static/search/]
+if __name__ == "__main__":
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(description="食譜全文檢索與前端靜態索引")
+    parser.add_argument("terms", nargs="*")
+    parser.add_argument("--database", default="new.db")
+    parser.add_argument("--any", action="store_true", help="任一詞出現即可（預設每個詞都要出現）")
+    parser.add_argument("--field", choices=SEARCH_COLUMNS)
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    parser.add_argument("--rebuild", action="store_true", help="由食譜資料表重建檢索表")
+    parser.add_argument("--static", metavar="DIR", help="輸出前端用的分片索引到 DIR")
+    args = parser.parse_args()
+
+    migrate(args.database)
+    with sqlite3.connect(args.database) as conn:
+        if args.rebuild:
+            rebuild_search_index(conn)
+            print(f"已重建檢索表：{conn.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE}').fetchone()[0]} 篇")
+        if args.static:
+            stats = build_static_index(conn, args.static)
+            print(f"靜態索引：{stats['docs']} 篇、{stats['grams']} 個詞，改寫 {len(stats['written'])} 個檔案")
+        if args.terms:
+            for item in search(conn, args.terms, "any" if args.any else "all", args.field, args.limit):
+                print(f"{item['date']}  {item['title']}  ({'、'.join(item['ingredients'])})")
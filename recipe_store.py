@@ -0,0 +1,538 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import string
+import tempfile
+
+from db import bump_data_version
+from recipe_index import parse_recipe_filename
+from recipe_search import build_static_index, index_recipe, remove_recipe, search
+
+# 產生過的食譜以結構化資料存在 SQLite（與市場資料同一個資料庫），Markdown 只是它的輸出。
+# 修改描述、標籤或版型時，改資料或範本後執行 render 重新產生 content/recipes，
+# 只有輸出雜湊改變的檔案才會被寫入，Hugo 與 git 只看到真正的差異。
+
+RECIPE_ID_SQL = "SELECT id FROM recipes WHERE filename = ?"
+# 以 recipe_id 為鍵的子資料表
+CHILD_TABLES = ("recipe_ingredients", "recipe_steps", "recipe_images")
+DELETE_CHILDREN_SQL = "DELETE FROM {} WHERE recipe_id = ?"
+SET_RENDERED_HASH_SQL = """
+    UPDATE recipes SET rendered_hash = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE filename = ? RETURNING id
+"""
+# RecipeStore.load 整批讀出的四個查詢
+LOAD_SQL = {
+    "recipes": """
+        SELECT id, filename, title, publish_date, draft, description, tags, servings,
+               calories, price, image_prompt, rendered_hash
+        FROM recipes ORDER BY filename
+    """,
+    "ingredients": "SELECT recipe_id, name, amount, unit FROM recipe_ingredients ORDER BY recipe_id, position",
+    "steps": "SELECT recipe_id, text FROM recipe_steps ORDER BY recipe_id, position",
+    "images": "SELECT recipe_id, url, srcset, webp_srcset, placeholder FROM recipe_images",
+}
+
+DEFAULT_DESCRIPTION = "這是一道經典料理「{title}」，簡單易做，適合夏季與日常餐桌享用。"
+DEFAULT_TAGS = ["家常菜"]
+
+
+def create_recipe_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recipes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL UNIQUE,   -- content/recipes 下的檔名
+            title TEXT NOT NULL,
+            publish_date TEXT NOT NULL,      -- front matter 的 date (YYYY-MM-DD)
+            draft INTEGER NOT NULL DEFAULT 0,
+            description TEXT NOT NULL,
+            tags TEXT NOT NULL DEFAULT '[]', -- JSON 陣列
+            servings TEXT,
+            calories TEXT,
+            price TEXT,
+            image_prompt TEXT,
+            rendered_hash TEXT,              -- 最後一次寫出的 Markdown sha256
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recipe_ingredients (
+            recipe_id INTEGER NOT NULL REFERENCES recipes (id),
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            amount TEXT NOT NULL DEFAULT '',
+            unit TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (recipe_id, position)
+        ) WITHOUT ROWID
+    """)
+    # 依食材查詢食譜（例如哪些食譜用到某個當季作物）
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_ri_name
+        ON recipe_ingredients (name)
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recipe_steps (
+            recipe_id INTEGER NOT NULL REFERENCES recipes (id),
+            position INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (recipe_id, position)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recipe_images (
+            recipe_id INTEGER PRIMARY KEY REFERENCES recipes (id),
+            url TEXT NOT NULL,
+            srcset TEXT,
+            webp_srcset TEXT,
+            placeholder TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+class MarkdownTemplate:
+    """
+    以 {欄位} 標記的範本；建立時就切好 (文字, 欄位) 片段，render 只做字串串接
+    """
+
+    def __init__(self, text):
+        self.parts = []
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            if spec or conversion:
+                raise ValueError(f"範本欄位不支援格式設定：{field}")
+            self.parts.append((literal, field))
+
+    def render(self, values):
+        output = []
+        for literal, field in self.parts:
+            output.append(literal)
+            if field is not None:
+                output.append(values[field])
+        return "".join(output)
+
+
+RECIPE_TEMPLATE = MarkdownTemplate("""---
+title: "{title}"
+date: {date}
+draft: {draft}
+{cover}
+description: "{description}"
+tags: {tags}
+theme: "light"
+---
+
+## 🥄 每人卡路里  
+{calories}
+
+## 💰 預估成本  
+{price}
+
+---
+
+## 🧾 食材準備（約 2~3 人份）
+
+{ingredients}
+
+---
+
+## 👩‍🍳 作法步驟
+
+{steps}
+
+---
+
+## 📝 小提醒
+
+- 可依個人口味調整醬料濃淡。
+- 可搭配白飯、炒青菜組合成營養套餐。
+""")
+
+
+def cover_front_matter(image):
+    """
+    cover 與響應式圖片欄位；image 為 image_info 或 None（圖片尚未生成）
+    """
+    if image is None:
+        return 'cover: ""'
+    lines = [f'cover: "{image["url"]}"']
+    if image.get("placeholder"):
+        lines += [
+            f'coverSrcset: "{image["srcset"]}"',
+            f'coverWebpSrcset: "{image["webp_srcset"]}"',
+            f'coverPlaceholder: "{image["placeholder"]}"',
+        ]
+    return "\n".join(lines)
+
+
+def new_record(title, converted_recipe, image, date=None):
+    """
+    由轉換後的 LLM 食譜組成一筆食譜資料（render_recipe 與 RecipeStore.save 使用的格式）
+    """
+    return {
+        "title": title,
+        "date": date or datetime.datetime.now().strftime("%Y-%m-%d"),
+        "draft": False,
+        "description": DEFAULT_DESCRIPTION.format(title=title),
+        "tags": list(DEFAULT_TAGS),
+        "servings": converted_recipe.get("servings"),
+        "calories": converted_recipe["calories"],
+        "price": converted_recipe["price"],
+        "image_prompt": converted_recipe.get("image_prompt"),
+        "ingredients": [
+            {"name": item["name"], "amount": item["amount"], "unit": item["unit"]}
+            for item in converted_recipe["ingredients"]
+        ],
+        "steps": list(converted_recipe["steps"]),
+        "image": image,
+    }
+
+
+def render_recipe(record):
+    return RECIPE_TEMPLATE.render({
+        "title": record["title"],
+        "date": record["date"],
+        "draft": "true" if record["draft"] else "false",
+        "cover": cover_front_matter(record["image"]),
+        "description": record["description"],
+        "tags": json.dumps(record["tags"], ensure_ascii=False),
+        "calories": f"{record['calories']}",
+        "price": f"{record['price']}",
+        "ingredients": "\n".join(
+            f"- {item['name']}：{item['amount']} {item['unit']}" for item in record["ingredients"]
+        ),
+        "steps": "\n".join(f"{i+1}. {step}" for i, step in enumerate(record["steps"])),
+    })
+
+
+def content_hash(markdown):
+    return hashlib.sha256(markdown.encode("utf-8")).hexdigest()
+
+
+def atomic_write(path, text):
+    """
+    先寫到同目錄的暫存檔再 os.replace，讀取端（Hugo、git）不會看到寫到一半的檔案
+    """
+    directory = os.path.dirname(path) or "."
+    # 以 . 開頭的暫存檔不會被 Hugo 與食譜索引當成食譜
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        # mkstemp 建立的檔案權限是 0600；沿用原檔權限，新檔則與一般寫入相同
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def file_hash(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+_FRONT_MATTER_LINE_RE = re.compile(r"^(\w+): (.*)$", re.MULTILINE)
+_STEP_LINE_RE = re.compile(r"^\d+\. (.*)$")
+
+
+def parse_markdown(markdown):
+    """
+    把 render_recipe 格式的 Markdown 解析回食譜資料；不是這個格式時回傳 None
+    """
+    if not markdown.startswith("---\n"):
+        return None
+    front, _, body = markdown[4:].partition("\n---\n")
+    fields = {}
+    for key, value in _FRONT_MATTER_LINE_RE.findall(front):
+        fields[key] = value[1:-1] if len(value) >= 2 and value[0] == value[-1] == '"' else value
+    if "title" not in fields or "date" not in fields:
+        return None
+
+    sections = {}
+    heading = None
+    for line in body.split("\n"):
+        if line.startswith("## "):
+            heading = line[3:].strip()
+            sections[heading] = []
+        elif heading is not None and line.strip() and line != "---":
+            sections[heading].append(line)
+
+    def section(prefix):
+        for name, lines in sections.items():
+            if name.startswith(prefix):
+                return lines
+        return []
+
+    ingredients = []
+    for line in section("🧾"):
+        if not line.startswith("- ") or "：" not in line:
+            continue
+        name, _, quantity = line[2:].partition("：")
+        amount, _, unit = quantity.rpartition(" ")
+        ingredients.append({"name": name, "amount": amount, "unit": unit})
+    steps = [match.group(1) for match in map(_STEP_LINE_RE.match, section("👩‍🍳")) if match]
+
+    image = None
+    if fields.get("cover"):
+        image = {"url": fields["cover"]}
+        if fields.get("coverPlaceholder"):
+            image.update(
+                srcset=fields.get("coverSrcset", ""),
+                webp_srcset=fields.get("coverWebpSrcset", ""),
+                placeholder=fields["coverPlaceholder"],
+            )
+    try:
+        tags = json.loads(fields.get("tags", "[]"))
+    except json.JSONDecodeError:
+        tags = list(DEFAULT_TAGS)
+    return {
+        "title": fields["title"],
+        "date": fields["date"],
+        "draft": fields.get("draft") == "true",
+        "description": fields.get("description", DEFAULT_DESCRIPTION.format(title=fields["title"])),
+        "tags": tags,
+        "servings": None,
+        "calories": "\n".join(section("🥄")),
+        "price": "\n".join(section("💰")),
+        "image_prompt": None,
+        "ingredients": ingredients,
+        "steps": steps,
+        "image": image,
+    }
+
+
+class RecipeStore:
+    """
+    結構化食譜資料的讀寫與 Markdown 批次輸出；寫入走連線池的單一寫入連線
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def save(self, filename, record, rendered_hash=None, created_at=None):
+        """
+        新增或覆寫一筆食譜（以檔名為鍵），食材、步驟與圖片整批替換
+        """
+        with self.pool.transaction() as conn:
+            recipe_id = conn.execute(
+                """
+                INSERT INTO recipes (filename, title, publish_date, draft, description, tags, servings,
+                                     calories, price, image_prompt, rendered_hash, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                ON CONFLICT (filename) DO UPDATE SET
+                    title = excluded.title, publish_date = excluded.publish_date, draft = excluded.draft,
+                    description = excluded.description, tags = excluded.tags, servings = excluded.servings,
+                    calories = excluded.calories, price = excluded.price, image_prompt = excluded.image_prompt,
+                    rendered_hash = excluded.rendered_hash, updated_at = CURRENT_TIMESTAMP
+                RETURNING id
+                """,
+                (
+                    filename, record["title"], record["date"], int(record["draft"]), record["description"],
+                    json.dumps(record["tags"], ensure_ascii=False), record.get("servings"),
+                    record["calories"], record["price"], record.get("image_prompt"), rendered_hash, created_at,
+                ),
+            ).fetchone()[0]
+            conn.execute(DELETE_CHILDREN_SQL.format("recipe_ingredients"), (recipe_id,))
+            conn.executemany(
+                "INSERT INTO recipe_ingredients (recipe_id, position, name, amount, unit) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (recipe_id, position, item["name"], f"{item['amount']}", f"{item['unit']}")
+                    for position, item in enumerate(record["ingredients"])
+                ],
+            )
+            conn.execute(DELETE_CHILDREN_SQL.format("recipe_steps"), (recipe_id,))
+            conn.executemany(
+                "INSERT INTO recipe_steps (recipe_id, position, text) VALUES (?, ?, ?)",
+                [(recipe_id, position, step) for position, step in enumerate(record["steps"])],
+            )
+            self._write_image(conn, recipe_id, record["image"])
+            index_recipe(conn, recipe_id, record)
+            bump_data_version(conn, "recipes")
+        return recipe_id
+
+    def _write_image(self, conn, recipe_id, image):
+        if image is None:
+            conn.execute(DELETE_CHILDREN_SQL.format("recipe_images"), (recipe_id,))
+            return
+        conn.execute(
+            """
+            INSERT INTO recipe_images (recipe_id, url, srcset, webp_srcset, placeholder)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (recipe_id) DO UPDATE SET
+                url = excluded.url, srcset = excluded.srcset, webp_srcset = excluded.webp_srcset,
+                placeholder = excluded.placeholder, updated_at = CURRENT_TIMESTAMP
+            """,
+            (recipe_id, image["url"], image.get("srcset"), image.get("webp_srcset"), image.get("placeholder")),
+        )
+
+    def set_image(self, filename, image, rendered_hash=None):
+        """
+        生圖完成後回填封面；食譜不在資料庫時不做任何事
+        """
+        with self.pool.transaction() as conn:
+            row = conn.execute(SET_RENDERED_HASH_SQL, (rendered_hash, filename)).fetchone()
+            if row is not None:
+                self._write_image(conn, row[0], image)
+                bump_data_version(conn, "recipes")
+
+    def delete(self, filename):
+        with self.pool.transaction() as conn:
+            row = conn.execute(RECIPE_ID_SQL, (filename,)).fetchone()
+            if row is None:
+                return False
+            for table in CHILD_TABLES:
+                conn.execute(DELETE_CHILDREN_SQL.format(table), (row[0],))
+            conn.execute("DELETE FROM recipes WHERE id = ?", (row[0],))
+            remove_recipe(conn, row[0])
+            bump_data_version(conn, "recipes")
+        return True
+
+    def search(self, terms, mode="all", field=None, limit=20):
+        with self.pool.read() as conn:
+            return search(conn, terms, mode, field, limit)
+
+    def build_search_index(self, out_dir):
+        with self.pool.read() as conn:
+            return build_static_index(conn, out_dir)
+
+    def load(self, filenames=None):
+        """
+        回傳 {檔名: (id, 食譜資料, rendered_hash)}；整批以四個查詢讀出再於 Python 組合
+        """
+        with self.pool.read() as conn:
+            rows, ingredients, steps, images = (
+                conn.execute(LOAD_SQL[name]).fetchall() for name in ("recipes", "ingredients", "steps", "images")
+            )
+
+        wanted = set(filenames) if filenames is not None else None
+        records = {}
+        by_id = {}
+        for (recipe_id, filename, title, publish_date, draft, description, tags, servings,
+             calories, price, image_prompt, rendered_hash) in rows:
+            if wanted is not None and filename not in wanted:
+                continue
+            record = {
+                "title": title, "date": publish_date, "draft": bool(draft), "description": description,
+                "tags": json.loads(tags), "servings": servings, "calories": calories, "price": price,
+                "image_prompt": image_prompt, "ingredients": [], "steps": [], "image": None,
+            }
+            records[filename] = (recipe_id, record, rendered_hash)
+            by_id[recipe_id] = record
+        for recipe_id, name, amount, unit in ingredients:
+            if recipe_id in by_id:
+                by_id[recipe_id]["ingredients"].append({"name": name, "amount": amount, "unit": unit})
+        for recipe_id, text in steps:
+            if recipe_id in by_id:
+                by_id[recipe_id]["steps"].append(text)
+        for recipe_id, url, srcset, webp_srcset, placeholder in images:
+            if recipe_id in by_id:
+                image = {"url": url}
+                if placeholder:
+                    image.update(srcset=srcset or "", webp_srcset=webp_srcset or "", placeholder=placeholder)
+                by_id[recipe_id]["image"] = image
+        return records
+
+    def render_all(self, recipe_dir, filenames=None, verify=False, dry_run=False):
+        """
+        由資料庫重新產生 Markdown，回傳 {"total", "written", "unchanged", "files"}（files 為寫入的檔名）。
+        輸出雜湊與上次寫出的相同就不碰檔案；verify=True 時改成與磁碟上的檔案內容比對（可蓋掉手動修改）。
+        """
+        stats = {"total": 0, "written": 0, "unchanged": 0, "files": []}
+        hashes = []
+        for filename, (recipe_id, record, rendered_hash) in self.load(filenames).items():
+            stats["total"] += 1
+            markdown = render_recipe(record)
+            digest = content_hash(markdown)
+            path = os.path.join(recipe_dir, filename)
+            if not verify and digest == rendered_hash and os.path.exists(path):
+                stats["unchanged"] += 1
+                continue
+            if file_hash(path) == digest:
+                stats["unchanged"] += 1
+            else:
+                stats["written"] += 1
+                stats["files"].append(filename)
+                if dry_run:
+                    continue
+                atomic_write(path, markdown)
+            if digest != rendered_hash:
+                hashes.append((digest, recipe_id))
+        if hashes and not dry_run:
+            with self.pool.transaction() as conn:
+                conn.executemany("UPDATE recipes SET rendered_hash = ? WHERE id = ?", hashes)
+        return stats
+
+    def import_markdown(self, recipe_dir, overwrite=False):
+        """
+        匯入資料庫還沒有的既有 Markdown，回傳 {"imported", "skipped", "unparsed", "changed"}；
+        changed 為重新輸出後內容會改變的檔名（舊版型或手動修改過）
+        """
+        stats = {"imported": 0, "skipped": 0, "unparsed": [], "changed": []}
+        existing = set() if overwrite else set(self.load())
+        for filename in sorted(os.listdir(recipe_dir)):
+            parsed_name = parse_recipe_filename(filename)
+            if parsed_name is None:
+                continue
+            if filename in existing:
+                stats["skipped"] += 1
+                continue
+            with open(os.path.join(recipe_dir, filename), "r", encoding="utf-8") as f:
+                markdown = f.read()
+            record = parse_markdown(markdown)
+            if record is None:
+                stats["unparsed"].append(filename)
+                continue
+            # rendered_hash 記錄磁碟上的內容，版型不同的檔案下次 render 時才會改寫
+            digest = content_hash(markdown)
+            self.save(filename, record, digest, parsed_name[0].strftime("%Y-%m-%d %H:%M:%S"))
+            stats["imported"] += 1
+            if content_hash(render_recipe(record)) != digest:
+                stats["changed"].append(filename)
+        return stats
+
+
+# 執行：python recipe_store.py import [--database new.db] [--recipe-dir content/recipes/]
+#       python recipe_store.py render [--verify] [--dry-run] [檔名 ...]
+if __name__ == "__main__":
+    from db import ConnectionPool
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(description="結構化食譜資料：匯入既有 Markdown 或重新輸出")
+    parser.add_argument("command", choices=("import", "render"))
+    parser.add_argument("filenames", nargs="*")
+    parser.add_argument("--database", default="new.db")
+    parser.add_argument("--recipe-dir", default="content/recipes/")
+    parser.add_argument("--overwrite", action="store_true", help="import：覆寫資料庫已有的食譜")
+    parser.add_argument("--verify", action="store_true", help="render：與磁碟上的檔案比對而非上次輸出的雜湊")
+    parser.add_argument("--dry-run", action="store_true", help="render：只列出會改寫的檔案")
+    args = parser.parse_args()
+
+    migrate(args.database)
+    pool = ConnectionPool(args.database)
+    store = RecipeStore(pool)
+    try:
+        if args.command == "import":
+            stats = store.import_markdown(args.recipe_dir, args.overwrite)
+            print(f"匯入 {stats['imported']} 篇，略過 {stats['skipped']} 篇")
+            for filename in stats["unparsed"]:
+                print(f"    無法解析：{filename}")
+            for filename in stats["changed"]:
+                print(f"    重新輸出後會改變：{filename}")
+        else:
+            stats = store.render_all(args.recipe_dir, args.filenames or None, args.verify, args.dry_run)
+            verb = "會改寫" if args.dry_run else "改寫"
+            print(f"共 {stats['total']} 篇，{verb} {stats['written']} 篇，未變更 {stats['unchanged']} 篇")
+            for filename in stats["files"]:
+                print(f"    {filename}")
+    finally:
+        pool.close()
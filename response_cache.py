@@ -0,0 +1,140 @@
+import datetime
+import functools
+import gzip
+import hashlib
+import threading
+
+from flask import request, make_response
+
+# 最多保留的回應數量，超過時淘汰最早建立的
+MAX_ENTRIES = 256
+# 小於這個大小的回應壓縮不划算，直接回傳原文
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+
+
+def normalize_args(args):
+    """
+    查詢參數正規化：依名稱與值排序，重複的參數保留所有值
+    """
+    return tuple(sorted((key, value) for key, values in args.lists() for value in values))
+
+
+class ResponseCache:
+    """
+    讀取型路由的回應快取。鍵為路由 + 正規化的查詢參數 + 今天日期（預設月份、「今天」的交易日會跟著換），
+    每筆回應帶著所屬的資料群組（tags），資料寫入後以 invalidate(tag) 清掉相關回應。
+    指定 versions（回傳 {資料群組: 版本號} 的函式）時，每筆回應記下建立時各 tag 的版本，
+    查詢時版本不同就重新計算，其他程序寫入資料庫後也不會回傳舊內容。
+    回應以 body 的 SHA-256 作為強 ETag，If-None-Match 相符時回傳 304；用戶端接受 gzip 時只壓縮一次並重用。
+    """
+
+    def __init__(self, versions=None, max_entries=MAX_ENTRIES):
+        self.versions = versions
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0
+        self._stats = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+
+    def _key(self):
+        return (request.path, normalize_args(request.args), datetime.date.today().isoformat())
+
+    def _versions(self, tags):
+        if self.versions is None:
+            return ()
+        current = self.versions()
+        return tuple(current.get(tag, 0) for tag in tags)
+
+    def cached(self, *tags):
+        """
+        路由裝飾器：只快取狀態碼 200 的回應
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                key = self._key()
+                # 先取版本再計算：計算期間有寫入時，存下的是舊版本，下一次查詢就會重算
+                versions = self._versions(tags)
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None and entry["versions"] != versions:
+                        del self._entries[key]
+                        entry = None
+                    self._stats["hits" if entry else "misses"] += 1
+                    generation = self._generation
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.direct_passthrough:
+                        return response
+                    entry = self._store(key, tags, versions, response, generation)
+                return self._respond(entry)
+            return wrapper
+        return decorator
+
+    def _store(self, key, tags, versions, response, generation):
+        body = response.get_data()
+        entry = {
+            "body": body,
+            "gzip": None,
+            "etag": hashlib.sha256(body).hexdigest(),
+            "mimetype": response.mimetype,
+            "tags": set(tags),
+            "versions": versions,
+        }
+        with self._lock:
+            # 計算期間資料已被寫入時不存，避免把舊資料放回快取
+            if generation == self._generation:
+                self._entries.pop(key, None)
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+        return entry
+
+    def _gzip_body(self, entry):
+        if entry["gzip"] is None:
+            entry["gzip"] = gzip.compress(entry["body"], compresslevel=GZIP_LEVEL, mtime=0)
+        return entry["gzip"]
+
+    def _respond(self, entry):
+        use_gzip = len(entry["body"]) >= GZIP_MIN_BYTES and "gzip" in request.accept_encodings
+        # 壓縮後是不同的表示法，強 ETag 也要不同
+        etag = f"{entry['etag']}-gzip" if use_gzip else entry["etag"]
+        if request.if_none_match.contains(etag):
+            with self._lock:
+                self._stats["not_modified"] += 1
+            response = make_response("", 304)
+        else:
+            response = make_response(self._gzip_body(entry) if use_gzip else entry["body"], 200)
+            response.mimetype = entry["mimetype"]
+            if use_gzip:
+                response.headers["Content-Encoding"] = "gzip"
+        response.set_etag(etag)
+        response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def invalidate(self, *tags):
+        """
+        清掉屬於任一 tag 的回應；不帶參數時全部清除
+        """
+        with self._lock:
+            self._generation += 1
+            self._stats["invalidations"] += 1
+            if not tags:
+                self._entries.clear()
+                return
+            wanted = set(tags)
+            for key in [key for key, entry in self._entries.items() if entry["tags"] & wanted]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else None,
+                "entries": len(self._entries),
+                "bytes": sum(len(entry["body"]) + len(entry["gzip"] or b"") for entry in self._entries.values()),
+                "max_entries": self.max_entries,
+            }
@@ -0,0 +1,73 @@
+import threading
+
+# 季節食材的月份以位元遮罩表示：第 month - 1 個位元代表該月當季
+ALL_MONTHS = range(1, 13)
+
+# SeasonalCalendar 的資料來源與 /fetch_combined_data 的既有食材清單
+SEASONAL_ROWS_SQL = "SELECT name, type, month_mask FROM seasonal_ingredients"
+SEASONAL_NAMES_SQL = "SELECT name FROM seasonal_ingredients"
+
+
+def month_bit(month):
+    return 1 << (month - 1)
+
+
+def month_mask(month_start, month_end):
+    """
+    把 (起始月, 結束月) 轉成位元遮罩；起始月大於結束月表示跨年，例如 11 月到隔年 2 月
+    """
+    if month_start is None or month_end is None:
+        return 0
+    if month_start <= month_end:
+        months = range(month_start, month_end + 1)
+    else:  # 跨年
+        months = [month for month in ALL_MONTHS if month >= month_start or month <= month_end]
+    mask = 0
+    for month in months:
+        mask |= month_bit(month)
+    return mask
+
+
+def parse_month(value):
+    """
+    解析查詢參數中的月份，不是 1～12 的整數回傳 None
+    """
+    try:
+        month = int(value)
+    except (TypeError, ValueError):
+        return None
+    return month if month in ALL_MONTHS else None
+
+
+class SeasonalCalendar:
+    """
+    月份 → 當季食材的程序內索引。
+    第一次查詢時以 loader 讀出 (name, type, month_mask) 建立 12 個月份桶，
+    寫入季節食材後呼叫 invalidate()，下一次查詢再重建。
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._buckets = None
+
+    def _build(self):
+        buckets = {month: [] for month in ALL_MONTHS}
+        for name, type_, mask in self._loader():
+            for month in ALL_MONTHS:
+                if mask & month_bit(month):
+                    buckets[month].append({"name": name, "type": type_})
+        return buckets
+
+    def for_month(self, month):
+        buckets = self._buckets
+        if buckets is None:
+            with self._lock:
+                if self._buckets is None:
+                    self._buckets = self._build()
+                buckets = self._buckets
+        return list(buckets[month])
+
+    def invalidate(self):
+        with self._lock:
+            self._buckets = None
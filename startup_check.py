@@ -0,0 +1,90 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+# 冷啟動檢查：以 python -X importtime 在乾淨的子程序匯入各模組，確認
+#   1. app 的匯入時間不超過上限（取多次中最快的一次，降低雜訊）
+#   2. 延後載入的重量級套件沒有在匯入時被拉進來
+#   3. 匯入不會在目前目錄建立任何檔案（目錄、資料庫都留給 create_app / init）
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# app 匯入時間上限（毫秒）；其中 Flask 本身約佔 200 ms
+MAX_IMPORT_MS = 400
+RUNS = 5
+# 要檢查的模組與匯入時不應載入的套件
+DEFERRED_MODULES = {
+    "app": ("git", "json_repair", "numpy", "pyarrow", "requests", "opencc", "flask_cors"),
+    "recipe_md": ("git", "json_repair", "numpy", "requests", "opencc"),
+    "ingest": ("git", "requests", "numpy", "opencc"),
+    "publisher": ("git",),
+    "llm_parser": ("json_repair",),
+}
+
+
+def import_profile(module, cwd):
+    """
+    在子程序匯入 module，回傳 (該模組的累計匯入毫秒數, 載入的所有模組名稱)
+    """
+    env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, env=env, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"匯入 {module} 失敗：\n{completed.stderr[-2000:]}")
+
+    total_us = None
+    loaded = set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # 標題列
+        name = name.strip()
+        loaded.add(name)
+        if name == module:
+            total_us = int(cumulative)
+    return (total_us or 0) / 1000, loaded
+
+
+def check(max_ms=MAX_IMPORT_MS, runs=RUNS):
+    """
+    回傳問題清單；清單為空表示通過
+    """
+    problems = []
+    with tempfile.TemporaryDirectory() as cwd:
+        for module, deferred in DEFERRED_MODULES.items():
+            timings = []
+            loaded = set()
+            for _ in range(runs if module == "app" else 1):
+                elapsed, loaded = import_profile(module, cwd)
+                timings.append(elapsed)
+            best = min(timings)
+            print(f"{module:<12} {best:8.1f} ms")
+            eager = sorted(name for name in deferred if name in loaded)
+            if eager:
+                problems.append(f"{module} 匯入時載入了應延後的套件：{', '.join(eager)}")
+            if module == "app" and best > max_ms:
+                problems.append(f"app 匯入需要 {best:.1f} ms，超過上限 {max_ms} ms")
+        leftovers = sorted(os.listdir(cwd))
+        if leftovers:
+            problems.append(f"匯入時在目前目錄建立了檔案：{', '.join(leftovers)}")
+    return problems
+
+
+# 執行：python startup_check.py [--max-ms 400] [--runs 5]；未通過時以狀態碼 1 結束
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以 -X importtime 檢查冷啟動時間與延後載入的套件")
+    parser.add_argument("--max-ms", type=float, default=MAX_IMPORT_MS)
+    parser.add_argument("--runs", type=int, default=RUNS)
+    args = parser.parse_args()
+
+    problems = check(args.max_ms, args.runs)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        sys.exit(1)
+    print("✅ 冷啟動檢查通過")
@@ -0,0 +1,86 @@
+// 前端食譜搜尋：讀取 recipe_search.py 輸出的 static/search/ 分片索引。
+// 只下載查詢詞用到的分片，再以 docs.json 的標題與食材確認完整字串。
+//
+//   recipeSearch("絲瓜 茄子", { mode: "any" }).then(function (results) { ... });
+//
+// 每筆結果為 { url, title, date, cover, ingredients }。
+(function () {
+  var base = "/search/";
+  var manifest = null;
+  var docs = null;
+  var shards = {};
+
+  function fetchJSON(name) {
+    return fetch(base + name).then(function (response) {
+      if (!response.ok) throw new Error("無法載入搜尋索引：" + name);
+      return response.json();
+    });
+  }
+
+  function load() {
+    if (!manifest) {
+      manifest = Promise.all([fetchJSON("index.json"), fetchJSON("docs.json")]).then(function (loaded) {
+        docs = loaded[1];
+        return loaded[0];
+      });
+    }
+    return manifest;
+  }
+
+  function shard(gram, count) {
+    var number = gram.codePointAt(0) % count;
+    if (!shards[number]) {
+      shards[number] = fetchJSON("shard-" + (number < 10 ? "0" : "") + number + ".json");
+    }
+    return shards[number].then(function (map) { return map[gram] || []; });
+  }
+
+  // 與 recipe_search.grams 相同：以空白與標點切段、轉小寫，每段取雙字組（只有一個字時取單字）
+  function grams(term) {
+    var result = [];
+    term.toLowerCase().split(/[\s\p{P}\p{S}_]+/u).forEach(function (chunk) {
+      var chars = Array.from(chunk);
+      if (chars.length === 1) result.push(chars[0]);
+      for (var i = 0; i < chars.length - 1; i++) result.push(chars[i] + chars[i + 1]);
+    });
+    return result;
+  }
+
+  function termMatches(term, count) {
+    var list = grams(term);
+    if (!list.length) return Promise.resolve(null);
+    return Promise.all(list.map(function (gram) { return shard(gram, count); })).then(function (postings) {
+      // 每個雙字組都出現的文件，再確認整個詞確實出現在標題或食材中
+      var ids = postings.reduce(function (acc, ids) {
+        return acc.filter(function (id) { return ids.indexOf(id) !== -1; });
+      });
+      var needle = term.toLowerCase();
+      return ids.filter(function (id) {
+        return [docs[id][1]].concat(docs[id][4]).some(function (text) {
+          return text.toLowerCase().indexOf(needle) !== -1;
+        });
+      });
+    });
+  }
+
+  window.recipeSearch = function (query, options) {
+    var any = options && options.mode === "any";
+    var terms = String(query || "").split(/[\s,，、;；]+/).filter(Boolean);
+    if (!terms.length) return Promise.resolve([]);
+    return load().then(function (index) {
+      return Promise.all(terms.map(function (term) { return termMatches(term, index.shards); }));
+    }).then(function (matches) {
+      var sets = matches.filter(function (ids) { return ids !== null; });
+      if (!sets.length) return [];
+      var ids = sets.reduce(function (acc, next) {
+        if (any) return acc.concat(next.filter(function (id) { return acc.indexOf(id) === -1; }));
+        return acc.filter(function (id) { return next.indexOf(id) !== -1; });
+      });
+      // 新的食譜排前面（docs 依檔名，也就是產生時間排序）
+      return ids.sort(function (a, b) { return b - a; }).map(function (id) {
+        var doc = docs[id];
+        return { url: doc[0], title: doc[1], date: doc[2], cover: doc[3], ingredients: doc[4] };
+      });
+    });
+  };
+})();
@@ -0,0 +1,189 @@
+import json
+import struct
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# 本機假服務：在不連外網、不開 GPU 的情況下驗證資料匯入與生圖流程
+
+
+class _StubServer:
+    """
+    在背景執行緒啟動 HTTP 服務，支援 with 語法，離開時自動關閉
+    """
+
+    handler_class = BaseHTTPRequestHandler
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), self.handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _MoaHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/api/v1/AgriProductsTransType":
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        date_str = query.get("Start_time", [""])[0]
+        stub.requests.append(date_str)
+        body = json.dumps(
+            {"RS": "OK", "Data": stub.data_by_date.get(date_str, [])},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        # 分段寫出，模擬大型回應以驗證串流解析
+        for offset in range(0, len(body), 4096):
+            self.wfile.write(body[offset:offset + 4096])
+
+
+class FakeMoaServer(_StubServer):
+    """
+    模擬農業部 AgriProductsTransType API。
+    data_by_date 以民國日期字串（如 "114.04.16"）對應該日的交易資料陣列。
+    """
+
+    handler_class = _MoaHandler
+
+    def __init__(self, data_by_date=None, **kwargs):
+        super().__init__(**kwargs)
+        self.data_by_date = data_by_date or {}
+        self.requests = []
+
+    @property
+    def api_url(self):
+        return f"{self.base_url}/api/v1/AgriProductsTransType/"
+
+
+def solid_png(width=64, height=64, rgb=(230, 200, 120)):
+    """
+    產生單色 PNG，作為假 ComfyUI 的輸出圖片
+    """
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    row = b"\x00" + bytes(rgb) * width
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(row * height))
+        + chunk(b"IEND", b"")
+    )
+
+
+class _ComfyUIHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        stub = self.server.stub
+        if urlparse(self.path).path != "/prompt":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+        prompt_id = uuid.uuid4().hex
+        output_node = next(
+            (node_id for node_id, node in payload["prompt"].items() if node.get("class_type") == "SaveImage"),
+            "9",
+        )
+        with stub.lock:
+            stub.prompts[prompt_id] = {
+                "payload": payload,
+                "output_node": output_node,
+                "ready_at": time.monotonic() + stub.render_latency,
+                "submitted_at": time.time(),
+            }
+        self._send_json({"prompt_id": prompt_id, "number": len(stub.prompts)})
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        if url.path.startswith("/history/"):
+            prompt_id = url.path.rsplit("/", 1)[1]
+            with stub.lock:
+                stub.history_requests += 1
+                job = stub.prompts.get(prompt_id)
+            if job is None or time.monotonic() < job["ready_at"]:
+                self._send_json({})
+                return
+            image = {"filename": f"{prompt_id}.png", "subfolder": "", "type": "output"}
+            # 與 ComfyUI 相同，status.messages 帶開始與完成的時間戳（毫秒）；stub 沒有排隊，提交即開始
+            started_ms = int(job["submitted_at"] * 1000)
+            status = {"status_str": "success", "completed": True, "messages": [
+                ["execution_start", {"prompt_id": prompt_id, "timestamp": started_ms}],
+                ["execution_success", {"prompt_id": prompt_id, "timestamp": started_ms + int(stub.render_latency * 1000)}],
+            ]}
+            self._send_json({prompt_id: {"outputs": {job["output_node"]: {"images": [image]}}, "status": status}})
+        elif url.path == "/view":
+            body = stub.image_bytes
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+
+class StubComfyUI(_StubServer):
+    """
+    模擬 ComfyUI 的 /prompt、/history/<prompt_id> 與 /view。
+    提交後經過 render_latency 秒才會在 history 出現結果。
+    """
+
+    handler_class = _ComfyUIHandler
+
+    def __init__(self, render_latency=0.5, image_bytes=None, **kwargs):
+        super().__init__(**kwargs)
+        self.render_latency = render_latency
+        self.image_bytes = image_bytes or solid_png()
+        self.prompts = {}
+        self.history_requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def prompt_url(self):
+        return f"{self.base_url}/prompt"
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+from db import ConnectionPool
+from migrations import migrate
+
+
+def transaction_row(trans_date, crop_name, quantity, price=30.0, market_code="104", crop_code=None, tc_type="N04"):
+    """
+    與 ingest.item_to_row 相同欄位順序的一筆交易
+    """
+    return (
+        trans_date, crop_code or crop_name, crop_name, tc_type,
+        market_code, f"市場{market_code}", price * 1.5, price, price * 0.5, price, quantity,
+    )
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "test.db")
+    migrate(path)
+    return path
+
+
+@pytest.fixture
+def pool(database):
+    pool = ConnectionPool(database)
+    pool.init()
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def raw_conn(database):
+    conn = sqlite3.connect(database, isolation_level=None)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def seasonal(pool):
+    """
+    寫入幾筆季節食材並重建作物對照：甘藍、苦瓜全年，絲瓜 5~9 月
+    """
+    from crop_matching import rebuild_crop_map
+    from seasonal import month_mask
+
+    rows = [("甘藍", "蔬菜", 1, 12), ("苦瓜", "蔬菜", 1, 12), ("絲瓜", "蔬菜", 5, 9)]
+    with pool.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO seasonal_ingredients (name, type, month_start, month_end, month_mask) VALUES (?, ?, ?, ?, ?)",
+            [(name, kind, start, end, month_mask(start, end)) for name, kind, start, end in rows],
+        )
+        rebuild_crop_map(conn)
+    return rows
+
+
+@pytest.fixture
+def client(database, monkeypatch):
+    import app
+
+    flask_app = app.create_app(database)
+    # 快取與快照是模組層級的共用物件，每個測試都從空的開始
+    app.response_cache.invalidate()
+    app.seasonal_calendar.invalidate()
+    monkeypatch.setattr(app, "price_history", None)
+    monkeypatch.setattr(app, "cost_engine", None)
+    monkeypatch.setattr(app, "crop_matcher", None)
+    yield flask_app.test_client()
+    app.db.close()
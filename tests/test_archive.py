@@ -0,0 +1,49 @@
+import datetime
+
+from archive import Archive, compact
+from conftest import transaction_row
+from crop_matching import CROP_MAP_TABLE, rebuild_crop_map
+from ingest import store_rows
+
+TODAY = datetime.date(2025, 4, 16)
+
+
+def test_compact_writes_next_to_database(pool, raw_conn, database, tmp_path, monkeypatch):
+    store_rows(pool, [
+        transaction_row("113.12.02", "甘藍-初秋", 100),
+        transaction_row("114.04.15", "甘藍-初秋", 120),
+    ])
+    # 與目前工作目錄無關
+    monkeypatch.chdir(tmp_path.parent)
+    archived = compact(raw_conn, today=TODAY)
+
+    assert archived == {"2024-12": 1}
+    archive = Archive.for_database(database)
+    assert archive.archive_dir == str(tmp_path / "archive")
+    assert archive.partitions() == ["2024-12"]
+    assert raw_conn.execute("SELECT trans_date FROM product_transactions").fetchall() == [("114.04.15",)]
+
+
+def test_null_crop_names_are_not_encoded(pool, raw_conn, tmp_path):
+    store_rows(pool, [
+        transaction_row("113.12.02", "甘藍-初秋", 100),
+        transaction_row("113.12.02", None, 50, crop_code="X1"),
+    ])
+    archive = Archive(str(tmp_path / "parts"))
+    compact(raw_conn, archive, today=TODAY)
+
+    assert archive.crop_names() == ["甘藍-初秋"]
+    assert len(archive.read_partition("2024-12")["day"]) == 1
+
+
+def test_rebuild_keeps_mappings_of_archived_crops(pool, raw_conn, seasonal, tmp_path):
+    store_rows(pool, [
+        transaction_row("113.12.02", "苦瓜-白皮", 100),
+        transaction_row("114.04.15", "甘藍-初秋", 120),
+    ])
+    compact(raw_conn, Archive(str(tmp_path / "parts")), today=TODAY)
+    with pool.transaction() as conn:
+        rebuild_crop_map(conn)
+    mapped = dict(raw_conn.execute(f"SELECT crop_name, seasonal_name FROM {CROP_MAP_TABLE}").fetchall())
+    assert mapped == {"甘藍-初秋": "甘藍", "苦瓜-白皮": "苦瓜"}
+
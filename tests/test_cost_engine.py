@@ -0,0 +1,39 @@
+from conftest import transaction_row
+from cost_engine import IngredientMatcher
+from crop_matching import CropMatcher
+from db import ConnectionPool
+from ingest import store_rows
+
+SWEET_POTATOES = ["甘薯-其他", "甘薯-臺農57號"]
+
+
+def test_synonyms_reach_market_crop_names():
+    matcher = IngredientMatcher(SWEET_POTATOES + ["芫荽", "蘿蔔-其他"])
+    for name in ("地瓜", "番薯", "甘藷"):
+        assert matcher.match(name) == ("甘薯", SWEET_POTATOES)
+    assert matcher.match("香菜") == ("芫荽", ["芫荽"])
+    assert matcher.match("白蘿蔔") == ("蘿蔔", ["蘿蔔-其他"])
+
+
+def test_seasonal_map_uses_same_synonyms():
+    # 季節食材寫「地瓜」，交易行情寫「甘薯-*」
+    matcher = CropMatcher(["地瓜"])
+    assert [item["name"] for item in matcher.best_matches("甘薯-臺農57號")] == ["地瓜"]
+
+
+def test_cost_engine_reloads_after_external_ingest(client, database, pool):
+    import app
+
+    store_rows(pool, [transaction_row("114.04.16", "甘藍-初秋", 500)])
+    assert app.get_cost_engine().snapshot.crop_names == ["甘藍-初秋"]
+
+    # 另一個程序（ingest.py）寫入，app 沒有收到 invalidate()
+    other = ConnectionPool(database)
+    other.init()
+    try:
+        store_rows(other, [transaction_row("114.04.17", "甘薯-其他", 300)])
+    finally:
+        other.close()
+    engine = app.get_cost_engine()
+    assert sorted(engine.snapshot.crop_names) == ["甘薯-其他", "甘藍-初秋"]
+    assert engine.ingredient("地瓜")[4] == ["甘薯-其他"]
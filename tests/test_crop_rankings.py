@@ -0,0 +1,71 @@
+import datetime
+import logging
+
+from conftest import transaction_row
+from crop_rankings import compare_with_legacy, query_top_crops, query_top_crops_legacy
+from ingest import UPSERT_SQL, roc_date, store_rows
+
+DATES = ["114.04.16", "114.04.15"]
+
+
+def _rows():
+    rows = []
+    for trans_date in DATES:
+        # 甘藍、苦瓜交易量大，其餘在中位數以下
+        rows += [
+            transaction_row(trans_date, "甘藍-初秋", 500, market_code="104"),
+            transaction_row(trans_date, "甘藍-初秋", 800, market_code="109"),
+            transaction_row(trans_date, "苦瓜-其他", 300, market_code="104"),
+            transaction_row(trans_date, "絲瓜", 20, market_code="104"),
+            transaction_row(trans_date, "小白菜", 10, market_code="104"),
+            transaction_row(trans_date, "菠菜", 8, market_code="104"),
+            transaction_row(trans_date, "芹菜", 5, market_code="104"),
+        ]
+    return rows
+
+
+def test_store_rows_upserts_on_natural_key(pool):
+    store_rows(pool, _rows())
+    # 重跑同一天只更新價格與交易量，不產生重複列
+    store_rows(pool, [transaction_row("114.04.16", "甘藍-初秋", 900, price=42.0, market_code="109")])
+    with pool.read() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM product_transactions").fetchone()[0]
+        row = conn.execute(
+            "SELECT avg_price, trans_quantity FROM product_transactions "
+            "WHERE trans_date = ? AND crop_code = ? AND market_code = ?",
+            ("114.04.16", "甘藍-初秋", "109"),
+        ).fetchone()
+        top = conn.execute(
+            "SELECT market_code, trans_quantity FROM crop_daily_rankings WHERE trans_date = ? AND crop_name = ?",
+            ("114.04.16", "甘藍-初秋"),
+        ).fetchone()
+    assert count == len(_rows())
+    assert row == (42.0, 900)
+    assert top == ("109", 900)
+
+
+def test_summary_matches_legacy(pool, seasonal):
+    store_rows(pool, _rows())
+    with pool.read() as conn:
+        report = compare_with_legacy(conn, DATES)
+        month_report = compare_with_legacy(conn, DATES, season_month=4)
+        summary = [row[2] for row in query_top_crops(conn, DATES, season_month=4)]
+        legacy = [row[2] for row in query_top_crops_legacy(conn, DATES, season_month=4)]
+    assert report == {"shared": 2, "only_summary": [], "only_legacy": [], "mismatched": []}
+    assert month_report["mismatched"] == []
+    assert summary == legacy == ["甘藍-初秋", "苦瓜-其他"]
+
+
+def test_seasonal_top50_falls_back_to_legacy(client, raw_conn, caplog):
+    today = roc_date(datetime.date.today())
+    # 直接寫入原始表、不刷新摘要，模擬摘要尚未就緒
+    raw_conn.executemany(UPSERT_SQL, [
+        transaction_row(today, "甘藍-初秋", 500),
+        transaction_row(today, "苦瓜-其他", 100),
+        transaction_row(today, "絲瓜", 10),
+    ])
+    with caplog.at_level(logging.WARNING, logger="app"):
+        response = client.get("/seasonal_top50?seasonal=false")
+    assert response.status_code == 200
+    assert [row["crop_name"] for row in response.get_json()] == ["甘藍-初秋"]
+    assert "排行摘要尚未就緒" in caplog.text
@@ -0,0 +1,89 @@
+import os
+import time
+
+import pytest
+
+import image_jobs
+import recipe_md
+from image_cache import ImageCache
+from image_jobs import ImageJobQueue
+from stubs import StubComfyUI
+
+WORKFLOW = "flux_api.json"
+
+
+@pytest.fixture
+def image_dir(tmp_path, monkeypatch):
+    """
+    圖片與生圖快取寫到暫存目錄
+    """
+    image_dir = str(tmp_path / "images") + os.sep
+    os.makedirs(image_dir)
+    cache = ImageCache(str(tmp_path / "cache"))
+    for module in (recipe_md, image_jobs):
+        monkeypatch.setattr(module, "IMAGE_DIR", image_dir)
+        monkeypatch.setattr(module, "image_cache", cache)
+    return image_dir
+
+
+def test_job_runs_to_done(image_dir):
+    with StubComfyUI(render_latency=0.1) as stub:
+        queue = ImageJobQueue(stub.prompt_url)
+        job_id = queue.submit("a watercolor dish", "番茄炒蛋", WORKFLOW)
+        assert queue.get(job_id)["status"] in ("queued", "submitting", "rendering")
+        job = queue.wait(job_id, timeout=30)
+
+        assert job["status"] == "done", job["error"]
+        assert job["prompt_id"] in stub.prompts and not job["cached"]
+        assert job["image_url"].endswith("/番茄炒蛋.jpg")
+        assert os.path.exists(os.path.join(image_dir, "番茄炒蛋.jpg"))
+        # 原始下載檔轉檔後刪除
+        assert not [name for name in os.listdir(image_dir) if name.endswith(".download")]
+
+        # 相同 prompt 與 workflow 命中快取，不再送到 ComfyUI
+        again = queue.wait(queue.submit("a watercolor dish", "番茄炒蛋", WORKFLOW), timeout=30)
+        assert again["status"] == "done" and again["cached"]
+        assert len(stub.prompts) == 1
+
+
+def test_comfyui_failure_marks_job_failed(image_dir):
+    # 沒有服務在聽的連接埠
+    with StubComfyUI() as stub:
+        unreachable = stub.prompt_url
+    queue = ImageJobQueue(unreachable)
+    job = queue.wait(queue.submit("a watercolor dish", "番茄炒蛋", WORKFLOW), timeout=30)
+    assert job["status"] == "failed" and job["error"]
+    assert os.listdir(image_dir) == []
+
+
+def test_render_timeout_marks_job_failed(image_dir):
+    with StubComfyUI(render_latency=30) as stub:
+        queue = ImageJobQueue(stub.prompt_url, render_timeout=0.3)
+        job = queue.wait(queue.submit("a watercolor dish", "番茄炒蛋", WORKFLOW), timeout=30)
+    assert job["status"] == "failed"
+    assert "逾時" in job["error"]
+    assert os.listdir(image_dir) == []
+
+
+def test_image_job_routes(client, image_dir, monkeypatch):
+    import app
+
+    with StubComfyUI(render_latency=0.1) as stub:
+        monkeypatch.setattr(app, "image_jobs", ImageJobQueue(stub.prompt_url))
+        response = client.post("/generate_ingredients_image", json={
+            "image_prompt": "a watercolor dish", "titles": ["番茄炒蛋", "涼拌油麥菜"],
+        })
+        assert response.status_code == 202
+        status_url = response.get_json()["status_url"]
+
+        deadline = time.monotonic() + 30
+        while True:
+            job = client.get(status_url).get_json()
+            if job["status"] in ("done", "failed") or time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+
+    assert job["status"] == "done", job["error"]
+    assert job["recipe_name"] == "番茄炒蛋 涼拌油麥菜"
+    assert job["image"]["url"] == job["image_url"]
+    assert client.get("/image_jobs/missing").status_code == 404
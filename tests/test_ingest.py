@@ -0,0 +1,75 @@
+import datetime
+import json
+
+import pytest
+
+from ingest import backfill, fetch_day_rows, ingest_day, iter_json_array, make_session, roc_date
+from stubs import FakeMoaServer
+
+DAY = datetime.date(2025, 4, 16)
+
+
+def moa_item(trans_date, crop_name, quantity, market_code="104", price=30.0):
+    return {
+        "TransDate": trans_date, "CropCode": crop_name, "CropName": crop_name, "TcType": "N04",
+        "MarketCode": market_code, "MarketName": f"市場{market_code}",
+        "Upper_Price": price * 1.5, "Middle_Price": price, "Lower_Price": price * 0.5,
+        "Avg_Price": price, "Trans_Quantity": quantity,
+    }
+
+
+def day_items(trans_date, count=300):
+    return [moa_item(trans_date, f"作物{i}", 100 + i, market_code=str(100 + i % 5)) for i in range(count)]
+
+
+def split_every(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 64])
+def test_iter_json_array_across_chunk_boundaries(size):
+    # 字串內的括號、逗號、跳脫字元與中文都可能剛好落在分段邊界上
+    items = [{"CropName": "甘藍-初秋", "note": 'a "quoted" ] , } value'}, {"CropName": "苦瓜\\n"}, {"n": [1, 2]}]
+    body = json.dumps({"RS": "OK", "Data": items}, ensure_ascii=False)
+    assert list(iter_json_array(split_every(body, size))) == items
+
+
+def test_iter_json_array_truncated_response():
+    body = json.dumps({"Data": [{"a": 1}, {"b": 2}]})[:-8]
+    with pytest.raises(ValueError):
+        list(iter_json_array(split_every(body, 5)))
+
+
+def test_fetch_day_rows_streams_from_api():
+    trans_date = roc_date(DAY)
+    with FakeMoaServer({trans_date: day_items(trans_date)}) as server, make_session(1) as session:
+        rows = fetch_day_rows(session, DAY, server.api_url)
+    assert len(rows) == 300
+    assert rows[0][:3] == (trans_date, "作物0", "作物0")
+    assert server.requests == [trans_date]
+
+
+def test_ingest_same_day_twice_keeps_row_count(pool):
+    trans_date = roc_date(DAY)
+    with FakeMoaServer({trans_date: day_items(trans_date)}) as server:
+        assert ingest_day(pool, DAY, api_url=server.api_url) == 300
+        assert ingest_day(pool, DAY, api_url=server.api_url) == 300
+    with pool.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM product_transactions").fetchone()[0] == 300
+        assert conn.execute("SELECT COUNT(*) FROM crop_daily_rankings").fetchone()[0] == 300
+
+
+def test_backfill_reports_failed_day(pool):
+    days = [DAY + datetime.timedelta(days=offset) for offset in range(3)]
+    data = {roc_date(day): day_items(roc_date(day), 50) for day in days}
+    # 第二天的資料缺欄位，只有這一天失敗
+    data[roc_date(days[1])] = [{"TransDate": roc_date(days[1])}]
+    with FakeMoaServer(data) as server:
+        stats = backfill(pool, days[0], days[-1], concurrency=2, api_url=server.api_url)
+
+    assert stats["days"] == 3
+    assert stats["rows"] == 100
+    assert list(stats["failed"]) == [roc_date(days[1])]
+    with pool.read() as conn:
+        dates = [row[0] for row in conn.execute("SELECT DISTINCT trans_date FROM product_transactions ORDER BY 1")]
+    assert dates == [roc_date(days[0]), roc_date(days[2])]
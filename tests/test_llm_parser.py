@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from llm_parser import iter_recipes, parse_llm_response, sample_response
+
+# 字串內的大括號、跳脫字元與中文都可能剛好落在分段邊界上
+TRICKY = [
+    {"name": "番茄炒蛋", "steps": ['把材料 {處理} 好，注意 "火候"。', "反斜線 \\ 與 } 結尾}"]},
+    {"name": "涼拌小黃瓜", "note": "\\\"]}, {\"recipes\": ["},
+]
+
+
+def split_every(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def tricky_response():
+    body = json.dumps({"recipes": TRICKY}, ensure_ascii=False)
+    return f"<think>先想想 {{ 與 }}，還有 \"recipes\": [ 這種字</think>\n以下是食譜：\n```json\n{body}\n```\n祝您用餐愉快！{{}}"
+
+
+def test_parse_llm_response():
+    response, expected = sample_response(recipe_count=3, think_chars=500)
+    assert parse_llm_response(response)["recipes"] == expected
+    assert parse_llm_response(tricky_response())["recipes"] == TRICKY
+
+
+def test_parse_llm_response_repairs_trailing_comma():
+    response, expected = sample_response(recipe_count=2, think_chars=100, broken=True)
+    assert parse_llm_response(response)["recipes"] == expected
+
+
+def test_parse_llm_response_rejects_missing_recipes():
+    with pytest.raises(ValueError):
+        parse_llm_response("今天沒有食譜。")
+    with pytest.raises(ValueError):
+        parse_llm_response('```json\n{"menu": []}\n```')
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 4096])
+def test_iter_recipes_across_chunk_boundaries(size):
+    # size 很小時 <think>、</think> 與 ```json 都會被切在兩段之間
+    assert list(iter_recipes(split_every(tricky_response(), size))) == TRICKY
+    response, expected = sample_response(recipe_count=3, think_chars=500)
+    assert list(iter_recipes(split_every(response, size))) == expected
+
+
+@pytest.mark.parametrize("size", [1, 5, 100])
+def test_iter_recipes_ignores_prose_before_fence(size):
+    response = '說明文字提到 "recipes": [ 清單如下\n```json\n{"recipes":[{"x":1}]}```'
+    assert list(iter_recipes(split_every(response, size))) == [{"x": 1}]
+
+
+def test_iter_recipes_without_fence():
+    assert list(iter_recipes(['{"reci', 'pes": [{"x": 1}, ', '{"y": 2}]}'])) == [{"x": 1}, {"y": 2}]
+
+
+def test_iter_recipes_recovers_truncated_last_recipe():
+    response = '```json\n{"recipes": [{"x": 1}, {"y": [1, 2'
+    assert list(iter_recipes(split_every(response, 4))) == [{"x": 1}, {"y": [1, 2]}]
+    with pytest.raises(ValueError):
+        list(iter_recipes(["沒有 JSON 的回應"]))
+
+
+def test_process_llm_stream_route(client):
+    response, expected = sample_response(recipe_count=3, think_chars=5000)
+    result = client.post("/process-llm/stream", data=response.encode("utf-8"))
+    assert result.mimetype == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in result.get_data(as_text=True).splitlines()]
+    assert [line["recipe"] for line in lines[:-1]] == expected
+    assert lines[-1] == {"done": True, "count": 3}
+
+    lines = [json.loads(line) for line in client.post("/process-llm/stream", data="沒有食譜").get_data(as_text=True).splitlines()]
+    assert list(lines[-1]) == ["error"]
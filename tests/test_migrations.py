@@ -0,0 +1,74 @@
+import sqlite3
+
+from conftest import transaction_row
+from migrations import MIGRATIONS, current_version, find_table_scans, migrate, query_checks
+
+
+def test_migrate_fresh_database_is_idempotent(database, raw_conn):
+    assert current_version(raw_conn) == MIGRATIONS[-1][0]
+    tables = {row[0] for row in raw_conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"product_transactions", "crop_daily_rankings", "crop_seasonal_map", "recipes", "data_versions"} <= tables
+
+    assert migrate(database) == MIGRATIONS[-1][0]
+
+
+def test_natural_key_migration_keeps_last_import(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path, isolation_level=None)
+    for _, _, step in MIGRATIONS[:3]:
+        step(conn)
+    conn.execute(f"PRAGMA user_version = {MIGRATIONS[2][0]}")
+    conn.executemany(
+        """
+        INSERT INTO product_transactions (trans_date, crop_code, crop_name, tc_type, market_code, market_name,
+            upper_price, middle_price, lower_price, avg_price, trans_quantity)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [transaction_row("114.04.16", "甘藍-初秋", 100), transaction_row("114.04.16", "甘藍-初秋", 150)],
+    )
+    conn.close()
+
+    migrate(path)
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute("SELECT trans_quantity FROM product_transactions").fetchall()
+        summary = conn.execute("SELECT trans_quantity FROM crop_daily_rankings").fetchall()
+    assert rows == [(150,)]
+    assert summary == [(150,)]
+
+
+def test_queries_use_indexes(raw_conn):
+    assert find_table_scans(raw_conn) == []
+
+
+def test_table_scan_is_reported(raw_conn):
+    checks = query_checks() + [{
+        "name": "by_market_name",
+        "sql": "SELECT * FROM product_transactions WHERE market_name = ?",
+        "params": ["台北一"],
+    }]
+    assert [name for name, _ in find_table_scans(raw_conn, checks)] == ["by_market_name"]
+
+
+def test_frozen_rankings_backfill_matches_daily_refresh(raw_conn):
+    from crop_rankings import refresh_daily_rankings
+
+    rows = [transaction_row(date, crop, quantity, market_code=market)
+            for date in ("114.04.15", "114.04.16")
+            for crop, quantity, market in (("甘藍-初秋", 500, "104"), ("甘藍-初秋", 300, "109"),
+                                           ("苦瓜", 120, "104"), ("菠菜", 80, "104"), ("芹菜", 60, "109"))]
+    raw_conn.executemany(
+        """
+        INSERT INTO product_transactions (trans_date, crop_code, crop_name, tc_type, market_code, market_name,
+            upper_price, middle_price, lower_price, avg_price, trans_quantity)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+    for trans_date in ("114.04.15", "114.04.16"):
+        refresh_daily_rankings(raw_conn, trans_date)
+    expected = raw_conn.execute("SELECT * FROM crop_daily_rankings ORDER BY 1, 2").fetchall()
+
+    # migration 3 寫死的 SQL 與 crop_rankings 目前的逐日刷新結果相同
+    MIGRATIONS[2][2](raw_conn)
+    assert raw_conn.execute("SELECT * FROM crop_daily_rankings ORDER BY 1, 2").fetchall() == expected
+    assert len(expected) == 8
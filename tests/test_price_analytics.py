@@ -0,0 +1,53 @@
+from conftest import transaction_row
+from db import ConnectionPool, read_data_versions
+from ingest import store_rows
+from price_analytics import PriceHistory
+
+
+def load(history, pool):
+    with pool.read() as conn:
+        history.ensure_loaded(conn, read_data_versions(conn).get("transactions", 0))
+
+
+def test_reloads_after_write_from_another_process(pool):
+    store_rows(pool, [transaction_row("114.04.15", "甘藍-初秋", 100, price=20)])
+    history = PriceHistory()
+    load(history, pool)
+    assert len(history.dates) == 1
+
+    # 沒有呼叫 invalidate：只靠資料版本得知有新資料
+    store_rows(pool, [transaction_row("114.04.16", "甘藍-初秋", 100, price=24)])
+    load(history, pool)
+    assert len(history.dates) == 2
+    assert history.crop_prices[0].tolist() == [20.0, 24.0]
+
+
+def test_invalidated_dates_reload_incrementally(pool):
+    store_rows(pool, [transaction_row("114.04.15", "甘藍-初秋", 100, price=20)])
+    history = PriceHistory()
+    load(history, pool)
+
+    store_rows(pool, [transaction_row("114.04.15", "甘藍-初秋", 100, price=22)])
+    history.invalidate(["114.04.15"])
+    load(history, pool)
+    assert history.crop_prices[0].tolist() == [22.0]
+
+
+def test_invalidated_dates_do_not_hide_other_process_writes(database, pool):
+    store_rows(pool, [transaction_row("114.04.15", "甘藍-初秋", 100, price=20)])
+    history = PriceHistory()
+    load(history, pool)
+
+    # 同程序匯入 04.16 並標記，同時另一個程序匯入 04.17
+    store_rows(pool, [transaction_row("114.04.16", "甘藍-初秋", 100, price=24)])
+    history.invalidate(["114.04.16"])
+    other = ConnectionPool(database)
+    other.init()
+    try:
+        store_rows(other, [transaction_row("114.04.17", "甘藍-初秋", 100, price=26)])
+    finally:
+        other.close()
+
+    load(history, pool)
+    assert len(history.dates) == 3
+    assert history.crop_prices[0].tolist() == [20.0, 24.0, 26.0]
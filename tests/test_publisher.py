@@ -0,0 +1,81 @@
+import os
+import subprocess
+
+import pytest
+
+from publisher import IMAGE_DIR, MARKDOWN_DIR, Publisher
+
+git_module = pytest.importorskip("git")
+
+
+@pytest.fixture
+def site(tmp_path):
+    """
+    本機 bare repo 當遠端，回傳 (工作目錄, 遠端路徑)
+    """
+    remote_path = str(tmp_path / "remote.git")
+    work_path = str(tmp_path / "site")
+    subprocess.run(["git", "init", "--bare", "-q", "-b", "master", remote_path], check=True)
+    repo = git_module.Repo.clone_from(remote_path, work_path)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "publisher")
+        config.set_value("user", "email", "publisher@localhost")
+    os.makedirs(os.path.join(work_path, MARKDOWN_DIR))
+    os.makedirs(os.path.join(work_path, IMAGE_DIR))
+    return work_path, remote_path
+
+
+def write_recipe(work_path, name):
+    filename = f"2025-04-16-120000_{name}.md"
+    with open(os.path.join(work_path, MARKDOWN_DIR, filename), "w", encoding="utf-8") as f:
+        f.write(f"# {name}\n")
+    with open(os.path.join(work_path, IMAGE_DIR, f"{name}.jpg"), "wb") as f:
+        f.write(b"image")
+    return filename
+
+
+def remote_commits(remote_path):
+    try:
+        return [commit.hexsha for commit in git_module.Repo(remote_path).iter_commits("master")]
+    except (ValueError, git_module.GitCommandError):
+        return []
+
+
+def test_batches_jobs_into_one_commit(site):
+    work_path, remote_path = site
+    publisher = Publisher(work_path, debounce=0.2)
+    # 不相關的未追蹤檔案不應被加入
+    with open(os.path.join(work_path, "scratch.txt"), "w") as f:
+        f.write("scratch")
+    job_ids = [publisher.submit([write_recipe(work_path, name)]) for name in ("番茄炒蛋", "麻婆豆腐")]
+    jobs = [publisher.wait(job_id, timeout=30) for job_id in job_ids]
+
+    commits = remote_commits(remote_path)
+    assert len(commits) == 1
+    assert all(job["status"] == "done" and job["commit"] == commits[0] for job in jobs)
+    files = git_module.Repo(remote_path).commit(commits[0]).stats.files
+    assert "scratch.txt" not in files and len(files) == 4
+
+    again = publisher.wait(publisher.submit(jobs[0]["files"]), timeout=30)
+    assert again["status"] == "nothing"
+
+
+def test_failed_push_is_retried_on_next_publish(site):
+    work_path, remote_path = site
+    publisher = Publisher(work_path, debounce=0)
+    filename = write_recipe(work_path, "三杯雞")
+
+    # 遠端暫時無法連線：commit 留在本機，任務回報 failed
+    moved = f"{remote_path}.offline"
+    os.rename(remote_path, moved)
+    failed = publisher.wait(publisher.submit([filename]), timeout=30)
+    assert failed["status"] == "failed" and failed["error"]
+    os.rename(moved, remote_path)
+    assert remote_commits(remote_path) == []
+
+    # 沒有新的變更，仍要把領先遠端的 commit 推上去
+    retried = publisher.wait(publisher.submit([filename]), timeout=30)
+    assert retried["status"] == "done"
+    assert remote_commits(remote_path) == [retried["commit"]]
+
+    assert publisher.publish(retried["paths"], [filename]) is None
@@ -0,0 +1,66 @@
+import datetime
+import os
+
+import pytest
+
+from recipe_dedup import DUPLICATE_WINDOW_DAYS, RecipeFingerprints, ingredient_names
+from recipe_store import new_record, render_recipe
+
+NOW = datetime.datetime(2025, 4, 16, 12, 0, 0)
+PUBLISHED = "2025-04-10-120000_番茄炒蛋.md"
+
+
+@pytest.fixture
+def fingerprints(tmp_path):
+    index = RecipeFingerprints(str(tmp_path))
+    index.remember(PUBLISHED, "番茄炒蛋", ["番茄", "雞蛋", "青蔥", "鹽"])
+    return index
+
+
+def test_same_title_and_ingredients_is_duplicate(fingerprints):
+    result = fingerprints.check("番茄炒蛋", ["番茄", "雞蛋", "青蔥"], refresh=False, now=NOW)
+    assert result["decision"] == "duplicate" and result["match"] == PUBLISHED
+
+
+def test_title_is_normalized(fingerprints):
+    result = fingerprints.check("番茄 炒蛋！", ["番茄", "雞蛋", "青蔥"], refresh=False, now=NOW)
+    assert result["decision"] == "duplicate"
+
+
+def test_same_title_with_other_ingredients_is_not_duplicate(fingerprints):
+    result = fingerprints.check("番茄炒蛋", ["豆腐", "豬肉", "辣椒"], refresh=False, now=NOW)
+    assert result["decision"] == "new"
+
+
+def test_bare_string_ingredients_are_fingerprinted(fingerprints):
+    items = ["番茄", {"name": "雞蛋", "amount": "3", "unit": "顆"}, {"amount": "1"}, None, "青蔥"]
+    assert ingredient_names(items) == ["番茄", "雞蛋", "青蔥"]
+    result = fingerprints.check("番茄炒蛋", ingredient_names(items), refresh=False, now=NOW)
+    assert result["decision"] == "duplicate"
+
+
+def test_recipes_outside_window_are_ignored(fingerprints):
+    later = NOW + datetime.timedelta(days=DUPLICATE_WINDOW_DAYS)
+    result = fingerprints.check("番茄炒蛋", ["番茄", "雞蛋", "青蔥"], refresh=False, now=later)
+    assert result["decision"] == "new"
+
+
+def test_unrelated_recipe_is_new(fingerprints):
+    result = fingerprints.check("麻婆豆腐", ["豆腐", "豬肉"], refresh=False, now=NOW)
+    assert result == {"decision": "new", "match": None, "similarity": 0.0, "image": None}
+
+
+def test_scans_published_markdown(tmp_path):
+    record = new_record("絲瓜炒蛋", {
+        "calories": "每人約 150 卡", "price": "約 40 元",
+        "ingredients": [{"name": "絲瓜", "amount": "2", "unit": "根"}, {"name": "雞蛋", "amount": "4", "unit": "個"}],
+        "steps": ["絲瓜切塊。", "炒蛋後加入絲瓜。"],
+    }, {"url": "/images/recipes/絲瓜炒蛋.jpg"})
+    filename = "2025-04-15-090000_絲瓜炒蛋.md"
+    with open(os.path.join(tmp_path, filename), "w", encoding="utf-8") as f:
+        f.write(render_recipe(record))
+
+    result = RecipeFingerprints(str(tmp_path)).check("絲瓜炒蛋", ["絲瓜", "雞蛋"], now=NOW)
+    assert result["decision"] == "duplicate"
+    assert result["match"] == filename
+    assert result["image"] == {"url": "/images/recipes/絲瓜炒蛋.jpg"}
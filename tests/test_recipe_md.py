@@ -0,0 +1,107 @@
+import copy
+import os
+import time
+
+import pytest
+
+import recipe_md
+from recipe_dedup import RecipeFingerprints
+from recipe_index import RecipeCatalog
+
+
+@pytest.fixture
+def recipe_dir(tmp_path, monkeypatch):
+    """
+    Markdown 與圖片寫到暫存目錄，不呼叫 ComfyUI、不寫資料庫
+    """
+    recipe_dir = str(tmp_path / "recipes") + os.sep
+    image_dir = str(tmp_path / "images") + os.sep
+    os.makedirs(recipe_dir)
+    os.makedirs(image_dir)
+    monkeypatch.setattr(recipe_md, "RECIPE_DIR", recipe_dir)
+    monkeypatch.setattr(recipe_md, "IMAGE_DIR", image_dir)
+    monkeypatch.setattr(recipe_md, "recipe_catalog", RecipeCatalog(recipe_dir))
+    monkeypatch.setattr(recipe_md, "recipe_fingerprints", RecipeFingerprints(recipe_dir))
+    monkeypatch.setattr(recipe_md, "recipe_store", None)
+    return recipe_dir
+
+
+def _render(prompt, api_url, recipe_name, workflow_path):
+    return {"url": f"https://example.com/{recipe_name}.jpg", "srcset": "", "webp_srcset": "", "placeholder": ""}
+
+
+def test_malformed_recipe_fails_alone(recipe_dir, monkeypatch):
+    monkeypatch.setattr(recipe_md, "generate_recipe_image", _render)
+    recipes = copy.deepcopy(recipe_md.SAMPLE_RECIPES[:2])
+    broken = copy.deepcopy(recipes[0])
+    broken["name"] = "壞掉的食譜"
+    broken["ingredients"] = [{"amount": "1", "unit": "把"}]
+    results = recipe_md.recipes_to_md([recipes[0], broken, recipes[1]])
+
+    assert [result["status"] for result in results] == ["ok", "failed", "ok"]
+    assert len(os.listdir(recipe_dir)) == 2
+
+
+def test_bare_string_ingredients_reach_duplicate_check(recipe_dir, monkeypatch):
+    monkeypatch.setattr(recipe_md, "generate_recipe_image", _render)
+    recipe = copy.deepcopy(recipe_md.SAMPLE_RECIPES[0])
+    recipe["ingredients"] = [item["name"] for item in recipe["ingredients"]]
+    result = recipe_md.recipes_to_md([recipe])[0]
+
+    # 去重判定照常產生；缺 amount / unit 的食材在寫出 Markdown 時才失敗
+    assert result["duplicate"]["decision"] == "new"
+    assert result["status"] == "failed"
+
+
+def test_same_title_in_batch_gets_distinct_files(recipe_dir, monkeypatch):
+    monkeypatch.setattr(recipe_md, "generate_recipe_image", _render)
+    recipes = copy.deepcopy([recipe_md.SAMPLE_RECIPES[0]] * 3)
+    results = recipe_md.recipes_to_md(recipes)
+
+    files = [result["file"] for result in results]
+    assert [result["status"] for result in results] == ["ok"] * 3
+    assert len(set(files)) == 3
+    assert sorted(os.listdir(recipe_dir)) == sorted(files)
+
+
+def test_failed_render_survives_missing_markdown(recipe_dir, monkeypatch):
+    def fail(prompt, api_url, recipe_name, workflow_path):
+        # 生圖失敗前 Markdown 已被其他流程刪除
+        for name in os.listdir(recipe_dir):
+            if recipe_name in name:
+                os.remove(os.path.join(recipe_dir, name))
+        raise RuntimeError("ComfyUI 無回應")
+
+    monkeypatch.setattr(recipe_md, "generate_recipe_image", fail)
+    results = recipe_md.recipes_to_md(copy.deepcopy(recipe_md.SAMPLE_RECIPES[:2]))
+
+    assert [result["status"] for result in results] == ["failed", "failed"]
+    assert all(result["error"] == "ComfyUI 無回應" for result in results)
+    assert os.listdir(recipe_dir) == []
+
+
+def test_raw_image_paths_are_unique(recipe_dir):
+    paths = {recipe_md.raw_image_path("番茄炒蛋") for _ in range(3)}
+    assert len(paths) == 3
+    assert all(os.path.dirname(path) == os.path.dirname(recipe_md.IMAGE_DIR) for path in paths)
+
+
+def test_failed_image_removes_raw_file(recipe_dir, monkeypatch):
+    def unreachable(prompt, api_url, workflow_path):
+        raise ConnectionError("ComfyUI 無回應")
+
+    monkeypatch.setattr(recipe_md, "image_cache_key", lambda prompt, workflow_path: "key")
+    monkeypatch.setattr(recipe_md, "fetch_cached_image", lambda key, raw_path: False)
+    monkeypatch.setattr(recipe_md, "submit_prompt", unreachable)
+    with pytest.raises(ConnectionError):
+        recipe_md.generate_recipe_image("prompt", "http://localhost:8188/prompt", "番茄炒蛋")
+    assert os.listdir(recipe_md.IMAGE_DIR) == []
+
+
+def test_single_writes_refresh_search_index_once(monkeypatch):
+    calls = []
+    monkeypatch.setattr(recipe_md, "refresh_search_index", lambda: calls.append(time.monotonic()))
+    for _ in range(3):
+        recipe_md.schedule_search_index_refresh(delay=0.05)
+    time.sleep(0.3)
+    assert len(calls) == 1
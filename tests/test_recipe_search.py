@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from recipe_search import build_static_index, search_query
+from recipe_store import RecipeStore, new_record
+
+
+def _recipe(name, ingredients, steps):
+    return {
+        "name": name,
+        "ingredients": [{"name": item, "amount": "1", "unit": "份"} for item in ingredients],
+        "steps": steps,
+        "calories": "每人約 200 卡",
+        "price": "零售價估算（單位：台幣）：80",
+        "image_prompt": name,
+    }
+
+
+@pytest.fixture
+def store(pool):
+    store = RecipeStore(pool)
+    recipes = [
+        ("2025-04-15-120000_絲瓜炒蛋.md", "2025-04-15", _recipe("絲瓜炒蛋", ["絲瓜", "雞蛋"], ["絲瓜去皮切塊，與蛋同炒。"])),
+        ("2025-04-16-120000_番茄炒蛋.md", "2025-04-16", _recipe("番茄炒蛋", ["番茄", "雞蛋"], ["番茄切塊，與蛋同炒。"])),
+        ("2025-04-17-120000_涼拌小黃瓜.md", "2025-04-17", _recipe("涼拌小黃瓜", ["小黃瓜", "蒜末"], ["小黃瓜拍碎後拌勻。"])),
+    ]
+    for filename, date, recipe in recipes:
+        store.save(filename, new_record(recipe["name"], recipe, None, date))
+    return store
+
+
+def _titles(results):
+    return [result["title"] for result in results]
+
+
+def test_long_terms_use_match():
+    sql, params = search_query(["番茄炒蛋", "小黃瓜"])
+    assert "MATCH ?" in sql and "LIKE" not in sql
+    assert params[0] == '"番茄炒蛋" AND "小黃瓜"'
+
+
+def test_short_terms_use_like_only_for_themselves():
+    sql, params = search_query(["番茄炒蛋", "蛋"])
+    assert "recipe_search MATCH ?" in sql and "LIKE" in sql
+    assert params[0] == '"番茄炒蛋"'
+    assert "%蛋%" in params
+
+
+def test_search_long_term(store):
+    assert _titles(store.search(["小黃瓜"])) == ["涼拌小黃瓜"]
+
+
+def test_search_short_term_falls_back_to_like(store):
+    # 兩字詞 trigram 查不到，以 LIKE 比對，依日期由新到舊
+    assert _titles(store.search(["絲瓜"])) == ["絲瓜炒蛋"]
+    assert _titles(store.search(["炒蛋"])) == ["番茄炒蛋", "絲瓜炒蛋"]
+
+
+def test_search_mixed_terms(store):
+    assert _titles(store.search(["雞蛋", "番茄炒蛋"])) == ["番茄炒蛋"]
+    assert _titles(store.search(["蒜末", "番茄炒蛋"], mode="any")) == ["涼拌小黃瓜", "番茄炒蛋"]
+    assert _titles(store.search(["絲瓜", "小黃瓜"], mode="any", field="ingredients")) == ["涼拌小黃瓜", "絲瓜炒蛋"]
+
+
+def test_search_validates_arguments(store):
+    with pytest.raises(ValueError):
+        store.search(["番茄"], mode="some")
+    with pytest.raises(ValueError):
+        store.search(["番茄"], field="price")
+
+
+def test_static_index_keeps_ingredient_names_whole(pool, store, tmp_path):
+    store.save("2025-04-18-120000_焗烤馬鈴薯.md", new_record(
+        "焗烤馬鈴薯", _recipe("焗烤馬鈴薯", ["馬鈴薯", "mozzarella cheese"], ["烤至金黃。"]), None, "2025-04-18"))
+    with pool.read() as conn:
+        stats = build_static_index(conn, str(tmp_path), shards=4)
+
+    assert stats["docs"] == 4
+    docs = json.loads((tmp_path / "docs.json").read_text(encoding="utf-8"))
+    # 食材以陣列輸出，含空白的名稱不會被拆開
+    assert docs[-1][1] == "焗烤馬鈴薯"
+    assert docs[-1][4] == ["馬鈴薯", "mozzarella cheese"]
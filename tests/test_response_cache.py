@@ -0,0 +1,59 @@
+import app
+from conftest import transaction_row
+from db import ConnectionPool, bump_data_version
+from ingest import store_rows
+
+
+def cache_counts():
+    stats = app.response_cache.stats()
+    return stats["hits"], stats["misses"]
+
+
+def test_conditional_get_returns_304(client):
+    first = client.get("/fetch_combined_data")
+    assert first.status_code == 200
+    etag = first.headers["ETag"].strip('"')
+
+    second = client.get("/fetch_combined_data", headers={"If-None-Match": f'"{etag}"'})
+    assert second.status_code == 304
+    assert second.headers["ETag"].strip('"') == etag
+
+
+def test_write_from_another_process_changes_etag(client, database):
+    first = client.get("/fetch_combined_data")
+    etag = first.headers["ETag"]
+    assert first.get_json()["new_crops"] == []
+
+    # 模擬 ingest.py / crawl_vegetable_prices.py：另一個連線池寫入同一個資料庫，app 的快取沒有收到 invalidate
+    other = ConnectionPool(database)
+    try:
+        store_rows(other, [transaction_row("114.04.16", "茄子-胭脂茄", 100)])
+    finally:
+        other.close()
+
+    second = client.get("/fetch_combined_data", headers={"If-None-Match": etag})
+    assert second.status_code == 200
+    assert second.headers["ETag"] != etag
+    assert second.get_json()["new_crops"] == ["茄子-胭脂茄"]
+
+
+def test_unrelated_write_keeps_entry(client, database):
+    client.get("/fetch_combined_data")
+    hits, misses = cache_counts()
+    # /fetch_combined_data 只屬於 seasonal、transactions，食譜資料版本改變不影響
+    other = ConnectionPool(database)
+    try:
+        with other.transaction() as conn:
+            bump_data_version(conn, "recipes")
+    finally:
+        other.close()
+    client.get("/fetch_combined_data")
+    assert cache_counts() == (hits + 1, misses)
+
+
+def test_in_process_invalidate(client):
+    client.get("/fetch_combined_data")
+    hits, misses = cache_counts()
+    app.response_cache.invalidate("transactions")
+    client.get("/fetch_combined_data")
+    assert cache_counts() == (hits, misses + 1)
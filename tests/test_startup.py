@@ -0,0 +1,13 @@
+from startup_check import DEFERRED_MODULES, check, import_profile
+
+
+def test_deferred_packages_are_not_imported_eagerly(tmp_path):
+    for module, deferred in DEFERRED_MODULES.items():
+        _, loaded = import_profile(module, str(tmp_path))
+        assert not loaded & set(deferred), module
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_cold_start_check_passes():
+    # 匯入時間上限、延後載入與不建立檔案，與 python startup_check.py 相同的檢查
+    assert check() == []
@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+from functools import lru_cache
+
+# 簡轉繁設定；轉換器建立時會載入整份字典，整個程序只建立一次
+OPENCC_CONFIG = "s2t.json"
+# 長度不超過此值的字串（食材名稱、單位、份量）重複率高，轉換結果會被記住
+SHORT_TEXT_LIMIT = 16
+
+_converter = None
+_converter_lock = threading.Lock()
+
+
+def get_converter():
+    global _converter
+    if _converter is None:
+        with _converter_lock:
+            if _converter is None:
+                import opencc
+                _converter = opencc.OpenCC(OPENCC_CONFIG)
+    return _converter
+
+
+@lru_cache(maxsize=4096)
+def _convert_short(text):
+    return get_converter().convert(text)
+
+
+def convert_text(text):
+    if not text:
+        return text
+    if len(text) <= SHORT_TEXT_LIMIT:
+        return _convert_short(text)
+    return get_converter().convert(text)
+
+
+def convert_tree(value):
+    """
+    走訪 dict / list，只轉換字串葉節點；鍵名與數字等其他型別保持不變
+    """
+    if isinstance(value, str):
+        return convert_text(value)
+    if isinstance(value, dict):
+        return {key: convert_tree(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [convert_tree(item) for item in value]
+    return value
+
+
+def _legacy_convert(recipe):
+    # 舊做法：每道食譜建立新的轉換器，標題單獨轉換，整份食譜序列化成 JSON 後轉換再解析回來
+    import opencc
+    converter = opencc.OpenCC(OPENCC_CONFIG)
+    title = converter.convert(recipe["name"])
+    converted = json.loads(converter.convert(json.dumps(recipe, ensure_ascii=False)))
+    return title, converted
+
+
+def _shared_convert(recipe):
+    return convert_text(recipe["name"]), convert_tree(recipe)
+
+
+def benchmark(recipes, rounds=50):
+    """
+    比較舊做法與共用轉換器的每道食譜平均耗時（毫秒）
+    """
+    results = {}
+    for label, convert in (("legacy", _legacy_convert), ("shared", _shared_convert)):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for recipe in recipes:
+                convert(recipe)
+        elapsed = time.perf_counter() - started
+        results[label] = round(elapsed * 1000 / (rounds * len(recipes)), 3)
+    return results
+
+
+# 微基準測試：python text_convert.py
+if __name__ == "__main__":
+    from recipe_md import SAMPLE_RECIPES
+
+    for recipe in SAMPLE_RECIPES:
+        assert _legacy_convert(recipe) == _shared_convert(recipe), recipe["name"]
+    timings = benchmark(SAMPLE_RECIPES)
+    print(f"舊做法：每道食譜 {timings['legacy']} ms")
+    print(f"共用轉換器：每道食譜 {timings['shared']} ms")
+    print(f"加速 {timings['legacy'] / timings['shared']:.1f} 倍")
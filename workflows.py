@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import threading
+
+from image_cache import workflow_seed
+
+# 專案內建的 ComfyUI workflow（Save as API Format 匯出）
+DEFAULT_WORKFLOWS = ["flux_api.json", "flux_512_api.json", "lora_api.json"]
+
+OUTPUT_CLASS_TYPES = ("SaveImage",)
+PROMPT_CLASS_TYPE = "CLIPTextEncode"
+# 從取樣器往回找正向 prompt 時會經過的輸入欄位
+_CONDITIONING_INPUTS = ("positive", "conditioning")
+
+
+def _link_target(value):
+    # API 格式的節點連線寫成 ["節點 ID", 輸出序號]
+    if isinstance(value, list) and len(value) == 2 and isinstance(value[0], str):
+        return value[0]
+    return None
+
+
+def find_output_node(workflow):
+    for node_id, node in workflow.items():
+        if node["class_type"] in OUTPUT_CLASS_TYPES:
+            return node_id
+    raise ValueError("workflow 中找不到 SaveImage 輸出節點")
+
+
+def find_prompt_node(workflow):
+    """
+    從取樣器或 guider 的 positive / conditioning 輸入沿連線往回找，第一個 CLIPTextEncode 即正向 prompt；
+    找不到連線時，若整個 workflow 只有一個 CLIPTextEncode 就使用它
+    """
+    for node in workflow.values():
+        inputs = node["inputs"]
+        start = inputs.get("positive")
+        if start is None and node["class_type"].endswith("Guider"):
+            start = inputs.get("conditioning")
+        node_id = _link_target(start)
+        seen = set()
+        while node_id is not None and node_id not in seen:
+            seen.add(node_id)
+            current = workflow[node_id]
+            if current["class_type"] == PROMPT_CLASS_TYPE:
+                return node_id
+            node_id = next(
+                (_link_target(current["inputs"][name]) for name in _CONDITIONING_INPUTS
+                 if name in current["inputs"]),
+                None,
+            )
+
+    candidates = [node_id for node_id, node in workflow.items() if node["class_type"] == PROMPT_CLASS_TYPE]
+    if len(candidates) == 1:
+        return candidates[0]
+    raise ValueError("workflow 中找不到正向 prompt 的 CLIPTextEncode 節點")
+
+
+def validate_workflow(workflow):
+    if not isinstance(workflow, dict) or not workflow:
+        raise ValueError("workflow 必須是非空的 JSON 物件")
+    for node_id, node in workflow.items():
+        if not isinstance(node, dict) or "class_type" not in node or not isinstance(node.get("inputs"), dict):
+            raise ValueError(f"節點 {node_id} 缺少 class_type 或 inputs")
+        for name, value in node["inputs"].items():
+            target = _link_target(value)
+            if target is not None and target not in workflow:
+                raise ValueError(f"節點 {node_id} 的輸入 {name} 連到不存在的節點 {target}")
+
+
+class WorkflowTemplate:
+    def __init__(self, path, mtime, raw_bytes):
+        self.path = path
+        self.mtime = mtime
+        self.raw_bytes = raw_bytes
+        self.digest = hashlib.sha256(raw_bytes).hexdigest()
+        self.workflow = json.loads(raw_bytes)
+        validate_workflow(self.workflow)
+        self.prompt_node_id = find_prompt_node(self.workflow)
+        self.output_node_id = find_output_node(self.workflow)
+        self.seed = workflow_seed(self.workflow)
+
+    def build(self, prompt):
+        """
+        產生填好 prompt 的 workflow：只複製被修改的 prompt 節點，其餘節點與範本共用（送出前只會被序列化）
+        """
+        workflow = dict(self.workflow)
+        node = dict(workflow[self.prompt_node_id])
+        node["inputs"] = {**node["inputs"], "text": prompt}
+        workflow[self.prompt_node_id] = node
+        return workflow
+
+
+class WorkflowRegistry:
+    """
+    啟動時預先載入並驗證 workflow；之後每次取用只比對檔案 mtime，有變更才重新讀檔
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def preload(self, paths=DEFAULT_WORKFLOWS):
+        for path in paths:
+            self.get(path)
+
+    def get(self, path):
+        mtime = os.stat(path).st_mtime_ns
+        template = self._templates.get(path)
+        if template is not None and template.mtime == mtime:
+            return template
+        with self._lock:
+            template = self._templates.get(path)
+            if template is None or template.mtime != mtime:
+                with open(path, "rb") as f:
+                    template = WorkflowTemplate(path, mtime, f.read())
+                self._templates[path] = template
+            return template
+
+    def loaded(self):
+        return {
+            path: {
+                "prompt_node": template.prompt_node_id,
+                "output_node": template.output_node_id,
+                "seed": template.seed,
+                "digest": template.digest,
+            }
+            for path, template in self._templates.items()
+        }